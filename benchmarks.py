@@ -0,0 +1,1286 @@
+'''
+Benchmarks for the engine. Run as a script to print the results:
+    python benchmarks.py linalg                 Determinant/inverse against the old cofactor expansion
+    python benchmarks.py vec3                   Vec3 against the general Vector
+    python benchmarks.py matmul                 3x3/4x4 Matrix multiplies against the old Vector based ones
+    python benchmarks.py scenes [options]       Headless frames/sec of whole scenes (see --help), can be saved as a
+                                                  baseline and compared against later
+    python benchmarks.py bvh                    BVH visibility queries against testing every object, up to 100k objects
+    python benchmarks.py sort                   Frame to frame coherent depth sorting against a full sort, 10k-1M faces
+    python benchmarks.py bsp                    Static scenes drawn through a BSP tree against sorting every frame
+    python benchmarks.py raster                 The NumPy depth buffered Rasterizer against one pygame call per face
+    python benchmarks.py parallel               Frames drawn by a ScenePool of worker processes against one process
+    python benchmarks.py loaders                OBJ/STL loading (parsing and the memory mapped cache) against Triangle objects
+    python benchmarks.py instances              A forest of cubes as one InstancedMesh against one Cube Model each
+    python benchmarks.py freeze                 Scenes that don't move with their Models frozen against drawn as they are
+    python benchmarks.py shading                Shading faces all at once through a Lighting against one at a time
+    python benchmarks.py dirty                  Change tracking (skipped frames, dirty rects) against drawing every frame
+    python benchmarks.py loop                   Simulation and drawing rates of a FixedStepLoop against one tick per frame
+    python benchmarks.py commands               Frames built into a DrawBuffer against draw lists: memory allocated and time
+    python benchmarks.py edges                  Mesh outlines drawn edge by edge once (batch_edges) against face by face
+    python benchmarks.py occlusion              Scenes behind a big wall with occlusion culling against without
+    python benchmarks.py verify                 Checks (asserts) that the fast paths give the same results as the plain ones
+'''
+from linear_algebra import Vector, Vec3, Matrix
+from rotation import Rotation
+from camera import Camera
+from renderer import Renderer
+from profiler import Profiler
+from raster import Rasterizer
+from lighting import Lighting
+from bvh import BVH
+from draw_order import DrawOrder
+from models import Model, Cube
+from frame_loop import FixedStepLoop, Interpolation
+import shapes
+import loaders
+import argparse
+import csv
+import io
+import json
+import numpy as np
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+
+
+def _cofactor_determinant(m: Matrix) -> float:
+    '''
+    The old recursive cofactor expansion determinant, kept around to compare against.
+    '''
+    if m.rows() == 1:
+        return m[0,0]
+    return sum(m[x,0]*_cofactor_determinant(m.exclude(x,0))*(1 if x%2==0 else -1) for x in range(m.columns()))
+
+def _cofactor_inverse(m: Matrix) -> Matrix:
+    '''
+    The old 1/determinant * transposed cofactor matrix inverse, kept around to compare against.
+    '''
+    det = _cofactor_determinant(m)
+    assert det != 0
+    cofactors = Matrix([_cofactor_determinant(m.exclude(x,y))*(1 if (x+y)%2 == 0 else -1) for x in range(m.columns())] for y in range(m.rows()))
+    return 1/det * cofactors.transpose()
+
+def _matrix_cross(a: Vector, b: Vector) -> Vector:
+    '''
+    The old cofactor based cross product, kept around to compare against.
+    '''
+    m = Matrix([a, b])
+    return Vector(*(m.cofactor(x, -2) for x in range(3)))
+
+def _vector_matmul(a: Matrix, b: Matrix) -> Matrix:
+    '''
+    The old matrix multiply (a row Vector times a column Vector for every value), kept around to compare against.
+    '''
+    return Matrix([a.row_vector(row)*b.column_vector(col) for col in range(b.columns())] for row in range(a.rows()))
+
+def _time(function, min_time: float = .2) -> float:
+    '''
+    Returns the average seconds per call of function, running it for at least min_time seconds.
+    '''
+    timer = timeit.Timer(function)
+    number, total = timer.autorange()
+    while total < min_time:
+        number *= 2
+        total = timer.timeit(number)
+    return total/number
+
+
+def bench_determinant_inverse(sizes = range(3, 9)):
+    '''
+    Compares the LU/closed form determinant and inverse against the old cofactor expansion.
+    '''
+    print(f'{"n":>3} {"det cofactor":>14} {"det LU":>12} {"speedup":>9} {"inv cofactor":>14} {"inv LU":>12} {"speedup":>9}')
+    for n in sizes:
+        m = Matrix([[random.uniform(-10, 10) for x in range(n)] for y in range(n)])
+        min_time = .2 if n < 8 else 1
+        det_old = _time(lambda: _cofactor_determinant(m), min_time)
+        det_new = _time(lambda: m.determinant())
+        inv_old = _time(lambda: _cofactor_inverse(m), min_time)
+        inv_new = _time(lambda: m.inverse())
+        print(f'{n:>3} {det_old*1e6:>12.1f}us {det_new*1e6:>10.1f}us {det_old/det_new:>8.1f}x'
+              f' {inv_old*1e6:>12.1f}us {inv_new*1e6:>10.1f}us {inv_old/inv_new:>8.1f}x')
+
+
+def bench_vec3():
+    '''
+    Compares ops/sec of Vec3 against a general 3D Vector.
+    '''
+    r = Rotation(.3, -1.2, .5)
+    r.matrix()
+    print(f'{"op":>10} {"Vector ops/s":>14} {"Vec3 ops/s":>14} {"speedup":>9}')
+    for name, op, vec3_op in (('add', lambda a, b: a+b, None), ('sub', lambda a, b: a-b, None),
+                              ('dot', lambda a, b: a*b, None), ('scale', lambda a, b: a*2.5, None),
+                              ('cross', _matrix_cross, lambda a, b: a.cross(b)), ('rotate', lambda a, b: r*a, None)):
+        a, b = Vector(1.5, -2.0, 3.25), Vector(-.5, 4.0, 1.0)
+        old = _time(lambda: op(a, b))
+        a, b = Vec3(1.5, -2.0, 3.25), Vec3(-.5, 4.0, 1.0)
+        vec3_op = vec3_op or op
+        new = _time(lambda: vec3_op(a, b))
+        print(f'{name:>10} {1/old:>14,.0f} {1/new:>14,.0f} {old/new:>8.1f}x')
+
+def bench_matmul(points: int = 10000):
+    '''
+    Compares 3x3 and 4x4 matrix multiplies (plain, in place and a node's world matrix) against the old Vector based
+      multiply, and transforming points one at a time against all at once with transform_points.
+    '''
+    r = Rotation(.3, -1.2, .5)
+    a3, b3 = r.matrix(), Rotation(-.7, .4, 2.1).matrix()
+    a4, b4 = Matrix.affine(a3, Vec3(1, 2, 3)), Matrix.affine(b3, Vec3(-4, 5, 6))
+    c4 = Matrix.affine(a3, Vec3(1, 2, 3)) #Multiplied into over and over
+    print(f'{"op":>14} {"old ops/s":>12} {"new ops/s":>12} {"speedup":>9}')
+    for name, old, new in (('3x3 @', lambda: _vector_matmul(a3, b3), lambda: a3@b3),
+                           ('4x4 @', lambda: _vector_matmul(a4, b4), lambda: a4@b4),
+                           ('4x4 imatmul', lambda: _vector_matmul(a4, b4), lambda: c4.imatmul(b4)),
+                           ('world matrix', lambda: _vector_matmul(Matrix.affine(r.matrix(), Vec3(1, 2, 3)), b4),
+                            lambda: Matrix.affine(r.matrix(), Vec3(1, 2, 3))@b4)):
+        old, new = _time(old), _time(new)
+        print(f'{name:>14} {1/old:>12,.0f} {1/new:>12,.0f} {old/new:>8.1f}x')
+
+    array = np.random.default_rng(0).uniform(-100, 100, (points, 3))
+    vectors = [Vec3(*p) for p in array.tolist()]
+    old = _time(lambda: [a4.transform_point(v) for v in vectors])
+    new = _time(lambda: a4.transform_points(array))
+    print(f'{str(points) + " points":>14} {points/old:>12,.0f} {points/new:>12,.0f} {old/new:>8.1f}x   (points/s, transform_point against transform_points)')
+
+
+#Scenes, each returns (camera, top level objects, function to animate a frame)
+def cube_scene(n: int) -> (Camera, list, 'animate(frame)'):
+    '''
+    n spinning cubes in a grid in front of the camera.
+    '''
+    side = math.ceil(math.sqrt(n))
+    cubes = [Cube(40, (255,50,50), location=Vector((i%side - side/2)*60, (i//side - side/2)*60, 300 + side*60),
+                  rotation=Rotation(.3, i*.1, 0)) for i in range(n)]
+    def animate(frame):
+        for c in cubes:
+            c.rotate((0,.05,0))
+    return Camera(screen_size=(800,500)), cubes, animate
+
+def nested_scene(depth: int) -> (Camera, list, 'animate(frame)'):
+    '''
+    A chain of depth Models, each holding a cube and the next Model, every level rotating.
+    '''
+    root = Model(location=Vector(0,0,600))
+    levels = [root]
+    for d in range(depth-1):
+        child = Model(location=Vector(40,0,0), rotation=Rotation(0,.2,0))
+        levels[-1].add_object(child)
+        levels.append(child)
+    for level in levels:
+        level.add_object(Cube(30, (100,255,50), location=Vector(0,0,0), rotation=Rotation(0,0,0)))
+    def animate(frame):
+        for level in levels:
+            level.rotate((0,.02,0))
+    return Camera(screen_size=(800,500)), [root], animate
+
+def triangle_scene(m: int, seed: int = 0) -> (Camera, list, 'animate(frame)'):
+    '''
+    m random Triangles in one rotating Model.
+    '''
+    rng = random.Random(seed)
+    model = Model(location=Vector(0,0,800))
+    for i in range(m):
+        center = Vector(*(rng.uniform(-300, 300) for j in range(3)))
+        model.add_object(shapes.Triangle(*(center + Vector(*(rng.uniform(-20, 20) for j in range(3))) for k in range(3)),
+                                         color=(rng.randrange(256), rng.randrange(256), rng.randrange(256))))
+    def animate(frame):
+        model.rotate((0,.01,0))
+    return Camera(screen_size=(800,500)), [model], animate
+
+def bench_scene(camera: Camera, objects: list, animate, frames: int = 30, surface_size: (int, int) = None) -> dict:
+    '''
+    Runs frames headless frames (animate, then draw list, then optionally drawing onto an offscreen Surface).
+    Returns frames/sec, vertices projected/sec, faces drawn per frame and the peak memory (traced separately).
+    '''
+    renderer = Renderer(camera, objects)
+    surface = None
+    if surface_size != None:
+        import pygame
+        surface = pygame.Surface(surface_size)
+        camera.resize(surface_size)
+
+    def frame(i):
+        animate(i)
+        drawings = renderer.draw_list()
+        if surface != None: renderer.draw(surface, drawings, (100,100,100))
+        return drawings
+
+    frame(0) #Warm up caches
+    vertices = 0
+    faces = 0
+    start = time.perf_counter()
+    for i in range(frames):
+        faces += len(frame(i))
+        vertices += camera.projected_vertices
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for i in range(min(frames, 3)):
+        frame(i)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'fps': frames/elapsed, 'vertices_per_sec': vertices/elapsed, 'faces_per_frame': faces/frames, 'peak_memory_kb': peak/1024}
+
+def bench_scenes(cubes = (10, 100), depths = (2, 8), triangles = (1000,), frames: int = 30, surface: bool = False) -> dict:
+    '''
+    Runs bench_scene on every scene and prints the results. Returns {scene name: results}.
+    '''
+    scenes = [(f'cubes={n}', cube_scene, n) for n in cubes] + [(f'depth={d}', nested_scene, d) for d in depths] \
+                + [(f'triangles={m}', triangle_scene, m) for m in triangles]
+    results = {}
+    print(f'{"scene":>16} {"fps":>10} {"vertices/s":>12} {"faces/frame":>12} {"peak KB":>10}')
+    for name, make, size in scenes:
+        r = bench_scene(*make(size), frames = frames, surface_size = (800,500) if surface else None)
+        results[name] = r
+        print(f'{name:>16} {r["fps"]:>10.1f} {r["vertices_per_sec"]:>12,.0f} {r["faces_per_frame"]:>12.1f} {r["peak_memory_kb"]:>10,.0f}')
+    return results
+
+def compare_to_baseline(results: dict, baseline: dict):
+    '''
+    Prints how each scene's results changed compared to a saved baseline.
+    '''
+    print(f'{"scene":>16} {"fps":>10} {"baseline":>10} {"change":>8} {"peak KB":>10} {"baseline":>10} {"change":>8}')
+    for name, r in results.items():
+        if name not in baseline:
+            print(f'{name:>16} (not in baseline)')
+            continue
+        b = baseline[name]
+        print(f'{name:>16} {r["fps"]:>10.1f} {b["fps"]:>10.1f} {(r["fps"]/b["fps"]-1)*100:>+7.1f}%'
+              f' {r["peak_memory_kb"]:>10,.0f} {b["peak_memory_kb"]:>10,.0f} {(r["peak_memory_kb"]/b["peak_memory_kb"]-1)*100:>+7.1f}%')
+
+
+def bench_bvh(sizes = (1000, 10000, 100000), frames: int = 20, moving: float = .01):
+    '''
+    Cubes spread over a flat grid (the same density at every size) seen by a camera looking down at it, so about the
+      same number are visible no matter how many there are. Compares the per frame cost of finding the visible
+      objects with a BVH (including refitting after moving fraction moving of them) against testing every object.
+    '''
+    print(f'{"objects":>8} {"visible":>8} {"build":>9} {"linear/frame":>13} {"BVH/frame":>10} {"refit/frame":>12} {"speedup":>8}')
+    for n in sizes:
+        rng = random.Random(0)
+        side = math.ceil(math.sqrt(n))
+        cubes = [Cube(40, (255,50,50), location=Vector((i%side - side/2)*100, 0, (i//side - side/2)*100),
+                      rotation=Rotation(0,0,0)) for i in range(n)]
+        camera = Camera(location=Vector(0,1500,-1500), rotation=Rotation(-1,0,0), screen_size=(800,500))
+
+        start = time.perf_counter()
+        bvh = BVH(cubes)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for f in range(frames):
+            visible = [c for c in cubes if camera.sphere_visible(*c.world_bounds())]
+        linear = (time.perf_counter() - start)/frames
+
+        movers = rng.sample(cubes, max(1, int(n*moving)))
+        query = refit = 0
+        for f in range(frames):
+            for c in movers:
+                c.move((rng.uniform(-5, 5), 0, rng.uniform(-5, 5)))
+            start = time.perf_counter()
+            bvh.refit()
+            middle = time.perf_counter()
+            found = bvh.query(camera)
+            query += time.perf_counter() - middle
+            refit += middle - start
+        query /= frames
+        refit /= frames
+        print(f'{n:>8} {len(visible):>8} {build:>8.2f}s {linear*1000:>11.2f}ms {query*1000:>8.2f}ms {refit*1000:>10.2f}ms'
+              f' {linear/(query+refit):>7.1f}x')
+
+
+def bench_sort(sizes = (10000, 100000, 1000000), frames: int = 10):
+    '''
+    Per frame sort cost for n faces scattered in front of a camera which turns and moves a little every frame.
+    Compares sorted() on a draw list against DrawOrder.sort, and a numpy argsort against DrawOrder.order on arrays.
+    '''
+    print(f'{"faces":>8} {"sorted()":>10} {"DrawOrder.sort":>15} {"speedup":>8} {"argsort":>10} {"DrawOrder.order":>16} {"speedup":>8}')
+    for n in sizes:
+        rng = np.random.default_rng(0)
+        centers = rng.uniform((-2000, -2000, 500), (2000, 2000, 6000), (n, 3))
+        face_ids = np.arange(n)
+        camera = Camera(screen_size=(800,500))
+        list_order, array_order = DrawOrder(), DrawOrder()
+        times = [0, 0, 0, 0]
+        for f in range(frames + 1):
+            camera.rotate((0, .01, 0))
+            camera.move(Vector(3, 0, 5))
+            depths = camera.project_many(centers)[2]
+            drawings = [[d, 0, None, i] for d, i in zip(depths.tolist(), face_ids.tolist())]
+            for i, sort in enumerate((lambda: sorted(drawings, key=lambda x: x[0], reverse=True), lambda: list_order.sort(drawings),
+                                      lambda: np.argsort(-depths, kind='stable'), lambda: array_order.order(face_ids, depths))):
+                start = time.perf_counter()
+                sort()
+                if f > 0: times[i] += time.perf_counter() - start #Frame 0 has no previous order yet
+        times = [t/frames*1000 for t in times]
+        print(f'{n:>8} {times[0]:>8.1f}ms {times[1]:>13.1f}ms {times[0]/times[1]:>7.1f}x'
+              f' {times[2]:>8.1f}ms {times[3]:>14.1f}ms {times[2]/times[3]:>7.1f}x')
+
+
+def bench_bsp(sizes = (100, 1000, 4000), frames: int = 10):
+    '''
+    A static grid of cubes with some overlapping cubes (so faces get cut) seen by a turning camera. Compares the per
+      frame draw list cost (and the sort alone against walking the tree alone) of sorting every frame against the
+      cached BSP tree.
+    '''
+    print(f'{"cubes":>8} {"fragments":>10} {"build":>8} {"sorted/frame":>13} {"BSP/frame":>10} {"sort stage":>11} {"BSP walk":>10}')
+    for n in sizes:
+        side = math.ceil(math.sqrt(n))
+        cubes = [Cube(60 if i % 7 else 120, (255,50,50), location=Vector((i%side - side/2)*80, 0, (i//side)*80 + 300),
+                      rotation=Rotation(0, (i % 5)*.3, 0)) for i in range(n)]
+        camera = Camera(location=Vector(0,600,-300), rotation=Rotation(-.5,0,0), screen_size=(800,500))
+
+        sorting = Renderer(camera, cubes, profiler=Profiler())
+        static = Renderer(camera, [], profiler=Profiler(), static=cubes)
+        start = time.perf_counter()
+        fragments = static.bsp().fragment_count() #Builds the tree
+        build = time.perf_counter() - start
+
+        results = []
+        for renderer in (sorting, static):
+            start = time.perf_counter()
+            for f in range(frames):
+                camera.rotate((0, .01, 0))
+                renderer.draw_list()
+                renderer.profiler().end_frame()
+            stage = 'bsp' if renderer is static else 'sort'
+            results.append(((time.perf_counter() - start)/frames, renderer.profiler().percentiles(stage, (50,))[0]))
+            camera.rotate((0, -.01*frames, 0))
+        print(f'{n:>8} {fragments:>10} {build:>7.2f}s {results[0][0]*1000:>11.1f}ms {results[1][0]*1000:>8.1f}ms'
+              f' {results[0][1]:>9.2f}ms {results[1][1]:>8.2f}ms')
+
+
+def bench_raster(counts = (5000, 20000), sizes = (3, 8, 20), repeat: int = 5):
+    '''
+    Draw cost of one frame of a Mesh of count random triangles (each about size units across, so from a few pixels
+      to a few dozen) onto an offscreen Surface: pygame (after the depth sort it needs) against the Rasterizer (no sort).
+      Also times filling the same triangles from ready made arrays, without turning the draw list into arrays first.
+    '''
+    import pygame
+
+    print(f'{"faces":>8} {"size":>5} {"sort+pygame":>12} {"Rasterizer":>11} {"speedup":>8} {"fill arrays":>12}')
+    surface = pygame.Surface((800,500))
+    for count in counts:
+        for size in sizes:
+            rng = np.random.default_rng(0)
+            vertices = (rng.uniform(-300, 300, (count, 1, 3)) + rng.uniform(-size, size, (count, 3, 3))).reshape(-1, 3)
+            model = Model(shapes.Mesh(vertices, np.arange(3*count).reshape(-1, 3), (255,120,50)), location=Vector(0,0,800))
+            camera = Camera(screen_size=(800,500))
+            painter = Renderer(camera, [model])
+            buffered = Renderer(camera, [model], depth_buffer=True)
+            drawings = buffered.draw_list()
+
+            sort_draw = min(timeit.repeat(lambda: painter.draw(surface, painter.depth_sort(drawings), (100,100,100)), number=1, repeat=repeat))
+            raster = min(timeit.repeat(lambda: buffered.draw(surface, drawings, (100,100,100)), number=1, repeat=repeat))
+
+            points = np.array([[tuple(p) for p in d[2][0]] for d in drawings], dtype=float)
+            inverse_depths = 1/np.array([d[2][3] for d in drawings], dtype=float)
+            colors = np.array([d[2][1][:3] for d in drawings], dtype=float).astype(np.uint8)
+            rasterizer = Rasterizer((800,500))
+            fill = min(timeit.repeat(lambda: (rasterizer.clear((100,100,100)), rasterizer.fill_triangles(points, inverse_depths, colors)),
+                                     number=1, repeat=repeat))
+            print(f'{len(drawings):>8} {size:>5} {sort_draw*1000:>10.1f}ms {raster*1000:>9.1f}ms {sort_draw/raster:>7.1f}x {fill*1000:>10.1f}ms')
+
+def bench_parallel(cubes = (500, 2000), workers = (1, 2, 4), frames: int = 10):
+    '''
+    Frame time of the spinning cube scene drawn by one process against worker processes (Renderer workers), and
+      checks the rendered frames come out the same. The speedup can't go past the number of cores.
+    '''
+    import pygame
+
+    print(f'{os.cpu_count()} cores')
+    print(f'{"cubes":>6} {"workers":>8} {"frame":>9} {"speedup":>8} {"same":>5}')
+    for n in cubes:
+        single = None
+        for count in (0,) + tuple(workers):
+            camera, objects, animate = cube_scene(n)
+            renderer = Renderer(camera, objects, workers=count)
+            camera.resize((800,500))
+            renderer.draw_list() #Warm up caches (and start the workers)
+            start = time.perf_counter()
+            for i in range(frames):
+                animate(i)
+                renderer.draw_list()
+            elapsed = (time.perf_counter() - start)/frames
+            image = pygame.image.tobytes(renderer.render((800,500)), 'RGB')
+            renderer.close()
+            if count == 0:
+                single = (elapsed, image)
+                print(f'{n:>6} {"-":>8} {elapsed*1000:>7.1f}ms')
+            else:
+                print(f'{n:>6} {count:>8} {elapsed*1000:>7.1f}ms {single[0]/elapsed:>7.2f}x {str(image == single[1]):>5}')
+
+def write_grid_files(directory: str, side: int) -> (str, str):
+    '''
+    Writes a side x side grid of quads (2*side*side triangles, a wavy surface) as an .obj and a binary .stl file.
+    '''
+    x, y = np.meshgrid(np.arange(side + 1, dtype=float), np.arange(side + 1, dtype=float))
+    vertices = np.stack((x.ravel(), y.ravel(), np.sin(x.ravel()/7)*np.cos(y.ravel()/5)), axis=1)
+    corner = (np.arange(side)[:,None]*(side + 1) + np.arange(side)[None,:]).ravel()
+    triangles = np.concatenate((np.stack((corner, corner + 1, corner + side + 2), axis=1),
+                                np.stack((corner, corner + side + 2, corner + side + 1), axis=1)))
+
+    obj_path = f'{directory}/grid{side}.obj'
+    with open(obj_path, 'w') as f:
+        np.savetxt(f, vertices, fmt='v %.6f %.6f %.6f')
+        np.savetxt(f, triangles + 1, fmt='f %d %d %d')
+    stl_path = f'{directory}/grid{side}.stl'
+    records = np.zeros(len(triangles), dtype=loaders._STL_RECORD)
+    records['points'] = vertices[triangles]
+    with open(stl_path, 'wb') as f:
+        f.write(bytes(80))
+        f.write(np.array(len(triangles), dtype='<u4').tobytes())
+        records.tofile(f)
+    return obj_path, stl_path
+
+def _load_job(job: str, path: str) -> (float, float):
+    '''
+    Runs one loading job, returns (seconds, how much the peak resident memory grew in MB). Meant for a fresh process
+      each, and Linux only (reads /proc).
+    '''
+    def memory(field):
+        with open('/proc/self/status') as f:
+            return int(next(line for line in f if line.startswith(field)).split()[1])
+    with open('/proc/self/clear_refs', 'w') as f: #Resets the peak to the current size
+        f.write('5')
+    base = memory('VmRSS:')
+    start = time.perf_counter()
+    if job == 'triangles': #The old way, one Triangle per face
+        vertices, faces = loaders.load_arrays(path)
+        points = np.asarray(vertices)[np.asarray(faces)].tolist()
+        model = Model(*(shapes.Triangle(Vector(*p1), Vector(*p2), Vector(*p3), (200,200,200)) for p1, p2, p3 in points))
+    else:
+        mesh = loaders.load_mesh(path, (200,200,200), cache=job != 'parse')
+        mesh.face_count()
+    elapsed = time.perf_counter() - start
+    return elapsed, (memory('VmHWM:') - base)/1024
+
+def bench_loaders(sides = (100, 300, 1000), triangle_limit: int = 200000):
+    '''
+    Load time and peak memory of grid meshes as one Mesh: parsing the file, writing the cache on the first load and
+      memory mapping it on later loads, against building one Triangle object per face from the cached arrays (up to
+      triangle_limit faces). Every load runs in its own process, so the memory numbers don't mix.
+    '''
+    def run(job, path):
+        code = f'import benchmarks, json; print(json.dumps(benchmarks._load_job({job!r}, {path!r})))'
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        return json.loads(output.splitlines()[-1])
+
+    print(f'{"faces":>9} {"file":>5} {"MB":>6} {"job":>10} {"time":>9} {"peak RSS":>9}')
+    with tempfile.TemporaryDirectory() as directory:
+        for side in sides:
+            for path in write_grid_files(directory, side):
+                size = os.path.getsize(path)/2**20
+                faces = 2*side*side
+                jobs = ['parse', 'first', 'cached'] + (['triangles'] if faces <= triangle_limit else [])
+                for job in jobs:
+                    elapsed, peak = run(job, path)
+                    print(f'{faces:>9} {path[-3:]:>5} {size:>6.1f} {job:>10} {elapsed*1000:>7.1f}ms {peak:>7.1f}MB')
+
+def bench_instances(counts = (5000, 50000), frames: int = 3, model_limit: int = 50000):
+    '''
+    A forest of count randomly placed, rotated and colored cubes, built as one Cube Model each (up to model_limit)
+      against one InstancedMesh: build time, memory kept afterwards (traced), and frame time (draw list, cubes
+      spinning) with faces drawn per frame.
+    '''
+    print(f'{"cubes":>7} {"as":>10} {"build":>9} {"memory":>10} {"frame":>9} {"faces":>8}')
+    for count in counts:
+        rng = np.random.default_rng(0)
+        side = math.sqrt(count)*70
+        locations = rng.uniform((-side/2, -200, 300), (side/2, 0, 300 + side), (count, 3))
+        rotations = rng.uniform(-math.pi, math.pi, (count, 3))
+        colors = rng.integers(0, 256, (count, 3))
+
+        def models():
+            return [Cube(40, tuple(colors[i].tolist()), location=Vector(*locations[i]), rotation=Rotation(*rotations[i]))
+                        for i in range(count)]
+        def instances():
+            return [Cube.instances(40, locations, rotations, colors)]
+        def spin_models(objects):
+            for o in objects:
+                o.rotate((0,.05,0))
+        def spin_instances(objects):
+            objects[0].rotate_instances((0,.05,0))
+
+        for name, build, spin in (('models', models, spin_models), ('instances', instances, spin_instances)):
+            if name == 'models' and count > model_limit: continue
+            tracemalloc.start()
+            start = time.perf_counter()
+            objects = build()
+            built = time.perf_counter() - start
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            camera = Camera(screen_size=(800,500))
+            renderer = Renderer(camera, objects)
+            faces = len(renderer.draw_list())
+            start = time.perf_counter()
+            for i in range(frames):
+                spin(objects)
+                faces = len(renderer.draw_list())
+            frame = (time.perf_counter() - start)/frames
+            print(f'{count:>7} {name:>10} {built*1000:>7.0f}ms {memory/2**20:>8.1f}MB {frame*1000:>7.0f}ms {faces:>8}')
+
+def bench_freeze(frames: int = 10):
+    '''
+    Scenes that don't move (the camera turning instead), drawn as they are against with every top level Model frozen:
+      the first frozen frame (which bakes) and the frame time after it, with faces drawn per frame.
+    '''
+    print(f'{"scene":>16} {"frame":>9} {"baking":>9} {"frozen":>9} {"speedup":>9} {"faces":>8}')
+    for name, make in (('cubes=100', lambda: cube_scene(100)), ('cubes=1000', lambda: cube_scene(1000)),
+                       ('depth=8', lambda: nested_scene(8)), ('triangles=1000', lambda: triangle_scene(1000)),
+                       ('triangles=5000', lambda: triangle_scene(5000))):
+        times = []
+        for frozen in (False, True):
+            camera, objects, animate = make()
+            renderer = Renderer(camera, objects)
+            if frozen:
+                for o in objects: o.freeze()
+            start = time.perf_counter()
+            renderer.draw_list()
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            for i in range(frames):
+                camera.rotate((0,.002,0))
+                faces = len(renderer.draw_list())
+            times.append((first, (time.perf_counter() - start)/frames, faces))
+        (first, plain, faces), (baking, frozen, frozen_faces) = times
+        assert faces == frozen_faces
+        print(f'{name:>16} {plain*1000:>7.1f}ms {baking*1000:>7.1f}ms {frozen*1000:>7.1f}ms {plain/frozen:>8.1f}x {faces:>8}')
+
+def _face_shading(normals: [Vec3], cam_to_centers: [Vec3], colors: list) -> list:
+    '''
+    The old shading, one face at a time like Triangle.draw did it, kept around to compare against.
+    '''
+    returning = []
+    for normal, cam_to_center, color in zip(normals, cam_to_centers, colors):
+        angle_diff = normal.angle_diff(cam_to_center)
+        new_color = [0,0,0,255]
+        new_color[0] = color[0]*(1-angle_diff/math.pi)
+        new_color[1] = color[1]*(1-angle_diff/math.pi)
+        new_color[2] = color[2]*(1-angle_diff/math.pi)
+        returning.append(new_color)
+    return returning
+
+def bench_shading(counts = (1000, 10000, 100000)):
+    '''
+    Shades count faces one at a time (the old way) against all at once through a Lighting (the same look), and with
+      two directional lights and ambient added.
+    '''
+    lit = Lighting(ambient=.1, lights=[(Vector(1,-2,1), .6), (Vector(-1,0,1), .3)])
+    print(f'{"faces":>8} {"per face":>10} {"batched":>10} {"speedup":>9} {"+2 lights":>10}')
+    for count in counts:
+        rng = np.random.default_rng(0)
+        normals, cam_to_centers = rng.normal(size=(count, 3)), rng.normal(size=(count, 3))
+        colors = rng.integers(0, 256, (count, 4)).astype(float)
+        vectors = ([Vec3(*n) for n in normals.tolist()], [Vec3(*c) for c in cam_to_centers.tolist()], colors.tolist())
+        old = _time(lambda: _face_shading(*vectors))
+        new = _time(lambda: Lighting().shade(normals, cam_to_centers, colors).tolist())
+        lights = _time(lambda: lit.shade(normals, cam_to_centers, colors).tolist())
+        print(f'{count:>8} {old*1000:>8.2f}ms {new*1000:>8.2f}ms {old/new:>8.1f}x {lights*1000:>8.2f}ms')
+
+def bench_dirty(cubes = (100, 1000), frames: int = 20, moving: float = .02, size: (int, int) = (800, 500)):
+    '''
+    A still camera over a grid of cubes, drawn onto an offscreen Surface every frame without change tracking
+      against with it: first with nothing moving (the frame is skipped), then with a few cubes spinning (only their
+      dirty rects are drawn). Also gives how much of the screen the dirty rects cover.
+    '''
+    import pygame
+    print(f'{"cubes":>6} {"moving":>7} {"full":>9} {"tracked":>9} {"speedup":>9} {"redrawn":>8}')
+    for count in cubes:
+        for spinning in (0, max(1, int(count*moving))):
+            times = []
+            area = 0
+            for track in (False, True):
+                camera, objects, animate = cube_scene(count)
+                camera.resize(size)
+                renderer = Renderer(camera, objects, track_changes=track)
+                surface = pygame.Surface(size)
+                renderer.draw(surface, renderer.draw_list(), (100,100,100))
+                start = time.perf_counter()
+                for i in range(frames):
+                    for o in objects[:spinning]:
+                        o.rotate((0,.05,0))
+                    drawings = renderer.draw_list()
+                    rects = renderer.dirty_rects()
+                    renderer.draw(surface, drawings, (100,100,100), rects)
+                    if track: area += size[0]*size[1] if rects == None else sum(w*h for x, y, w, h in rects)
+                times.append((time.perf_counter() - start)/frames)
+            redrawn = area/frames/(size[0]*size[1])
+            print(f'{count:>6} {spinning:>7} {times[0]*1000:>7.2f}ms {times[1]*1000:>7.2f}ms {times[0]/times[1]:>8.1f}x {redrawn:>7.2%}')
+
+def bench_loop(cubes = (100, 400), seconds: float = 2, tick_rate: float = 60, size: (int, int) = (800, 500)):
+    '''
+    Spinning cubes drawn onto an offscreen Surface for a few seconds: ticking the world once per frame (like the
+      example's usual loop), against a FixedStepLoop at tick_rate, drawing on the same thread and on a second one.
+      Gives the achieved ticks/sec and frames/sec of each, and how fast the world moved compared to real time
+      (tick_rate ticks a second is 1x).
+    '''
+    import pygame
+    print(f'{"cubes":>6} {"loop":>12} {"ticks/s":>9} {"frames/s":>9} {"world speed":>12}')
+    for count in cubes:
+        for mode in ('per frame', 'fixed', 'threaded'):
+            camera, objects, animate = cube_scene(count)
+            camera.resize(size)
+            renderer = Renderer(camera, objects)
+            surface = pygame.Surface(size)
+            ticks = [0]
+            def update():
+                animate(ticks[0])
+                ticks[0] += 1
+            build = renderer.draw_list
+            present = lambda drawings: renderer.draw(surface, drawings, (100,100,100))
+
+            loop = None
+            if mode != 'per frame':
+                loop = FixedStepLoop(update, build, present, lambda: [n for o in objects for n in o.nodes()],
+                                     tick_rate, threaded = mode == 'threaded')
+            frames = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                if loop != None:
+                    loop.frame()
+                else:
+                    update()
+                    present(build())
+                frames += 1
+            if loop != None: loop.close()
+            elapsed = time.perf_counter() - start
+            print(f'{count:>6} {mode:>12} {ticks[0]/elapsed:>9.1f} {frames/elapsed:>9.1f} {ticks[0]/elapsed/tick_rate:>11.2f}x')
+
+def bench_commands(frames: int = 10, size: (int, int) = (800, 500)):
+    '''
+    Scenes built and drawn onto an offscreen Surface as draw lists (draw_list) against into the Renderer's DrawBuffer
+      (draw_commands), with and without the depth buffer: frame time, and the peak memory allocated during a frame
+      (traced, which slows both down) with what is still held after it (the frame's draw list, or the buffer).
+    '''
+    import pygame
+    scenes = [('100 cubes', lambda: cube_scene(100)), ('1000 cubes', lambda: cube_scene(1000)),
+              ('10k triangles', lambda: triangle_scene(10000)), ('frozen 10k', lambda: triangle_scene(10000)),
+              ('50k instances', lambda: _instance_scene(50000))]
+    print(f'{"scene":>14} {"depth buffer":>12} {"as":>9} {"frame":>9} {"allocated":>10} {"held":>9} {"faces":>7}')
+    for name, make in scenes:
+        for depth_buffer in (False, True):
+            for mode in ('list', 'commands'):
+                camera, objects, animate = make()
+                camera.resize(size)
+                if name.startswith('frozen'):
+                    for o in objects: o.freeze()
+                    animate = lambda frame: camera.rotate(Rotation(0,.002,0))
+                renderer = Renderer(camera, objects, depth_buffer=depth_buffer)
+                surface = pygame.Surface(size)
+                build = renderer.draw_list if mode == 'list' else renderer.draw_commands
+                def frame(i):
+                    animate(i)
+                    drawings = build()
+                    renderer.draw(surface, drawings, (100,100,100))
+                    return drawings
+                frame(0) #Warm up (baking, growing the buffer)
+                start = time.perf_counter()
+                for i in range(frames):
+                    drawings = frame(i + 1)
+                took = (time.perf_counter() - start)/frames
+                faces = len(drawings)
+
+                del drawings
+                tracemalloc.start()
+                peak = held = 0
+                for i in range(frames):
+                    before = tracemalloc.get_traced_memory()[0]
+                    tracemalloc.reset_peak()
+                    drawings = frame(frames + i + 1)
+                    current, top = tracemalloc.get_traced_memory()
+                    peak = max(peak, top - before)
+                    held = max(held, current - before if mode == 'list' else drawings.nbytes())
+                    del drawings
+                tracemalloc.stop()
+                print(f'{name:>14} {str(depth_buffer):>12} {mode:>9} {took*1000:>7.1f}ms {peak/2**20:>8.2f}MB {held/2**20:>7.2f}MB {faces:>7}')
+
+def bench_edges(frames: int = 10, size: (int, int) = (800, 500)):
+    '''
+    Outlined meshes (wireframe cubes, filled and outlined cubes, and a wireframe grid of triangles) drawn onto an
+      offscreen Surface with their outlines face by face against with batch_edges: lines drawn, draw calls and frame
+      time, with pygame and with the depth buffer.
+    '''
+    import pygame
+    def cubes(fill: bool, batch: bool) -> list:
+        rng = np.random.default_rng(0)
+        corners = [[i*20 for i in corner] for corner in Cube._CORNERS]
+        colors = rng.integers(0, 256, (500, 3)) if fill else None
+        return [shapes.InstancedMesh(corners, Cube._FACES, rng.uniform((-600, -300, 500), (600, 300, 1500), (500, 3)),
+                                     rng.uniform(-math.pi, math.pi, (500, 3)), colors, outline=(0,0,0), cull_back=True, batch_edges=batch)]
+    def grid(fill: bool, batch: bool) -> list:
+        side = 60
+        x, y = np.meshgrid(np.arange(side + 1, dtype=float), np.arange(side + 1, dtype=float))
+        vertices = np.stack(((x.ravel() - side/2)*12, (y.ravel() - side/2)*12, np.sin(x.ravel()/7)*np.cos(y.ravel()/5)*30), axis=1)
+        corner = (np.arange(side)[:,None]*(side + 1) + np.arange(side)[None,:]).ravel()
+        triangles = np.concatenate((np.stack((corner, corner + 1, corner + side + 2), axis=1),
+                                    np.stack((corner, corner + side + 2, corner + side + 1), axis=1)))
+        return [shapes.Mesh(vertices, triangles, None, outline=(0,0,0), location=Vector(0,0,700),
+                            rotation=Rotation(-1,0,0), batch_edges=batch)]
+    def lines(drawings: list) -> int:
+        return sum(len(d[2][0])//2 if d[1] in (shapes.BaseObject.OUTLINE_EDGES, shapes.BaseObject.FILL_OUTLINE_EDGES)
+                        else len(d[2][0]) if d[1] != shapes.BaseObject.FILL else 0 for d in drawings)
+
+    print(f'{"scene":>16} {"depth buffer":>12} {"outlines":>10} {"lines":>7} {"calls":>7} {"frame":>9}')
+    for name, make, fill in (('500 wire cubes', cubes, False), ('500 filled cubes', cubes, True), ('7200 wire tris', grid, False)):
+        for depth_buffer in (False, True):
+            for batch in (False, True):
+                objects = make(fill, batch)
+                profiler = Profiler()
+                renderer = Renderer(Camera(screen_size=size), objects, profiler=profiler, depth_buffer=depth_buffer)
+                surface = pygame.Surface(size)
+                drawings = renderer.draw_list()
+                renderer.draw(surface, drawings, (100,100,100))
+                profiler.end_frame()
+                start = time.perf_counter()
+                for i in range(frames):
+                    objects[0].rotate((0,.01,0))
+                    drawings = renderer.draw_list()
+                    renderer.draw(surface, drawings, (100,100,100))
+                    profiler.end_frame()
+                took = (time.perf_counter() - start)/frames
+                calls = profiler.percentiles('draw calls', (50,))[0] if not depth_buffer else 1
+                print(f'{name:>16} {str(depth_buffer):>12} {"edges" if batch else "faces":>10} {lines(drawings):>7} {calls:>7} {took*1000:>7.1f}ms')
+
+def bench_occlusion(frames: int = 10, size: (int, int) = (800, 500)):
+    '''
+    Scenes drawn onto an offscreen Surface without occlusion culling against with it (occluders chosen by the
+      Renderer): cubes, instances and frozen triangles mostly hidden behind a big wall, and cubes with nothing in front
+      of them (what building the occlusion buffer costs). Gives faces occluded and drawn, the time spent building the
+      occlusion buffer and the frame time.
+    '''
+    import pygame
+    def walled(make) -> 'make()':
+        def scene():
+            camera, objects, animate = make()
+            wall = Cube(1200, (120,120,120), location=Vector(0,0,1000), rotation=Rotation(0,0,0))
+            return camera, [wall] + objects, animate
+        return scene
+    def frozen():
+        camera, objects, animate = triangle_scene(10000)
+        objects[0].move(Vector(0,0,1500))
+        objects[0].freeze()
+        return camera, objects, lambda frame: camera.rotate(Rotation(0,.002,0))
+    def forest():
+        camera, objects, animate = _instance_scene(20000)
+        camera.resize(size)
+        objects[0].move(Vector(0,100,1000))
+        return camera, objects, animate
+    scenes = [('1000 cubes', walled(lambda: cube_scene(1000))), ('20k instances', walled(forest)),
+              ('frozen 10k', walled(frozen)), ('nothing hidden', lambda: cube_scene(1000))]
+    print(f'{"scene":>15} {"occlusion":>10} {"occluded":>9} {"drawn":>7} {"buffer":>9} {"frame":>9} {"speedup":>8}')
+    for name, make in scenes:
+        plain = None
+        for occlusion in (False, True):
+            camera, objects, animate = make()
+            camera.resize(size)
+            profiler = Profiler()
+            renderer = Renderer(camera, objects, profiler=profiler, occlusion=occlusion)
+            surface = pygame.Surface(size)
+            renderer.draw(surface, renderer.draw_list(), (100,100,100))
+            profiler.end_frame()
+            start = time.perf_counter()
+            for i in range(frames):
+                animate(i)
+                drawings = renderer.draw_list()
+                renderer.draw(surface, drawings, (100,100,100))
+                profiler.end_frame()
+            took = (time.perf_counter() - start)/frames
+            plain = took if plain == None else plain
+            occluded = profiler.percentiles('faces occluded', (50,))[0] if occlusion else 0
+            building = profiler.percentiles('occlusion', (50,))[0] if occlusion else 0
+            print(f'{name:>15} {str(occlusion):>10} {occluded:>9.0f} {len(drawings):>7} {building:>7.2f}ms {took*1000:>7.1f}ms {plain/took:>7.2f}x')
+
+def _instance_scene(count: int) -> (Camera, list, 'animate(frame)'):
+    '''
+    count spinning cubes as one InstancedMesh.
+    '''
+    rng = np.random.default_rng(0)
+    side = math.sqrt(count)*70
+    locations = rng.uniform((-side/2, -200, 300), (side/2, 0, 300 + side), (count, 3))
+    forest = Cube.instances(40, locations, rng.uniform(-math.pi, math.pi, (count, 3)), rng.integers(0, 256, (count, 3)))
+    def animate(frame: int):
+        forest.rotate_instances((0,.05,0))
+    return Camera(), [forest], animate
+
+
+
+#Checks, each asserts that a fast path gives the same results as the plain one it stands in for
+def _random_camera(rng: random.Random, screen: bool = True) -> Camera:
+    '''
+    A camera moved, rotated and refocused at random, with a random screen size and fov (or no screen size).
+    '''
+    return Camera(location=Vector(*(rng.uniform(-200, 200) for i in range(3))),
+                  focus=Vector(rng.uniform(-50, 50), rng.uniform(-50, 50), -rng.uniform(20, 200)),
+                  rotation=Rotation(*(rng.uniform(-math.pi, math.pi) for i in range(3))),
+                  screen_size=(rng.randrange(100, 1000), rng.randrange(100, 1000)) if screen else None, fov=rng.uniform(30, 120))
+
+def verify_projection(cameras: int = 100, points: int = 200):
+    '''
+    Camera.project_many against calling the camera on every point: the exact same screen points (for points not
+      behind the focus), locations and depths, for random cameras and points all around them.
+    '''
+    rng = random.Random(0)
+    for c in range(cameras):
+        camera = _random_camera(rng, screen = c%4 != 0)
+        array = np.array([[rng.uniform(-600, 600) for i in range(3)] for p in range(points)])
+        screen, locations, depths = camera.project_many(array)
+        for p, s, location, depth in zip(array.tolist(), screen.tolist(), locations.tolist(), depths.tolist()):
+            v, v_location, v_depth = camera(Vector(*p))
+            assert v_location == location and v_depth == depth, (p, v_location, location, v_depth, depth)
+            if location != Camera.BEHIND: assert [v[0], v[1]] == s, (p, v, s)
+    print(f'projection: project_many matches __call__ exactly ({cameras} cameras, {cameras*points} points)')
+
+def verify_linalg(matrices: int = 20, sizes = range(1, 7)):
+    '''
+    The LU/closed form determinant, inverse and solve against the old cofactor expansion (the same up to float
+      rounding), that inverses and solutions multiply back to the identity and b, and that singular matrices
+      have a determinant of 0.
+    '''
+    rng = random.Random(0)
+    close = lambda a, b, scale = 1: abs(a - b) <= 1e-9*max(1, abs(a), abs(b), scale)
+    for n in sizes:
+        identity = [[1 if x == y else 0 for x in range(n)] for y in range(n)]
+        for i in range(matrices):
+            m = Matrix([[rng.uniform(-10, 10) for x in range(n)] for y in range(n)])
+            assert close(m.determinant(), _cofactor_determinant(m)), (n, m)
+            inverse = m.inverse()
+            scale = max(abs(v) for v in inverse.values())
+            if n > 1: #The old one has no 1x1 case (the empty cofactor's determinant isn't 1)
+                assert all(close(a, b, scale) for a, b in zip(inverse.values(), _cofactor_inverse(m).values())), (n, m)
+            assert all(close(a, b, scale) for a, b in zip((m@inverse).values(), Matrix(identity).values())), (n, m)
+
+            b = Vector(*(rng.uniform(-10, 10) for y in range(n)))
+            x = m.solve(b)
+            assert all(close(a, c, scale*10) for a, c in zip((m@Matrix(x)).values(), b)), (n, m, b)
+            columns = Matrix([[rng.uniform(-10, 10) for x in range(3)] for y in range(n)])
+            assert all(close(a, c, scale*10) for a, c in zip((m@m.solve(columns)).values(), columns.values())), (n, m)
+        if n > 1:
+            singular = Matrix([[rng.uniform(-10, 10) for x in range(n)] for y in range(n - 1)] + [[0]*n])
+            assert singular.determinant() == 0 and _cofactor_determinant(singular) == 0
+    rotation = Rotation(.3, -1.2, .5).matrix()
+    assert all(close(a, b) for a, b in zip(rotation.inverse(orthonormal=True).values(), rotation.inverse().values()))
+
+    #matrix[y][x] = v writes through to the matrix, and the NumPy copy follows
+    m = Matrix([[1, 2, 3], [4, 5, 6], [7, 8, 10]])
+    m.array()
+    m[2][1] = 20
+    m[0][-1] = -3
+    m[1][0:2] = [40, 50]
+    assert m[1,2] == 20 and m[2,0] == -3 and m[0,1] == 40 and m[1,1] == 50
+    assert m.array().tolist() == [[1, 2, -3], [40, 50, 6], [7, 20, 10]]
+    assert close(m.determinant(), _cofactor_determinant(m))
+
+    #matrix@array is the plain matrix product (operands in order), transform_points is transform_point for arrays
+    affine = Matrix.affine(Rotation(.3, -1.2, .5).matrix(), Vec3(1, 2, 3))
+    array = np.array([[rng.uniform(-10, 10) for x in range(3)] for y in range(50)])
+    assert np.array_equal(m@array.T, m.array()@array.T) and np.array_equal(array@m, array@m.array())
+    assert all(close(a, b) for p, q in zip(affine.transform_points(array).tolist(), array.tolist())
+                            for a, b in zip(p, affine.transform_point(Vec3(*q))))
+    print(f'linalg: determinant, inverse and solve match the cofactor expansion ({matrices} matrices of each size {sizes[0]}-{sizes[-1]}),'
+          f' rows write through, matrix@array and transform_points')
+
+def _old_projection(camera: Camera, v: Vector) -> ('2D point', 'location', 'depth'):
+    '''
+    The old projection (move, rotate, intersect with the screen, then the fov/screen remap, step by step), kept
+      around to compare against.
+    '''
+    trans_v = camera._rot/(Vec3(*v) - camera._loc) + camera._focus
+    depth = trans_v[2]
+    if trans_v[2] <= camera._focus[2]: return None, Camera.BEHIND, depth
+    intersection_finder = trans_v - camera._focus
+    fraction = (-camera._focus[2])/intersection_finder[2]
+    x, y = fraction*intersection_finder[0], fraction*intersection_finder[1]
+    if camera._screen != None:
+        fov_mult = min(camera._screen[0], camera._screen[1])/camera._fov
+        x, y = x*fov_mult + camera._screen[0]/2, camera._screen[1]/2 - y*fov_mult
+    return (x, y), Camera.BETWEEN if depth <= 0 else Camera.IN_FRONT, depth
+
+def verify_view_projection(cameras: int = 100, points: int = 200):
+    '''
+    Projecting through the cached view projection matrix against the old step by step projection: the same
+      locations and the same screen points and depths up to float rounding, for random cameras (also after moving,
+      rotating, refocusing and resizing them, which has to rebuild the matrix) and points all around them.
+    '''
+    rng = random.Random(1)
+    close = lambda a, b: abs(a - b) <= 1e-9*max(1, abs(a), abs(b))
+    checked = 0
+    for c in range(cameras):
+        camera = _random_camera(rng, screen = c%4 != 0)
+        for change in range(3):
+            for p in range(points):
+                v = Vector(*(rng.uniform(-600, 600) for i in range(3)))
+                old, old_location, old_depth = _old_projection(camera, v)
+                if abs(old_depth) < 1e-6 or abs(old_depth - camera._focus[2]) < 1e-6: continue #Rounding could go either way
+                new, location, depth = camera(v)
+                assert location == old_location and close(depth, old_depth), (v, location, old_location, depth, old_depth)
+                if location != Camera.BEHIND: assert close(new[0], old[0]) and close(new[1], old[1]), (v, new, old)
+                checked += 1
+            camera.move(Vector(*(rng.uniform(-50, 50) for i in range(3))))
+            camera.rotate(Rotation(*(rng.uniform(-1, 1) for i in range(3))))
+            camera.move_focus(Vector(0, 0, -rng.uniform(0, 20)))
+            if camera.screen_size() != None: camera.resize((rng.randrange(100, 1000), rng.randrange(100, 1000)))
+    print(f'view projection: matches the old projection ({cameras} cameras, {checked} points)')
+
+def _verify_scene() -> (Camera, list, list, 'animate(frame)'):
+    '''
+    A bit of everything for verify_renderer: cubes, nested Models of (some outlined) triangles, an outlined
+      Quadrilateral, InstancedMeshes, Meshes with batch_edges (filled and not) and static cubes, with some of it
+      moving and the camera turning every other frame, and along the way the instances moving and changing color, a
+      triangle being added and the lighting changing.
+    '''
+    rng = random.Random(1)
+    color = lambda: (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    cubes = [Cube(rng.uniform(20, 80), color(), location=Vector(rng.uniform(-400, 400), rng.uniform(-200, 200), rng.uniform(300, 1200)),
+                  rotation=Rotation(rng.uniform(-3, 3), rng.uniform(-3, 3), 0)) for i in range(12)]
+    nested = Model(location=Vector(0,0,700))
+    inner = Model(location=Vector(60,0,0), rotation=Rotation(0,.4,0))
+    nested.add_object(inner)
+    for k in range(40):
+        center = Vector(*(rng.uniform(-150, 150) for j in range(3)))
+        (nested if k%2 else inner).add_object(shapes.Triangle(*(center + Vector(*(rng.uniform(-30, 30) for j in range(3))) for i in range(3)),
+                                                             color=color(), outline=(0,0,0) if k%3 == 0 else None))
+    wall = Model(shapes.Quadrilateral(Vector(-200,-150,0), Vector(200,-150,0), Vector(200,150,0), Vector(-200,150,0), (50,50,200), outline=(0,0,0)),
+                 location=Vector(-250,0,500), rotation=Rotation(0,.4,0))
+    forest = Cube.instances(25, [[rng.uniform(-500, 500), rng.uniform(-200, 200), rng.uniform(600, 1500)] for i in range(40)],
+                            [[rng.uniform(-3, 3) for j in range(3)] for i in range(40)], [color() for i in range(40)])
+    lattice = shapes.Mesh([(x*40, y*40, 0) for y in range(6) for x in range(6)], [(y*6 + x, y*6 + x + 1, y*6 + x + 7, y*6 + x + 6) for y in range(5) for x in range(5)],
+                          outline=(240,240,240), location=Vector(150,-80,600), rotation=Rotation(.3,.2,0), batch_edges=True)
+    crates = shapes.InstancedMesh([[c*20 for c in corner] for corner in Cube._CORNERS], Cube._FACES, [[rng.uniform(-300, 300), rng.uniform(-150, 150), rng.uniform(500, 1000)] for i in range(8)],
+                                  [[rng.uniform(-3, 3) for j in range(3)] for i in range(8)], color=(150,90,40), outline=(20,20,20),
+                                  cull_back=True, batch_edges=True)
+    static = [Cube(60, (200,200,40), location=Vector(rng.uniform(-400, 400), 150, rng.uniform(400, 1200)),
+                   rotation=Rotation(0, rng.uniform(-3, 3), 0)) for i in range(6)]
+    camera = Camera(screen_size=(320,200))
+    added = shapes.Triangle(Vector(-40,0,0), Vector(40,0,0), Vector(0,60,0), color=(250,120,0), location=Vector(0,-60,0))
+    def animate(frame: int):
+        for c in cubes[:6]:
+            c.rotate((0,.1,.05))
+        inner.rotate((0,.2,0))
+        nested.move(Vector(5,0,0))
+        forest.move(Vector(0,0,-10))
+        lattice.rotate((0,.15,0))
+        crates.rotate_instances((0,.2,.1))
+        forest.move_instances((15,0,0), slice(0, 40, 3))
+        forest.rotate_instances((.2,0,.1), slice(1, 40, 2))
+        if frame == 1: forest.set_instances(colors=[color() for i in range(40)])
+        if frame == 2: inner.add_object(added)
+        if frame == 3:
+            camera.lighting.ambient = .3
+            camera.lighting.add_light(Vector(1,-1,1), .5)
+        if frame % 2: #Standing still on the others, where track_changes only redraws dirty rects
+            camera.rotate(Rotation(0,.02,0))
+            camera.move(Vector(4,0,10))
+    return camera, cubes + [nested, wall, forest, lattice, crates], static, animate
+
+def _verify_frames(options: dict, commands: bool = False, frozen: bool = False, frames: int = 5) -> [('(w,h,3) array', 'faces')]:
+    '''
+    Draws frames of _verify_scene with a Renderer made with options, returns each frame's pixels and its faces in
+      drawing order as (distance, face id) pairs (None with commands).
+    '''
+    import pygame
+    first_id = shapes.reserve_face_ids(0) #Every scene gets its own face ids, so they're given from the first
+    camera, objects, static, animate = _verify_scene()
+    if frozen:
+        for o in objects:
+            if isinstance(o, Model): o.freeze()
+    renderer = Renderer(camera, objects, static=static, **options)
+    surface = pygame.Surface(camera.screen_size())
+    pixels = []
+    for i in range(frames):
+        if i > 0: animate(i)
+        drawings = renderer.draw_commands() if commands else renderer.draw_list()
+        renderer.draw(surface, drawings, (100,100,100), renderer.dirty_rects() if options.get('track_changes') else None)
+        pixels.append((pygame.surfarray.array3d(surface), None if commands else [(d[0], d[3] - first_id) for d in drawings]))
+    renderer.close()
+    return pixels
+
+def verify_renderer(frames: int = 5):
+    '''
+    Every Renderer mode (BVH, coherent sort, draw_commands, frozen Models, track_changes with dirty rects, workers,
+      occlusion) against the plain one, with pygame and with the depth buffer: the exact same pixels every frame.
+      Except coherent sort with pygame, which keeps faces at exactly the same distance in last frame's order (so
+      they don't flicker) rather than the order they were drawn in, so it gets the same faces at the same distances.
+    '''
+    import pygame
+    modes = [('use_bvh', {'use_bvh': True}, {}), ('coherent_sort', {'coherent_sort': True}, {}),
+             ('draw_commands', {}, {'commands': True}), ('frozen', {}, {'frozen': True}),
+             ('track_changes', {'track_changes': True}, {}), ('workers', {'workers': 2}, {}), ('occlusion', {'occlusion': True}, {})]
+    for depth_buffer in (False, True):
+        plain = _verify_frames({'depth_buffer': depth_buffer}, frames = frames)
+        for name, options, how in modes:
+            pixels = _verify_frames(dict(options, depth_buffer=depth_buffer), frames = frames, **how)
+            if name == 'coherent_sort' and not depth_buffer:
+                assert all([d for d, i in a] == [d for d, i in b] and sorted(a) == sorted(b) for (p, a), (q, b) in zip(plain, pixels)), name
+                continue
+            differing = [int((a != b).any(axis=2).sum()) for (a, faces), (b, others) in zip(plain, pixels)]
+            assert not any(differing), (name, depth_buffer, differing)
+    print(f'renderer: {", ".join(name for name, options, how in modes)} draw the same pixels as the plain renderer'
+          f' (pygame and depth buffer, {frames} frames)')
+
+    #render again at the same size is an unchanged frame for track_changes
+    camera, objects, static, animate = _verify_scene()
+    renderer = Renderer(camera, objects, static=static, track_changes=True)
+    first = pygame.surfarray.array3d(renderer.render((320,200)))
+    version = camera.version()
+    again = pygame.surfarray.array3d(renderer.render((320,200)))
+    assert camera.version() == version and renderer.dirty_rects() == [] and np.array_equal(first, again)
+    print('renderer: render at the same size leaves the camera alone (an unchanged frame with track_changes)')
+
+def verify_degenerate():
+    '''
+    Faces with no area (collinear and repeated vertices, like real mesh files have) in a Mesh, a Model and an
+      InstancedMesh, lit by the camera light and a directional light: finite colors in the draw list, and drawn by
+      pygame, the depth buffer and workers alike. Also a face with the camera right at its center.
+    '''
+    import pygame
+    vertices = [(0,0,0), (30,0,0), (60,0,0), (0,30,0), (30,30,0)]
+    faces = [(0,1,2), (0,0,3), (1,4,4), (0,1,3), (1,4,3)] #Collinear, repeated, repeated, then two real ones
+    def scene() -> (Camera, list):
+        camera = Camera(screen_size=(160,120), lighting=Lighting(ambient=.2, lights=[(Vector(1,-1,1), .5)]))
+        mesh = shapes.Mesh(vertices, faces, (200,80,40), outline=(0,0,0), location=Vector(-60,-20,200))
+        model = Model(shapes.Triangle(Vector(0,0,0), Vector(20,20,0), Vector(40,40,0), (40,200,80)),
+                      shapes.Triangle(Vector(0,0,0), Vector(0,0,0), Vector(0,20,0), (40,200,80), outline=(0,0,0)),
+                      shapes.Triangle(Vector(0,0,0), Vector(20,0,0), Vector(0,20,0), (40,200,80)), location=Vector(10,-30,180))
+        instances = shapes.InstancedMesh(vertices, faces, [[-40,20,220], [20,20,240]], [[0,0,0], [0,.5,0]], color=(80,80,220))
+        return camera, [mesh, model, instances]
+    for depth_buffer in (False, True):
+        drawn = []
+        for options in ({}, {'workers': 2}):
+            camera, objects = scene()
+            renderer = Renderer(camera, objects, depth_buffer=depth_buffer, **options)
+            drawings = renderer.draw_list()
+            fills = [d[2][1] for d in drawings if d[2][1] != None]
+            assert fills and np.isfinite(np.array(fills, dtype=float)).all(), (depth_buffer, options)
+            surface = pygame.Surface(camera.screen_size())
+            renderer.draw(surface, drawings, (100,100,100))
+            drawn.append(pygame.surfarray.array3d(surface))
+            renderer.close()
+        assert np.array_equal(*drawn), depth_buffer
+    lighting = Lighting(ambient=.2, lights=[(Vector(0,0,1), .5)])
+    shaded = lighting.shade([(0,0,0), (0,0,-1)], [(0,0,5), (0,0,0)], (200,200,200))
+    assert np.isfinite(shaded).all(), shaded
+    print('degenerate faces: finite colors, drawn the same by pygame, the depth buffer and workers')
+
+def verify_loaders():
+    '''
+    load_mesh on an .obj and an .stl file of the same triangles, some with no area (collinear and repeated
+      vertices, like real mesh files have): the same arrays parsed and from the cache, and the same pixels as a Mesh
+      made straight from the triangles, with batch_edges outlines, drawn by pygame, the depth buffer and workers.
+    '''
+    import pygame
+    vertices = np.array([(0,0,0), (40,0,0), (80,0,0), (0,40,10), (40,40,10), (80,40,0)], dtype=float)
+    triangles = np.array([(0,1,4), (0,4,3), (0,1,2), (1,4,4), (1,2,5), (1,5,4), (3,3,3)]) #The 3rd, 4th and last have no area
+    flipped = vertices*(1,1,-1)
+    with tempfile.TemporaryDirectory() as directory:
+        obj_path, stl_path = f'{directory}/degenerate.obj', f'{directory}/degenerate.stl'
+        with open(obj_path, 'w') as f:
+            np.savetxt(f, vertices, fmt='v %.6f %.6f %.6f')
+            np.savetxt(f, triangles + 1, fmt='f %d %d %d')
+        records = np.zeros(len(triangles), dtype=loaders._STL_RECORD)
+        records['points'] = vertices[triangles]
+        with open(stl_path, 'wb') as f:
+            f.write(bytes(80))
+            f.write(np.array(len(triangles), dtype='<u4').tobytes())
+            records.tofile(f)
+
+        for path in (obj_path, stl_path):
+            parsed = loaders.load_arrays(path)
+            cached = loaders.load_arrays(path)
+            assert isinstance(cached[1], np.memmap), path
+            assert all(np.array_equal(a, b) for a, b in zip(parsed, cached)), path
+            assert np.array_equal(np.asarray(cached[0])[np.asarray(cached[1])], flipped[triangles]), path
+            expected = shapes.Mesh(flipped, triangles, (200,120,40), (0,0,0), Vector(-40,-20,150), Rotation(.3,.2,0), batch_edges=True)
+            loaded = [loaders.load_mesh(path, (200,120,40), (0,0,0), Vector(-40,-20,150), Rotation(.3,.2,0), batch_edges=True, cache=cache)
+                      for cache in (False, True)]
+            for depth_buffer in (False, True):
+                drawn = []
+                for mesh, options in [(expected, {}), (loaded[0], {}), (loaded[1], {}), (loaded[1], {'workers': 2})]:
+                    camera = Camera(screen_size=(160,120), lighting=Lighting(ambient=.2, lights=[(Vector(1,-1,1), .5)]))
+                    renderer = Renderer(camera, [mesh], depth_buffer=depth_buffer, **options)
+                    surface = pygame.Surface(camera.screen_size())
+                    renderer.draw(surface, renderer.draw_list(), (100,100,100))
+                    drawn.append(pygame.surfarray.array3d(surface))
+                    renderer.close()
+                assert (drawn[0] != (100,100,100)).any(axis=2).sum() > 1000, (path, depth_buffer)
+                assert all(np.array_equal(drawn[0], d) for d in drawn[1:]), (path, depth_buffer)
+    print('loaders: .obj and .stl files with faces of no area load the same parsed and cached, and draw like the Mesh'
+          ' they came from (batch_edges, pygame, depth buffer and workers)')
+
+def verify_loop(ticks: int = 6, frames: int = 3):
+    '''
+    Interpolation against moving a copy of the scene there with set_transform: the same pixels every frame, with a
+      BVH and track_changes (reusing what didn't change, drawing dirty rects) keeping up through the quiet restores,
+      and restore leaving every version as it was.
+      Also that a threaded FixedStepLoop shows every frame on this thread, with what present gave for it.
+    '''
+    import pygame
+    scenes = [_verify_scene(), _verify_scene()]
+    movers = [[n for o in objects + static for n in o.nodes()] for camera, objects, static, animate in scenes] #Not the camera, which would redraw everything
+    renderers = [Renderer(camera, objects, static=static, **options)
+                 for (camera, objects, static, animate), options in zip(scenes, ({'use_bvh': True, 'track_changes': True}, {}))]
+    surfaces = [pygame.Surface(camera.screen_size()) for camera, objects, static, animate in scenes]
+    interpolation = Interpolation()
+    for tick in range(ticks):
+        interpolation.capture(movers[0])
+        if tick % 3 != 2: #Every third tick nothing moves
+            for camera, objects, static, animate in scenes: animate(tick)
+        for frame in range(frames):
+            interpolation.apply(frame/frames)
+            for a, b in zip(*movers): b.set_transform(*a.transform())
+            pixels = []
+            for renderer, surface in zip(renderers, surfaces):
+                drawings = renderer.draw_list()
+                renderer.draw(surface, drawings, (100,100,100), renderer.dirty_rects() if renderer is renderers[0] else None)
+                pixels.append(pygame.surfarray.array3d(surface))
+            versions = [m.version() for m in movers[0]]
+            interpolation.restore()
+            assert [m.version() for m in movers[0]] == versions
+            assert np.array_equal(*pixels), (tick, frame)
+            for a, b in zip(*movers): b.set_transform(*a.transform())
+            same = lambda a, b: tuple(a.bounds()[0]) == tuple(b.bounds()[0]) and a.bounds()[1] == b.bounds()[1]
+            assert all(same(a, b) for a, b in zip(*movers)), (tick, frame) #Back to the same bounds
+    camera, objects, static, animate = _verify_scene() #Put back where the ticks left it
+    for tick in range(ticks):
+        if tick % 3 != 2: animate(tick)
+    expected = [n for o in objects + static for n in o.nodes()]
+    assert all(tuple(a.transform()[0]) == tuple(b.transform()[0]) for a, b in zip(movers[0], expected))
+    for renderer in renderers: renderer.close()
+    print(f'loop: interpolated frames draw the same pixels as moving a copy there ({ticks} ticks of {frames} frames)')
+
+    built, shown = iter(range(5)), []
+    present = lambda frame: (frame, threading.current_thread())
+    loop = FixedStepLoop(lambda: None, lambda: next(built), present, lambda: [],
+                         show = lambda drawn: shown.append((*drawn, threading.current_thread())))
+    for frame in range(5): loop.frame()
+    loop.close()
+    assert [frame for frame, drawing, showing in shown] == list(range(5))
+    assert all(drawing is not showing and showing is threading.main_thread() for frame, drawing, showing in shown)
+    print('loop: every threaded frame is drawn on the presenting thread and shown on the main one')
+
+def verify_profiler(frames: int = 5):
+    '''
+    The profiler's CSV stream against its JSON lines stream: every stage and counter of every frame gets a row,
+      including ones that first show up after the first frame.
+    '''
+    streams = {'json': io.StringIO(), 'csv': io.StringIO()}
+    profilers = [Profiler(stream=stream, stream_format=kind) for kind, stream in streams.items()]
+    for frame in range(frames):
+        for profiler in profilers:
+            with profiler.stage('scene'):
+                pass
+            if frame >= 2:
+                with profiler.stage('occlusion'):
+                    pass
+            profiler.count('faces', frame)
+            if frame % 2: profiler.count('sim ticks', 2)
+            profiler.end_frame()
+    records = [json.loads(line) for line in streams['json'].getvalue().splitlines()]
+    expected = {(r['frame'], name) for r in records for name in r if name != 'frame' and not name.endswith((' p50', ' p90', ' p99'))}
+    rows = list(csv.DictReader(io.StringIO(streams['csv'].getvalue())))
+    assert {(int(row['frame']), row['name']) for row in rows} == expected and len(rows) == len(expected)
+    assert all(float(row['value']) == r for row in rows for r in [records[int(row['frame']) - 1][row['name']]] if row['p50'] == '')
+    print(f'profiler: the CSV stream has every stage and counter the JSON one has ({len(rows)} values)')
+
+def verify_draw_order(faces: int = 2000, frames: int = 6):
+    '''
+    DrawOrder against a plain stable sort, frame after frame with the depths drifting: every face kept once and the
+      same back to front order (the depths are all different, so there's only one), with every face id used once,
+      and with ids repeated (like BSP fragments of one face, or repeated geometry) and faces coming and going.
+    '''
+    rng = np.random.default_rng(0)
+    for repeated in (False, True):
+        draw_order = DrawOrder()
+        ids = rng.integers(0, faces//4, faces) if repeated else rng.permutation(faces)
+        depths = rng.uniform(0, 1000, faces)
+        for frame in range(frames):
+            shown = rng.random(faces) < .9 #Some faces come and go
+            order = draw_order.order(ids[shown], depths[shown])
+            assert np.array_equal(order, np.argsort(-depths[shown], kind='stable')), (repeated, frame)
+            drawings = [[depth, 0, None, face_id] for depth, face_id in zip(depths[shown].tolist(), ids[shown].tolist())]
+            assert draw_order.sort(drawings) == sorted(drawings, key=lambda d: -d[0])
+            depths = depths + rng.normal(0, 5, faces)
+    print(f'draw order: DrawOrder matches a plain sort with unique and repeated face ids ({frames} frames of {faces} faces)')
+
+def verify():
+    '''
+    Runs every check.
+    '''
+    verify_projection()
+    verify_linalg()
+    verify_view_projection()
+    verify_renderer()
+    verify_draw_order()
+    verify_degenerate()
+    verify_loaders()
+    verify_loop()
+    verify_profiler()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Engine benchmarks.')
+    parser.add_argument('benchmark', nargs='?', choices=('linalg', 'vec3', 'matmul', 'scenes', 'bvh', 'sort', 'bsp', 'raster', 'parallel', 'loaders', 'instances', 'freeze', 'shading', 'dirty', 'loop', 'commands', 'edges', 'occlusion', 'verify'), default='scenes')
+    parser.add_argument('--cubes', type=int, nargs='*', default=[10, 100], help='scenes of N cubes')
+    parser.add_argument('--depth', type=int, nargs='*', default=[2, 8], help='scenes of nested Models D deep')
+    parser.add_argument('--triangles', type=int, nargs='*', default=[1000], help='scenes of M triangles')
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--surface', action='store_true', help='also draw onto an offscreen pygame Surface')
+    parser.add_argument('--save', metavar='FILE', help='save the scene results as a JSON baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='compare the scene results against a saved baseline')
+    args = parser.parse_args()
+
+    if args.benchmark == 'linalg':
+        bench_determinant_inverse()
+    elif args.benchmark == 'vec3':
+        bench_vec3()
+    elif args.benchmark == 'matmul':
+        bench_matmul()
+    elif args.benchmark == 'bvh':
+        bench_bvh()
+    elif args.benchmark == 'sort':
+        bench_sort()
+    elif args.benchmark == 'bsp':
+        bench_bsp()
+    elif args.benchmark == 'raster':
+        bench_raster()
+    elif args.benchmark == 'parallel':
+        bench_parallel()
+    elif args.benchmark == 'loaders':
+        bench_loaders()
+    elif args.benchmark == 'instances':
+        bench_instances()
+    elif args.benchmark == 'freeze':
+        bench_freeze()
+    elif args.benchmark == 'shading':
+        bench_shading()
+    elif args.benchmark == 'dirty':
+        bench_dirty()
+    elif args.benchmark == 'loop':
+        bench_loop()
+    elif args.benchmark == 'commands':
+        bench_commands()
+    elif args.benchmark == 'edges':
+        bench_edges()
+    elif args.benchmark == 'occlusion':
+        bench_occlusion()
+    elif args.benchmark == 'verify':
+        verify()
+    else:
+        results = bench_scenes(args.cubes, args.depth, args.triangles, args.frames, args.surface)
+        if args.baseline:
+            with open(args.baseline) as f:
+                print()
+                compare_to_baseline(results, json.load(f))
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=2)
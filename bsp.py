@@ -0,0 +1,305 @@
+from camera import Camera
+from linear_algebra import Vector
+from draw_buffer import DrawBuffer
+import math
+
+import numpy as np
+
+
+class BSPTree:
+    '''
+    Binary space partitioning tree over static geometry (objects that never move), built once from their world
+      space faces. Every node splits space with the plane of one of the faces; faces crossing a plane are cut in two.
+    Walking the tree far side first gives a correct back to front order from any camera position in O(n) (no
+      sorting, and no wrong orders for overlapping faces like sorting by distance can give).
+    The tree is cached, and only rebuilt (on the next draw) if one of the objects does move after all.
+    '''
+    SAMPLES = 8 #Faces tried as the splitting plane at each node
+    SCORED = 200 #Fragments each candidate plane is tried against
+    EPSILON = 1e-6 #Points this close to a plane count as on it
+
+    def __init__(self, objects: list = ()):
+        self._objects = []
+        self._stale = True
+        for o in objects:
+            self.add_object(o)
+
+    def add_object(self, obj):
+        self._objects.append(obj)
+        obj._bounds_listener = self._object_changed
+        self._stale = True
+
+    def objects(self) -> list:
+        return list(self._objects)
+
+    def fragment_count(self) -> int:
+        '''
+        Returns how many faces the tree holds, counting every piece of a cut face.
+        '''
+        if self._stale: self.rebuild()
+        return len(self._starts) - 1
+
+    def rebuild(self):
+        '''
+        Builds the tree from the objects' current world space faces.
+        '''
+        faces = []
+        for o in self._objects:
+            faces.extend(o.world_faces())
+
+        #Fragments: [points, face index]. Faces with no area are dropped, they draw nothing
+        fragments = []
+        face_normals = []
+        for i, face in enumerate(faces):
+            normal = self._normal(face[0])
+            face_normals.append(normal)
+            if normal is not None: fragments.append((face[0], i))
+
+        self._faces = faces
+        self._build(fragments, face_normals)
+        self._stale = False
+
+    def order(self, eye: Vector) -> [int]:
+        '''
+        Returns the fragment indices in back to front order as seen from eye (a point in world space).
+        '''
+        if self._stale: self.rebuild()
+        fronts, backs, node_fragments = self._fronts, self._backs, self._node_fragments
+        if not node_fragments: return []
+        in_front = (self._plane_normals@np.array(tuple(eye), dtype=float) >= self._plane_offsets).tolist() #Which side of every plane eye is on
+
+        returning = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if node < 0: #The node's own fragments, between its two sides
+                returning.extend(node_fragments[~node])
+                continue
+            if in_front[node]: near, far = fronts[node], backs[node]
+            else: near, far = backs[node], fronts[node]
+            if near >= 0: stack.append(near)
+            stack.append(~node)
+            if far >= 0: stack.append(far)
+        return returning
+
+    def draw(self, camera: Camera) -> [('center distance', 'cam location', 'drawing type', 'drawing arguments (ex. list of vectors)', 'face id')]:
+        '''
+        Returns the drawings for every fragment, already in back to front order (like a Model's draw, minus the sort).
+        Off screen fragments, and back facing fragments of faces with cull back, are thrown away before projecting.
+        '''
+        projected = self._project(camera)
+        if projected is None: return []
+        order, starts, lengths, screen, locations, depths, colors = projected
+
+        face_of = self._face_of
+        vertex_depths = depths.tolist()
+        depths = np.maximum.reduceat(depths, starts).tolist()
+        locations = np.maximum.reduceat(locations, starts).tolist()
+        screen = screen.tolist() #[x, y] lists, which pygame takes as points just like Vectors
+        colors = colors.tolist()
+        ends = (starts + lengths).tolist()
+        starts = starts.tolist()
+
+        returning = []
+        for i, fragment in enumerate(order.tolist()):
+            points, color, outline, draw_type, face_id, cull_back = self._faces[face_of[fragment]]
+            returning.append((depths[i], locations[i], draw_type, screen[starts[i]:ends[i]], colors[i], outline, vertex_depths[starts[i]:ends[i]], face_id))
+        return returning
+
+    def draw_into(self, camera: Camera, buffer: DrawBuffer):
+        '''
+        Adds the fragments in front of the screen to a DrawBuffer, as arrays and in back to front order, instead of
+          returning them.
+        '''
+        projected = self._project(camera)
+        if projected is None: return
+        order, starts, lengths, screen, locations, depths, colors = projected
+        buffer.add_faces(np.maximum.reduceat(depths, starts), self._draw_types[order], screen, depths, lengths, colors,
+                         self._outlines[order], self._face_ids[order], keep = np.maximum.reduceat(locations, starts) == Camera.IN_FRONT)
+
+    #Private methods
+    def _project(self, camera: Camera) -> ('fragments', 'starts', 'lengths', '(P,2) screen points', '(P,) locations', '(P,) depths', '(M,4) colors'):
+        '''
+        Puts the fragments in back to front order, culls, projects and shades them. Returns the fragments left (in
+          order), where each one's points start and how many there are, every one of their points projected and their
+          shaded colors. None if none are left.
+        '''
+        if self._stale: self.rebuild()
+        if len(self._starts) == 1: return None
+
+        with camera.profiler.stage('bsp'):
+            order = np.array(self.order(camera.location()), dtype=np.intp)
+
+        eye = np.array(tuple(camera.location()), dtype=float)
+        cam_to_center = self._centers[order] - eye
+        normals = self._fragment_normals[order]
+
+        #Off screen fragments, and back facing ones of faces with cull back
+        keep = camera.spheres_visible(self._centers[order], self._radii[order])
+        keep &= ~self._cull_back[order] | (np.einsum('ij,ij->i', normals, cam_to_center) > 0)
+        camera.culled_faces += len(order) - int(keep.sum())
+        occluded = keep & camera.spheres_occluded(self._centers[order], self._radii[order])
+        camera.occluded_faces += int(occluded.sum())
+        keep &= ~occluded
+        if not keep.all():
+            order, cam_to_center, normals = order[keep], cam_to_center[keep], normals[keep]
+            if len(order) == 0: return None
+
+        #Only project the kept fragments' points, one after the other
+        with camera.profiler.stage('project'):
+            lengths = self._lengths[order]
+            starts = np.cumsum(lengths) - lengths
+            screen, locations, depths = camera.project_many(self._vertices[np.repeat(self._starts_array[order] - starts, lengths) + np.arange(lengths.sum())])
+
+        with camera.profiler.stage('shade'):
+            colors = camera.lighting.shade(normals, cam_to_center, self._colors[order])
+
+        return order, starts, lengths, screen, locations, depths, colors
+
+    def _object_changed(self, obj):
+        self._stale = True
+
+    def _build(self, fragments: list, face_normals: list):
+        '''
+        Builds the node arrays, going through the nodes with a stack instead of recursion (the tree can get deep).
+        '''
+        self._normals = [] #Per node: unit plane normal and offset (plane is normal.p = offset)
+        self._offsets = []
+        self._fronts = [] #Per node: child node index, -1 if none
+        self._backs = []
+        self._node_fragments = [] #Per node: indices of the fragments lying in its plane
+
+        all_points = [] #Per fragment
+        face_of = []
+
+        work = [(fragments, -1, False)] if fragments else []
+        while work:
+            fragments, parent, is_front = work.pop()
+            node = len(self._normals)
+            if parent >= 0:
+                if is_front: self._fronts[parent] = node
+                else: self._backs[parent] = node
+
+            chosen = self._choose_plane(fragments, face_normals)
+            normal = face_normals[fragments[chosen][1]]
+            offset = self._offset(fragments[chosen][0], normal)
+            front, back, on = [], [], []
+            for i, fragment in enumerate(fragments):
+                side, pieces = self._split(fragment[0], normal, offset)
+                if side == 0 or i == chosen: on.append(fragment) #The chosen one always stays, even if it isn't quite flat
+                elif side == 1: front.append(fragment)
+                elif side == -1: back.append(fragment)
+                else:
+                    front.append((pieces[0], fragment[1]))
+                    back.append((pieces[1], fragment[1]))
+
+            self._normals.append(normal)
+            self._offsets.append(offset)
+            self._fronts.append(-1)
+            self._backs.append(-1)
+            self._node_fragments.append(list(range(len(all_points), len(all_points) + len(on))))
+            for points, face in on:
+                all_points.append(points)
+                face_of.append(face)
+
+            if back: work.append((back, node, False))
+            if front: work.append((front, node, True))
+
+        self._plane_normals = np.array(self._normals, dtype=float).reshape(-1, 3)
+        self._plane_offsets = np.array(self._offsets, dtype=float)
+
+        #Flat arrays for drawing, every fragment's points one after the other
+        lengths = [len(points) for points in all_points]
+        self._starts = [0] + np.cumsum(lengths, dtype=np.intp).tolist()
+        self._starts_array = np.array(self._starts[:-1], dtype=np.intp)
+        self._lengths = np.array(lengths, dtype=np.intp)
+        self._vertices = np.array([p for points in all_points for p in points], dtype=float).reshape(-1, 3)
+        self._face_of = face_of
+        self._centers = np.array([np.mean(points, axis=0) for points in all_points], dtype=float).reshape(-1, 3)
+        self._radii = np.array([np.linalg.norm(np.array(points) - center, axis=1).max() for points, center in zip(all_points, self._centers)])
+        #Cut pieces keep the original face's normal (same plane, same winding)
+        self._fragment_normals = np.array([face_normals[face] for face in face_of], dtype=float).reshape(-1, 3)
+        self._cull_back = np.array([self._faces[face][5] for face in face_of], dtype=bool)
+        self._colors = np.array([(0,0,0,255) if color == None else (*color[:3], color[3] if len(color) > 3 else 255)
+                                    for color in (self._faces[face][1] for face in face_of)], dtype=float).reshape(-1, 4)
+        self._draw_types = np.array([self._faces[face][3] for face in face_of], dtype=np.int8)
+        self._outlines = np.array([DrawBuffer.NO_COLOR if outline == None else (*outline[:3], outline[3] if len(outline) > 3 else 255)
+                                    for outline in (self._faces[face][2] for face in face_of)], dtype=float).reshape(-1, 4)
+        self._face_ids = np.array([self._faces[face][4] for face in face_of], dtype=np.int64)
+
+    def _choose_plane(self, fragments: list, face_normals: list) -> int:
+        '''
+        Tries the planes of a few fragments spread through the list, and returns the index of the one cutting the
+          fewest fragments (ties go to the most even split).
+        '''
+        if len(fragments) <= 2: return 0
+        step = max(1, len(fragments)//self.SAMPLES)
+        others = fragments[::max(1, len(fragments)//self.SCORED)] #Scoring against a spread out few is close enough
+        best = None
+        for i in range(0, len(fragments), step)[:self.SAMPLES]:
+            points, face = fragments[i]
+            normal = face_normals[face]
+            offset = self._offset(points, normal)
+            splits = balance = 0
+            for other in others:
+                side = self._side(other[0], normal, offset)
+                if side == 2: splits += 1
+                else: balance += side
+            score = (splits, abs(balance))
+            if best is None or score < best[0]:
+                best = (score, i)
+        return best[1]
+
+    @staticmethod
+    def _offset(points: list, normal: (float, float, float)) -> float:
+        return normal[0]*points[0][0] + normal[1]*points[0][1] + normal[2]*points[0][2]
+
+    @classmethod
+    def _side(cls, points: list, normal: (float, float, float), offset: float) -> int:
+        '''
+        Returns 1 if the points are in front of the plane, -1 if behind, 0 if on it and 2 if on both sides.
+        '''
+        front = back = False
+        for p in points:
+            d = normal[0]*p[0] + normal[1]*p[1] + normal[2]*p[2] - offset
+            if d > cls.EPSILON: front = True
+            elif d < -cls.EPSILON: back = True
+        if front and back: return 2
+        return 1 if front else (-1 if back else 0)
+
+    @classmethod
+    def _split(cls, points: list, normal: (float, float, float), offset: float) -> (int, ([tuple], [tuple])):
+        '''
+        Returns which side of the plane the polygon is on (like _side), and if it's on both, the front and back pieces.
+        '''
+        distances = [normal[0]*p[0] + normal[1]*p[1] + normal[2]*p[2] - offset for p in points]
+        front = any(d > cls.EPSILON for d in distances)
+        back = any(d < -cls.EPSILON for d in distances)
+        if not (front and back):
+            return (1 if front else (-1 if back else 0)), None
+
+        front_points, back_points = [], []
+        for i, p in enumerate(points):
+            q = points[(i+1) % len(points)]
+            dp, dq = distances[i], distances[(i+1) % len(points)]
+            if dp >= -cls.EPSILON: front_points.append(p)
+            if dp <= cls.EPSILON: back_points.append(p)
+            if (dp > cls.EPSILON and dq < -cls.EPSILON) or (dp < -cls.EPSILON and dq > cls.EPSILON): #Edge crosses the plane
+                t = dp/(dp - dq)
+                crossing = (p[0] + (q[0]-p[0])*t, p[1] + (q[1]-p[1])*t, p[2] + (q[2]-p[2])*t)
+                front_points.append(crossing)
+                back_points.append(crossing)
+        return 2, (front_points, back_points)
+
+    @staticmethod
+    def _normal(points: list) -> (float, float, float):
+        '''
+        Returns the unit normal of a face (same winding as the shapes use), None if it has no area.
+        '''
+        p1, p2, p3 = points[0], points[1], points[2]
+        a = (p2[0]-p1[0], p2[1]-p1[1], p2[2]-p1[2])
+        b = (p3[0]-p2[0], p3[1]-p2[1], p3[2]-p2[2])
+        n = (a[1]*b[2] - a[2]*b[1], a[2]*b[0] - a[0]*b[2], a[0]*b[1] - a[1]*b[0])
+        length = math.sqrt(n[0]*n[0] + n[1]*n[1] + n[2]*n[2])
+        if length == 0: return None
+        return (n[0]/length, n[1]/length, n[2]/length)
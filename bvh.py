@@ -0,0 +1,190 @@
+from linear_algebra import Vec3
+import math
+
+import numpy as np
+
+
+class _BVHNode:
+    __slots__ = ('low', 'high', 'left', 'right', 'parent', 'objects')
+
+    def __init__(self, parent: '_BVHNode' = None):
+        self.low = None #Box corners, [x, y, z] lists
+        self.high = None
+        self.left = None
+        self.right = None
+        self.parent = parent
+        self.objects = None #List of objects for leaves, None for inner nodes
+
+
+class BVH:
+    '''
+    Bounding volume hierarchy (a binary tree of boxes) over top level Models/shapes, using their world bounding spheres.
+    query(camera) walks down the tree and skips every box the camera can't see, so finding what to draw costs about
+      the number of visible objects (plus a log factor) instead of the number of objects.
+    When an object moves/rotates (or anything inside it does), it tells the BVH, and the next query refits only the
+      boxes from its leaf up to the root. After lots of movement the boxes get loose, rebuild() fixes that.
+    '''
+    LEAF_SIZE = 4
+
+    def __init__(self, objects: list = ()):
+        self._root = None
+        self._leaf_of = {} #id(object) -> leaf
+        self._dirty = set() #Leaves whose objects moved
+        self._count = 0
+        self.rebuild(objects)
+
+    def __len__(self):
+        return self._count
+
+    def rebuild(self, objects: list = None):
+        '''
+        Builds the tree from scratch (from the current objects if none are given), splitting at the median
+          along the longest axis.
+        '''
+        if objects is None: objects = self.objects()
+        objects = list(objects)
+        for leaf in set(self._leaf_of.values()):
+            for o in leaf.objects: o._bounds_listener = None
+        self._leaf_of = {}
+        self._dirty = set()
+        self._count = len(objects)
+        if not objects:
+            self._root = None
+            return
+
+        spheres = [o.world_bounds() for o in objects]
+        centers = np.array([tuple(c) for c, r in spheres], dtype=float)
+        radii = np.array([r for c, r in spheres], dtype=float)
+        self._root = self._build(objects, centers, radii, np.arange(len(objects)), None)
+
+    def objects(self) -> list:
+        '''
+        Returns every object in the tree.
+        '''
+        returning = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            if node.objects is not None: returning.extend(node.objects)
+            else: stack.extend((node.right, node.left))
+        return returning
+
+    def insert(self, obj):
+        '''
+        Adds an object, going down towards the child whose box grows the least.
+        '''
+        self._count += 1
+        if self._root is None:
+            self._root = _BVHNode()
+            self._root.objects = []
+            self._add_to_leaf(self._root, obj)
+            self._refit(self._root, force=True)
+            return
+
+        low, high = self._object_box(obj)
+        node = self._root
+        while node.objects is None:
+            node = min((node.left, node.right), key=lambda child: self._growth(child, low, high))
+        self._add_to_leaf(node, obj)
+        if len(node.objects) > self.LEAF_SIZE*2: #Split the leaf in two
+            objects = node.objects
+            spheres = [o.world_bounds() for o in objects]
+            centers = np.array([tuple(c) for c, r in spheres], dtype=float)
+            radii = np.array([r for c, r in spheres], dtype=float)
+            replacement = self._build(objects, centers, radii, np.arange(len(objects)), node.parent)
+            self._replace(node, replacement)
+            self._dirty.discard(node)
+            node = replacement
+        self._refit(node, force=True)
+
+    def query(self, camera) -> list:
+        '''
+        Refits anything that moved, then returns every object whose box the camera might see.
+        '''
+        self.refit()
+        returning = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            center = Vec3((node.low[0]+node.high[0])/2, (node.low[1]+node.high[1])/2, (node.low[2]+node.high[2])/2)
+            radius = math.sqrt(sum((node.high[i]-node.low[i])**2 for i in range(3)))/2
+            if not camera.sphere_visible(center, radius):
+                continue
+            if node.objects is not None: returning.extend(node.objects)
+            else: stack.extend((node.right, node.left))
+        return returning
+
+    def refit(self):
+        '''
+        Updates the boxes of every leaf that had an object move, and their parents.
+        '''
+        for leaf in self._dirty:
+            self._refit(leaf)
+        self._dirty.clear()
+
+    #Private methods
+    def _build(self, objects: list, centers: 'np.ndarray', radii: 'np.ndarray', indices: 'np.ndarray', parent: _BVHNode) -> _BVHNode:
+        node = _BVHNode(parent)
+        low = (centers[indices] - radii[indices,None]).min(axis=0)
+        high = (centers[indices] + radii[indices,None]).max(axis=0)
+        node.low, node.high = low.tolist(), high.tolist()
+
+        if len(indices) <= self.LEAF_SIZE:
+            node.objects = []
+            for i in indices.tolist():
+                self._add_to_leaf(node, objects[i])
+            return node
+
+        axis = int(np.argmax(high - low))
+        order = indices[np.argsort(centers[indices, axis], kind='stable')]
+        half = len(order)//2
+        node.left = self._build(objects, centers, radii, order[:half], node)
+        node.right = self._build(objects, centers, radii, order[half:], node)
+        return node
+
+    def _add_to_leaf(self, leaf: _BVHNode, obj):
+        leaf.objects.append(obj)
+        self._leaf_of[id(obj)] = leaf
+        obj._bounds_listener = self._object_changed
+
+    def _object_changed(self, obj):
+        self._dirty.add(self._leaf_of[id(obj)])
+
+    def _replace(self, old: _BVHNode, new: _BVHNode):
+        if old.parent is None: self._root = new
+        elif old.parent.left is old: old.parent.left = new
+        else: old.parent.right = new
+
+    def _refit(self, node: _BVHNode, force: bool = False):
+        '''
+        Recomputes node's box, then its parents' boxes until one doesn't change (or all the way up with force).
+        '''
+        while node is not None:
+            if node.objects is not None:
+                boxes = [self._object_box(o) for o in node.objects]
+                low = [min(b[0][i] for b in boxes) for i in range(3)]
+                high = [max(b[1][i] for b in boxes) for i in range(3)]
+            else:
+                left, right = node.left, node.right
+                low = [min(left.low[0], right.low[0]), min(left.low[1], right.low[1]), min(left.low[2], right.low[2])]
+                high = [max(left.high[0], right.high[0]), max(left.high[1], right.high[1]), max(left.high[2], right.high[2])]
+            if low == node.low and high == node.high and not force: return
+            node.low, node.high = low, high
+            node = node.parent
+
+    @staticmethod
+    def _object_box(obj) -> ([float], [float]):
+        center, radius = obj.world_bounds()
+        return [center[i]-radius for i in range(3)], [center[i]+radius for i in range(3)]
+
+    @staticmethod
+    def _growth(node: _BVHNode, low: [float], high: [float]) -> float:
+        '''
+        How much the node's box volume grows if the box low-high is added to it.
+        '''
+        before = 1
+        after = 1
+        for i in range(3):
+            before *= node.high[i] - node.low[i]
+            after *= max(node.high[i], high[i]) - min(node.low[i], low[i])
+        return after - before
@@ -1,7 +1,11 @@
-from linear_algebra import Vector
+from linear_algebra import Vector, Vec3, Matrix
 from rotation import Rotation
+from profiler import Profiler
+from lighting import Lighting
 import math
 
+import numpy as np
+
 _DEFAULT_FOCUS = (0,0,-100)
 _DEFAULT_LOCATION = (0,0,-10)
 _DEFAULT_FOV = 70
@@ -15,6 +19,8 @@ class Camera:
         Find where on x,y plane the line between the target vector and focus (not the same as location) land.
     Screen size & FOV will only be considered if screen size is set. If so, will convert the 2D coordinate
     to being on a traditional XY plane and also do FOV things. Very important for looking good.
+    All of that is kept as one 4x4 view projection matrix (see view_projection), rebuilt only when the camera
+      changes, so projecting a point is one (x, y, z, 1)*matrix and a divide.
     '''
     IN_FRONT = 0 #In front of screen
     BETWEEN = 1 #Between screen and focus
@@ -22,54 +28,158 @@ class Camera:
 
     def __init__(self, location: Vector = Vector(*_DEFAULT_LOCATION), focus: Vector = Vector(*_DEFAULT_FOCUS),
                         rotation: Rotation = Rotation(0,0,0),
-                        screen_size: (int, int) = None, fov = _DEFAULT_FOV):
+                        screen_size: (int, int) = None, fov = _DEFAULT_FOV, lighting: Lighting = None):
         assert location.dimension() == 3
         assert focus.dimension() == 3
-        self._loc = location
-        self._focus = focus
+        self._loc = Vec3(*location)
+        self._focus = Vec3(*focus)
         self._rot = rotation
 
         self._screen = screen_size
         self._fov = fov
+        self.lighting = lighting if lighting != None else Lighting() #How the shapes shade what this camera sees
+
+        self._version = 0 #Goes up whenever what the camera sees could change, see version
+        self._view_projection = None
+        self._view_projection_version = None #The version it was built at
+
+        self.occlusion = None #An OcclusionBuffer hiding what's behind big objects (see occluded), set by the Renderer
+
+        #Stats for the current frame, see reset_stats
+        self.culled_faces = 0
+        self.occluded_faces = 0
+        self.projected_vertices = 0
+        self.profiler = Profiler(enabled=False) #Shapes time their projection/shading with this
 
     def __call__(self, v: Vector) -> '2D Vector':
         '''
         The brains of the operation B)
+        Returns where v lands on the screen, where it is (IN_FRONT, BETWEEN or BEHIND) and its depth.
         '''
         assert v.dimension() == 3
-        trans_v = v - self._loc #Move it relative to the screen's location
-        trans_v = self._rot/trans_v #Rotate it (inverse)
-        trans_v = trans_v + self._focus
-
-        if trans_v[2] <= self._focus[2]: return Vector(0,0), self.BEHIND, trans_v[2]
-
-        intersection_finder = trans_v - self._focus #Vector from focus to translated vector
-        #Now, intersection is when z=0, and z=0 at -self._focus[z]/intersection_finder[z]
-        fraction = (-self._focus[2])/intersection_finder[2]
-        returning = Vector(fraction*intersection_finder[0], fraction*intersection_finder[1])
-
-        #FOV Stuffs
-        if self._screen != None:
-            '''
-            This will flip the image upside down and move the coordinate so its centered around the vertex,
-            default being the middle of the window. (Like an x,y plane).
-            The fov will basically place a fovxfov size box and only include whats in that in the final result
-            as it will scale everything else out (IT FINALLY WORKS FOV WAS THE TRICK YES!!!!)
-            '''
-            fov_mult = min(self._screen[0], self._screen[1])/self._fov
+        self.projected_vertices += 1
+        m = self.view_projection().values()
+        x, y, z = v[0], v[1], v[2]
+        w = x*m[3] + y*m[7] + z*m[11] + m[15] #Distance in front of the focus
+        depth = x*m[2] + y*m[6] + z*m[10] + m[14]
 
-            #Will make origin (0,0) middle of screen
-            returning = Vector((returning[0]*fov_mult)+(self._screen[0]/2), (self._screen[1]/2)-(returning[1]*fov_mult))
+        if w <= 0: return Vector(0,0), self.BEHIND, depth
+        returning = Vector((x*m[0] + y*m[4] + z*m[8] + m[12])/w, (x*m[1] + y*m[5] + z*m[9] + m[13])/w)
 
-        if trans_v[2] <= 0: return returning, self.BETWEEN, trans_v[2]
-        return returning, self.IN_FRONT, trans_v[2]
+        if depth <= 0: return returning, self.BETWEEN, depth
+        return returning, self.IN_FRONT, depth
         #Where the v vector is relative to focus and screen
 
+    def project_many(self, points) -> ('(N,2) screen coordinates', '(N,) locations', '(N,) depths'):
+        '''
+        Same as calling the camera on every point, but for an (N,3) array of points all at once.
+        Returns an (N,2) array of 2D points, an (N,) array of IN_FRONT/BETWEEN/BEHIND and an (N,) array
+        of depths. Does the exact same float operations in the same order as __call__, so the results match.
+        '''
+        points = np.asarray(points, dtype=float)
+        assert points.ndim == 2 and points.shape[1] == 3
+        self.projected_vertices += len(points)
+
+        m = self.view_projection().values()
+        x, y, z = points[:,0], points[:,1], points[:,2]
+        w = x*m[3] + y*m[7] + z*m[11] + m[15]
+        depths = x*m[2] + y*m[6] + z*m[10] + m[14]
+
+        behind = w <= 0
+        with np.errstate(divide='ignore', invalid='ignore'): #Points behind get thrown out anyway
+            screen = np.stack(((x*m[0] + y*m[4] + z*m[8] + m[12])/w, (x*m[1] + y*m[5] + z*m[9] + m[13])/w), axis=1)
+        screen[behind] = 0
+
+        locations = np.where(depths <= 0, self.BETWEEN, self.IN_FRONT).astype(np.int8)
+        locations[behind] = self.BEHIND
+
+        return screen, locations, depths
+
+    def view_projection(self) -> Matrix:
+        '''
+        Returns the 4x4 matrix taking world points (x, y, z, 1) to (x*w, y*w, depth, w) (multiplied on the left, like
+          Node's matrices): divide x and y by w for the point on the screen. w is how far in front of the focus the
+          point is (behind it if w <= 0), and depth is how far in front of the screen (between it and the focus if
+          depth <= 0). Chain it after a node's world matrix (world@view_projection) to project straight from the
+          node's own space. Rebuilt only when the camera changes.
+        '''
+        if self._view_projection_version != self._version:
+            self._view_projection = self._build_view_projection()
+            self._view_projection_version = self._version
+        return self._view_projection
+
+    def sphere_visible(self, center: Vector, radius: float) -> bool:
+        '''
+        Returns False if a sphere (in world space) is certainly not drawn: completely on the focus side of the
+          screen (where faces never count as IN_FRONT), or, if the screen size is set, completely off the
+          left/right/top/bottom of the screen.
+        '''
+        p = self._rot/(Vec3(*center) - self._loc) #Where the center is relative to the focus
+        near = -self._focus[2]
+        if p.z + radius <= near: return False
+        if self._screen == None or near <= 0: return True
+
+        #Screen x = near*x/z*fov_mult + width/2, so the sides of the view are at x = +-k*z
+        fov_mult = min(self._screen[0], self._screen[1])/self._fov
+        for k, side in ((self._screen[0]/2/(near*fov_mult), p.x), (self._screen[1]/2/(near*fov_mult), p.y)):
+            limit = radius*math.sqrt(1 + k*k) #Distance to the side planes, scaled like abs(side) - k*z
+            if abs(side) - k*p.z > limit: return False
+        return True
+
+    def spheres_visible(self, centers, radii) -> 'np.ndarray':
+        '''
+        sphere_visible for an (N,3) array of centers and (N,) array of radii all at once, returns an (N,) bool array.
+        '''
+        centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        radii = np.asarray(radii, dtype=float)
+        inv = self._rot.inverse_matrix().array()
+        p = (centers - np.array(tuple(self._loc), dtype=float))@inv
+        near = -self._focus[2]
+        visible = p[:,2] + radii > near
+        if self._screen == None or near <= 0: return visible
+
+        fov_mult = min(self._screen[0], self._screen[1])/self._fov
+        for k, side in ((self._screen[0]/2/(near*fov_mult), p[:,0]), (self._screen[1]/2/(near*fov_mult), p[:,1])):
+            visible &= np.abs(side) - k*p[:,2] <= radii*math.sqrt(1 + k*k)
+        return visible
+
+    def occluded(self, center: Vector, radius: float) -> bool:
+        '''
+        Returns True if a sphere (in world space) is certainly hidden behind the occlusion buffer's occluders (see
+          OcclusionBuffer), always False without one. Shapes check this after sphere_visible, and count the faces
+          they skip because of it in occluded_faces.
+        '''
+        return self.occlusion != None and self.occlusion.occluded(center, radius)
+
+    def spheres_occluded(self, centers, radii) -> 'np.ndarray':
+        '''
+        occluded for an (N,3) array of centers and (N,) array of radii all at once, returns an (N,) bool array.
+        '''
+        if self.occlusion == None: return np.zeros(len(np.asarray(centers).reshape(-1, 3)), dtype=bool)
+        return self.occlusion.spheres_occluded(centers, radii)
+
+    def settings(self) -> dict:
+        '''
+        Returns the arguments for making a camera that sees the same thing, Camera(**camera.settings()).
+          Leaves out the stats and profiler, so it can be pickled (see ScenePool).
+        '''
+        return {'location': Vector(*self._loc), 'focus': Vector(*self._focus), 'rotation': self._rot,
+                'screen_size': self._screen, 'fov': self._fov, 'lighting': self.lighting}
+
+    def reset_stats(self):
+        '''
+        Resets the per frame stats (culled_faces, occluded_faces, projected_vertices), call this at the start of each frame.
+        '''
+        self.culled_faces = 0
+        self.occluded_faces = 0
+        self.projected_vertices = 0
+
     def move_focus(self, v: Vector):
         '''
         This will just make the camera look funny - mainly for experimental purposes.
         '''
         self._focus += v
+        self._version += 1
 
     def move(self, v: Vector):
         '''
@@ -77,6 +187,7 @@ class Camera:
         '''
         v = self._rot*v
         self._loc += v
+        self._version += 1
 
     def rotate(self, r: Rotation):
         '''
@@ -84,6 +195,27 @@ class Camera:
         '''
         self._rot += r
         self._rot[0] = max(-math.pi/2, min(math.pi/2, self._rot[0]))
+        self._version += 1
+
+    def location(self) -> Vec3:
+        '''
+        Returns where the camera is in 3D space.
+        '''
+        return self._loc
+
+    def transform(self) -> (Vec3, Rotation):
+        '''
+        Returns the camera's location and rotation (like a Node's).
+        '''
+        return self._loc, self._rot
+
+    def set_transform(self, location: Vector, rotation: Rotation):
+        '''
+        Moves and rotates the camera to the given location and rotation (not relative to the current ones).
+        '''
+        self._loc = Vec3(*location)
+        self._rot = rotation
+        self._version += 1
 
     def focus_to(self, v: Vector) -> Vector:
         '''
@@ -96,6 +228,43 @@ class Camera:
         For when you change the screen size.
         '''
         self._screen = screen_size
+        self._version += 1
+
+    def screen_size(self) -> (int, int):
+        return self._screen
+
+    def fov(self) -> float:
+        return self._fov
+
+    def set_fov(self, fov: float):
+        self._fov = fov
+        self._version += 1
+
+    def version(self) -> int:
+        '''
+        Returns a number that goes up every time the camera moves, rotates, is resized or changes fov, so if it's
+          the same as before (and the scene's versions are too) the frame would come out the same.
+        '''
+        return self._version
+
+    #Private methods
+    def _build_view_projection(self) -> Matrix:
+        '''
+        Moving the point relative to the camera and rotating it (inverse) is one affine matrix, giving the point
+          relative to the focus. It lands on the screen at -focus z/z of its x and y, which the projection does with
+          w = z, and its depth is z + focus z. The fov and screen size then scale, flip and center it.
+        '''
+        view = Matrix.affine(self._rot.inverse_matrix(), Vec3(0,0,0) - self._rot/self._loc) #(v - location) rotated (inverse)
+        focus = self._focus[2]
+        scale_x, scale_y, center_x, center_y = -focus, -focus, 0, 0
+        if self._screen != None: #Origin (0,0) in the middle of the screen, y going down
+            fov_mult = min(self._screen[0], self._screen[1])/self._fov
+            scale_x, scale_y, center_x, center_y = -focus*fov_mult, focus*fov_mult, self._screen[0]/2, self._screen[1]/2
+        projection = Matrix._flat([scale_x,    0,          0,          0,
+                                   0,          scale_y,    0,          0,
+                                   center_x,   center_y,   1,          1,
+                                   0,          0,          focus,      0], 4, 4)
+        return view@projection
 
 
 if __name__ == '__main__':
@@ -107,5 +276,7 @@ if __name__ == '__main__':
     print(c(Vector(1,1,100))) #(.5,.5)
     print(c(Vector(2,1,100))) #(1,.5)
 
+    print(c.project_many([(1,1,0), (1,1,100), (2,1,100)]))
+
     
 
@@ -0,0 +1,236 @@
+import numpy as np
+
+
+class DrawBuffer:
+    '''
+    A frame's faces as flat arrays instead of a draw list of nested lists. Per face: its depth, drawing type, where
+      its points start in the shared point arrays and how many there are, fill and outline color (RGBA, uint8) and
+      face id. Per point: its screen position and depth.
+    The arrays are allocated once and reused every frame (clear keeps them, they only grow when a frame has more
+      faces or points than any before), and faces are written straight into them: one at a time with add, or a whole
+      array of them at once with add_faces (which is what Meshes, frozen Models and BSP trees do).
+    Sorting doesn't move any faces, it only keeps the order to draw them in (see sort and order).
+    A missing (None) color is stored as NO_COLOR.
+    '''
+    FACES = 1024 #Starting capacity
+    POINTS = 4096
+    NO_COLOR = (0,0,0,255)
+
+    def __init__(self, faces: int = FACES, points: int = POINTS):
+        self._count = 0
+        self._point_count = 0
+        self._order = None
+        self.grown = 0 #How many times the arrays had to grow
+        self._allocate(max(1, faces), max(1, points))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def point_count(self) -> int:
+        return self._point_count
+
+    def clear(self):
+        '''
+        Empties the buffer for the next frame (keeping the arrays).
+        '''
+        self._count = 0
+        self._point_count = 0
+        self._order = None
+
+    def add(self, depth: float, draw_type: int, points: ['2D point'], fill, outline, point_depths: [float], face_id: int) -> int:
+        '''
+        Adds one face (the same things a draw list entry has), returns its index.
+        '''
+        i, p, count = self._count, self._point_count, len(points)
+        self._reserve(1, count)
+        self._depths[i] = depth
+        self._types[i] = draw_type
+        self._starts[i] = p
+        self._lengths[i] = count
+        self._fills[i] = self._color(fill)
+        self._outlines[i] = self._color(outline)
+        self._face_ids[i] = face_id
+        self._points[p:p + count] = [(point[0], point[1]) for point in points]
+        self._point_depths[p:p + count] = point_depths
+        self._count += 1
+        self._point_count += count
+        self._order = None
+        return i
+
+    def add_faces(self, depths, draw_types, points, point_depths, lengths, fills, outlines, face_ids, keep = None):
+        '''
+        Adds M faces at once: (M,) depths and face ids, the (P,2) points and (P,) point depths of every face one after
+          the other, and each face's point count, (M,) or one for all. draw_types is an (M,) array or one for all, fills
+          and outlines are (M,3) or (M,4) arrays, or one color (a tuple, or None) for all. With keep, an (M,) bool
+          array, only those faces are added.
+        '''
+        depths = np.asarray(depths, dtype=float)
+        lengths = np.broadcast_to(np.asarray(lengths, dtype=np.intp), depths.shape)
+        if keep is not None:
+            keep = np.asarray(keep, dtype=bool)
+            if not keep.all():
+                points, point_depths = points[np.repeat(keep, lengths)], point_depths[np.repeat(keep, lengths)]
+                depths, lengths, face_ids = depths[keep], lengths[keep], np.asarray(face_ids)[keep]
+                draw_types, fills, outlines = [self._pick(values, keep) for values in (draw_types, fills, outlines)]
+        count, point_count = len(depths), len(points)
+        if count == 0: return
+        self._reserve(count, point_count)
+
+        i, p = self._count, self._point_count
+        faces = slice(i, i + count)
+        self._depths[faces] = depths
+        self._types[faces] = draw_types
+        self._starts[faces] = p + np.cumsum(lengths) - lengths
+        self._lengths[faces] = lengths
+        self._fills[faces] = self._colors(fills)
+        self._outlines[faces] = self._colors(outlines)
+        self._face_ids[faces] = face_ids
+        self._points[p:p + point_count] = points
+        self._point_depths[p:p + point_count] = point_depths
+        self._count += count
+        self._point_count += point_count
+        self._order = None
+
+    def add_drawings(self, drawings: list, fills = None):
+        '''
+        Adds shape drawings (what BaseObject.draw gives) all at once, with fills ((M,3) or (M,4) array) instead of
+          their own colors if given.
+        '''
+        if not drawings: return
+        points = np.array([(point[0], point[1]) for d in drawings for point in d[3]], dtype=float).reshape(-1, 2)
+        point_depths = np.array([depth for d in drawings for depth in d[6]], dtype=float)
+        if fills is None: fills = self._color_list([d[4] for d in drawings])
+        self.add_faces([d[0] for d in drawings], np.array([d[2] for d in drawings]), points, point_depths,
+                       [len(d[3]) for d in drawings], fills, self._color_list([d[5] for d in drawings]), [d[7] for d in drawings])
+
+    def sort(self, draw_order = None):
+        '''
+        Puts the faces in back to front order (largest depth first, faces at the same depth keep the order they were
+          added in), through a DrawOrder if given (see DrawOrder.order).
+        '''
+        if draw_order != None:
+            self._order = draw_order.order(self.face_ids(), self.depths())
+        else:
+            self._order = np.argsort(-self.depths(), kind='stable')
+
+    def set_order(self, order):
+        '''
+        Sets the order to draw the faces in (an array of face indices).
+        '''
+        self._order = np.asarray(order, dtype=np.intp)
+
+    def order(self) -> 'np.ndarray':
+        '''
+        Returns the face indices in drawing order (the order they were added in if never sorted).
+        '''
+        if self._order is None: return np.arange(self._count)
+        return self._order
+
+    #The arrays (not copies), only as long as what's in the buffer
+    def depths(self) -> 'np.ndarray':
+        return self._depths[:self._count]
+
+    def draw_types(self) -> 'np.ndarray':
+        return self._types[:self._count]
+
+    def starts(self) -> 'np.ndarray':
+        return self._starts[:self._count]
+
+    def lengths(self) -> 'np.ndarray':
+        return self._lengths[:self._count]
+
+    def fills(self) -> 'np.ndarray':
+        return self._fills[:self._count]
+
+    def outlines(self) -> 'np.ndarray':
+        return self._outlines[:self._count]
+
+    def face_ids(self) -> 'np.ndarray':
+        return self._face_ids[:self._count]
+
+    def points(self) -> 'np.ndarray':
+        return self._points[:self._point_count]
+
+    def point_depths(self) -> 'np.ndarray':
+        return self._point_depths[:self._point_count]
+
+    def nbytes(self) -> int:
+        '''
+        Returns how much memory the arrays take (their whole capacity).
+        '''
+        return sum(a.nbytes for a in (self._depths, self._types, self._starts, self._lengths, self._fills, self._outlines,
+                                      self._face_ids, self._points, self._point_depths))
+
+    def drawings(self) -> [['distance', 'drawing type', 'drawing arguments']]:
+        '''
+        Returns the faces as a draw list, in drawing order.
+        '''
+        depths, types, fills, outlines = self.depths().tolist(), self.draw_types().tolist(), self.fills().tolist(), self.outlines().tolist()
+        starts, lengths, face_ids = self.starts().tolist(), self.lengths().tolist(), self.face_ids().tolist()
+        points, point_depths = self.points().tolist(), self.point_depths().tolist()
+        fill_types, outline_types = (0, 2), (1, 2, 4, 5) #FILL/FILL_OUTLINE, OUTLINE/FILL_OUTLINE and their EDGES (see BaseObject)
+        return [[depths[i], types[i], [points[starts[i]:starts[i] + lengths[i]], fills[i] if types[i] in fill_types else None,
+                                       outlines[i] if types[i] in outline_types else None,
+                                       point_depths[starts[i]:starts[i] + lengths[i]]], face_ids[i]]
+                    for i in self.order().tolist()]
+
+    #Private methods
+    def _allocate(self, faces: int, points: int):
+        self._depths = np.zeros(faces)
+        self._types = np.zeros(faces, dtype=np.int8)
+        self._starts = np.zeros(faces, dtype=np.intp)
+        self._lengths = np.zeros(faces, dtype=np.intp)
+        self._fills = np.zeros((faces, 4), dtype=np.uint8)
+        self._outlines = np.zeros((faces, 4), dtype=np.uint8)
+        self._face_ids = np.zeros(faces, dtype=np.int64)
+        self._points = np.zeros((points, 2))
+        self._point_depths = np.zeros(points)
+
+    def _reserve(self, faces: int, points: int):
+        '''
+        Makes room for faces more faces and points more points, at least doubling the arrays that are too small.
+        '''
+        face_room = self._count + faces > len(self._depths)
+        point_room = self._point_count + points > len(self._points)
+        if not (face_room or point_room): return
+        old = (self._depths, self._types, self._starts, self._lengths, self._fills, self._outlines, self._face_ids, self._points, self._point_depths)
+        self._allocate(max(len(self._depths)*2, self._count + faces) if face_room else len(self._depths),
+                       max(len(self._points)*2, self._point_count + points) if point_room else len(self._points))
+        new = (self._depths, self._types, self._starts, self._lengths, self._fills, self._outlines, self._face_ids, self._points, self._point_depths)
+        for i, (a, b) in enumerate(zip(old, new)):
+            used = self._point_count if i >= 7 else self._count
+            b[:used] = a[:used]
+        self.grown += 1
+
+    @classmethod
+    def _color(cls, color) -> (int, int, int, int):
+        '''
+        Returns one color as RGBA (truncated and clamped to 0-255, like pygame takes float colors).
+        '''
+        if color is None: return cls.NO_COLOR
+        return tuple(max(0, min(255, int(c))) for c in color[:3]) + (max(0, min(255, int(color[3]))) if len(color) > 3 else 255,)
+
+    @classmethod
+    def _colors(cls, colors) -> 'np.ndarray':
+        '''
+        Returns an (M,4) uint8 array for an (M,3)/(M,4) array of colors, or a (4,) one for one color (or None).
+        '''
+        if not isinstance(colors, np.ndarray) or colors.ndim == 1: return np.array(cls._color(colors), dtype=np.uint8)
+        returning = np.full((len(colors), 4), 255, dtype=np.uint8)
+        returning[:,:colors.shape[1]] = np.clip(colors, 0, 255)
+        return returning
+
+    @classmethod
+    def _color_list(cls, colors: list) -> 'np.ndarray':
+        '''
+        Returns an (M,4) uint8 array for a list of M colors (any of them None).
+        '''
+        return np.array([cls._color(color) for color in colors], dtype=np.uint8).reshape(-1, 4)
+
+    @staticmethod
+    def _pick(values, keep: 'np.ndarray'):
+        '''
+        Returns values at keep if it is one per face (an array), otherwise as it is (one for all).
+        '''
+        if isinstance(values, np.ndarray) and values.ndim > 0: return values[keep]
+        return values
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class DrawOrder:
+    '''
+    Back to front face ordering which remembers last frame's order (by face id).
+    Each frame the faces are first put back in last frame's order (an O(n) scatter, new faces go at the end), which
+      is usually already sorted or nearly sorted since the camera and objects only move a little between frames.
+      If it is sorted nothing else is done. Otherwise it's bucketed by depth with a stable radix sort (on depths
+      quantized to 16 bits, so O(n)), which leaves only faces sharing a bucket out of order, and that is repaired
+      with a stable timsort, which runs in close to linear time on nearly sorted input.
+    Faces at the same depth keep last frame's order, so they don't flicker.
+    Faces sharing an id (BSP fragments of one face, say) are all kept, in the order they were given.
+    '''
+    BUCKETS = 1 << 16
+    def __init__(self):
+        self._rank = np.full(0, -1, dtype=np.int64) #face id -> position in last frame's order, -1 if not drawn
+        self._previous = np.zeros(0, dtype=np.int64) #Last frame's face ids, in order
+
+    def order(self, face_ids, depths) -> 'np.ndarray':
+        '''
+        Returns the indices which put the faces (given as parallel face id and depth arrays) in back to front
+          (largest depth first) order.
+        '''
+        face_ids = np.asarray(face_ids, dtype=np.int64)
+        depths = np.asarray(depths, dtype=float)
+        n = len(face_ids)
+        if n == 0:
+            self._forget()
+            return np.zeros(0, dtype=np.intp)
+
+        #Put the faces back in last frame's order
+        if len(face_ids) and face_ids.max() >= len(self._rank):
+            self._rank = np.concatenate((self._rank, np.full(int(face_ids.max()) + 1 - len(self._rank), -1, dtype=np.int64)))
+        ranks = self._rank[face_ids]
+        seen = ranks >= 0
+        slots = np.full(len(self._previous), -1, dtype=np.intp)
+        slots[ranks[seen]] = np.nonzero(seen)[0]
+        order, unseen = slots[slots >= 0], np.nonzero(~seen)[0]
+        if len(order) + len(unseen) == n:
+            order = np.concatenate((order, unseen))
+        else: #Some faces share an id (and so a rank), which the scatter drops, so sort by rank instead (keeping them all)
+            order = np.argsort(np.where(seen, ranks, len(self._previous)), kind='stable')
+
+        #Repair it if anything moved out of place
+        ordered = depths[order]
+        if not (ordered[:-1] >= ordered[1:]).all():
+            low, high = ordered.min(), ordered.max()
+            if np.isfinite(high - low):
+                buckets = ((high - ordered)*((self.BUCKETS - 1)/(high - low))).astype(np.uint16)
+                order = order[np.argsort(buckets, kind='stable')] #Radix sort for 16 bit keys
+                ordered = depths[order]
+            if not (ordered[:-1] >= ordered[1:]).all():
+                order = order[np.argsort(-ordered, kind='stable')]
+
+        self._forget()
+        ordered_ids = face_ids[order]
+        self._rank[ordered_ids] = np.arange(n)
+        self._previous = ordered_ids
+        return order
+
+    def sort(self, drawings: list) -> list:
+        '''
+        Sorts a draw list ([distance, drawing type, drawing arguments, face id] entries) back to front.
+        '''
+        if not drawings:
+            self._forget()
+            return []
+        order = self.order([d[3] for d in drawings], [d[0] for d in drawings])
+        return list(map(drawings.__getitem__, order.tolist()))
+
+    #Private methods
+    def _forget(self):
+        '''
+        Clears last frame's ranks (only the ones that were set, so this is O(last frame's faces)).
+        '''
+        self._rank[self._previous] = -1
+        self._previous = np.zeros(0, dtype=np.int64)
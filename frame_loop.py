@@ -0,0 +1,271 @@
+from linear_algebra import Vec3
+from rotation import Rotation
+
+from collections import deque
+import threading
+import time
+
+
+class FixedStepLoop:
+    '''
+    A game loop where the simulation runs at a fixed rate, however fast frames get drawn.
+    Every frame, update is called once per tick_rate-th of a second that went by (at most max_ticks times, past
+      that the simulation falls behind instead of spiraling), then the frame is built (build, like a Renderer's
+      draw_list) with everything movers gives (Nodes, the Camera, anything with transform and set_transform) moved
+      part of the way from where they were before the last tick to where they are now. So motion is smooth even
+      when frames come more often than ticks, and the simulation keeps its speed when frames are slow.
+    With threaded, the built frame is handed to present (drawing it) on a worker thread, which works on it while
+      the next frame is simulated and built. present gets the frames in order and never two at once. show, if given,
+      is called with what present returned on the thread running the loop (putting it on the display, which SDL
+      only allows from the main thread), once the next frame is built (or by wait/close).
+    tick_rate() and frame_rate() give the achieved simulation and drawing rates (over about the last second).
+    '''
+    RATE_WINDOW = 1 #Seconds the achieved rates are measured over
+
+    def __init__(self, update, build, present, movers, tick_rate: float = 20, max_fps: float = 0,
+                        max_ticks: int = 5, threaded: bool = True, profiler = None, show = None):
+        assert tick_rate > 0 and max_ticks >= 1
+        self._update = update
+        self._build = build
+        self._present = present
+        self._show = show
+        self._movers = movers
+        self._tick_time = 1/tick_rate
+        self._frame_time = 1/max_fps if max_fps else 0
+        self._max_ticks = max_ticks
+        self._profiler = profiler
+
+        self._presenter = FramePresenter(present) if threaded else None
+        self._presenting = False #A frame was handed to the presenter and not shown yet
+        self._interpolation = Interpolation()
+        self._accumulator = 0
+        self._last_time = None
+        self._ticks = _Rate(self.RATE_WINDOW)
+        self._frames = _Rate(self.RATE_WINDOW)
+
+    def frame(self) -> int:
+        '''
+        Runs the ticks that are due, then builds and presents (or hands off) one frame. Returns the ticks run.
+        '''
+        now = time.perf_counter()
+        if self._last_time == None: self._last_time = now
+        self._accumulator += now - self._last_time
+        self._last_time = now
+
+        ticks = 0
+        while self._accumulator >= self._tick_time and ticks < self._max_ticks:
+            self._interpolation.capture(self._movers()) #Where everything was before this tick
+            self._update()
+            self._accumulator -= self._tick_time
+            ticks += 1
+        if ticks == self._max_ticks: self._accumulator = min(self._accumulator, self._tick_time) #Too far behind, drop the rest
+
+        self._interpolation.apply(self._accumulator/self._tick_time)
+        try:
+            frame = self._build()
+        finally:
+            self._interpolation.restore()
+
+        if self._profiler != None: self._profiler.count('sim ticks', ticks)
+        if self._presenter != None:
+            self._finish() #The last frame is done with the profiler now
+            if self._profiler != None: self._profiler.end_frame()
+            self._presenter.submit(frame)
+            self._presenting = True
+        else:
+            drawn = self._present(frame)
+            if self._show != None: self._show(drawn)
+            if self._profiler != None: self._profiler.end_frame()
+
+        self._ticks.add(now, ticks)
+        self._frames.add(now, 1)
+        if self._frame_time:
+            rest = self._last_time + self._frame_time - time.perf_counter()
+            if rest > 0: time.sleep(rest)
+        return ticks
+
+    def tick_rate(self) -> float:
+        '''
+        Returns the achieved simulation rate (ticks/sec).
+        '''
+        return self._ticks.rate()
+
+    def frame_rate(self) -> float:
+        '''
+        Returns the achieved drawing rate (frames/sec).
+        '''
+        return self._frames.rate()
+
+    def wait(self):
+        '''
+        Waits for the frame being presented to finish and shows it (like before changing the display surface).
+        '''
+        if self._presenter != None: self._finish()
+
+    def close(self):
+        '''
+        Finishes and shows the frame being presented, stops the presenting thread, and tells everything the
+          interpolation put back that it moved.
+        '''
+        if self._presenter != None:
+            self._finish()
+            self._presenter.close()
+        self._interpolation.settle()
+
+    #Private methods
+    def _finish(self):
+        '''
+        Waits for the frame being presented, then shows it on this thread.
+        '''
+        presenting, self._presenting = self._presenting, False
+        drawn = self._presenter.wait()
+        if presenting and self._show != None: self._show(drawn)
+
+
+class FramePresenter:
+    '''
+    Calls present with every submitted frame on a worker thread, one at a time and in order. submit waits for the
+      last frame to be done first, so at most one frame is being presented while the next is built. wait gives what
+      present returned for the last frame (None if it was already given). An exception in present is raised again by
+      the next submit/wait.
+    '''
+    def __init__(self, present):
+        self._present = present
+        self._frame = None
+        self._result = None
+        self._error = None
+        self._closing = False
+        self._submitted = threading.Event()
+        self._done = threading.Event()
+        self._done.set()
+        self._thread = threading.Thread(target=self._run, name='FramePresenter', daemon=True)
+        self._thread.start()
+
+    def submit(self, frame):
+        self.wait()
+        self._frame = frame
+        self._done.clear()
+        self._submitted.set()
+
+    def wait(self):
+        self._done.wait()
+        error, self._error = self._error, None
+        if error is not None: raise error
+        result, self._result = self._result, None
+        return result
+
+    def close(self):
+        if not self._thread.is_alive(): return
+        self._done.wait()
+        self._closing = True
+        self._submitted.set()
+        self._thread.join()
+
+    #Private methods
+    def _run(self):
+        while True:
+            self._submitted.wait()
+            self._submitted.clear()
+            if self._closing: break
+            frame, self._frame = self._frame, None
+            try:
+                self._result = self._present(frame)
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._done.set()
+
+
+class Interpolation:
+    '''
+    Moves things (anything with transform and set_transform) part of the way back to where they were when capture
+      was called, then back again with restore. Locations are interpolated in a straight line, Rotations angle by
+      angle, and anything with a Quaternion by slerp. Things that haven't moved aren't touched, so their versions
+      stay the same.
+    Nodes are put back quietly (see Node._restore_transform), cached matrices and all, since the next apply moves
+      them again anyway: the ones it doesn't (and everything at the next capture or settle) are told they moved then.
+    '''
+    def __init__(self):
+        self._captured = {} #id -> (thing, location tuple, rotation, rotation values)
+        self._applied = [] #(thing, transform state) to restore
+        self._quiet = [] #Nodes restore put back without telling anyone
+
+    def capture(self, things: list):
+        '''
+        Keeps where things are now, as where they were for the next apply.
+        '''
+        self.settle()
+        self._captured = {id(t): (t, *_state(*t.transform())) for t in things}
+
+    def apply(self, t: float):
+        '''
+        Moves every captured thing that moved since to t of the way from where it was to where it is (0 is
+          where it was, 1 where it is).
+        '''
+        self.restore()
+        for thing, location, rotation, angles in self._captured.values():
+            current = thing.transform()
+            now, now_rotation, now_angles = _state(*current)
+            if now == location and now_angles == angles: continue
+            self._applied.append((thing, thing._transform_state() if hasattr(thing, '_restore_transform') else current))
+            thing.set_transform(Vec3(*(a + (b-a)*t for a, b in zip(location, now))), _interpolate(rotation, now_rotation, t))
+        moved = {id(thing) for thing, state in self._applied}
+        self._quiet = [thing for thing in self._quiet if id(thing) not in moved]
+        self.settle()
+
+    def restore(self):
+        '''
+        Puts everything apply moved back where it was.
+        '''
+        for thing, state in reversed(self._applied):
+            if hasattr(thing, '_restore_transform'):
+                thing._restore_transform(state)
+                self._quiet.append(thing)
+            else:
+                thing.set_transform(*state)
+        self._applied = []
+
+    def settle(self):
+        '''
+        Tells every Node restore put back quietly that it moved (its version goes up, the BVH hears of it...).
+        '''
+        for thing in self._quiet:
+            thing._transform_changed()
+        self._quiet = []
+
+
+class _Rate:
+    '''
+    Counts events over the last window seconds.
+    '''
+    def __init__(self, window: float):
+        self._window = window
+        self._events = deque() #(time, count)
+        self._total = 0
+
+    def add(self, now: float, count: int):
+        self._events.append((now, count))
+        self._total += count
+        while now - self._events[0][0] > self._window:
+            self._total -= self._events.popleft()[1]
+
+    def rate(self) -> float:
+        if len(self._events) < 2: return 0
+        span = self._events[-1][0] - self._events[0][0]
+        return (self._total - self._events[0][1])/span if span > 0 else 0
+
+
+def _state(location, rotation) -> (tuple, 'rotation', tuple):
+    '''
+    Returns a transform as values to compare by: location, rotation and the rotation's angles (or quaternion).
+    '''
+    angles = (rotation[0], rotation[1], rotation[2], rotation.order()) if isinstance(rotation, Rotation) else tuple(rotation.quaternion())
+    return tuple(location), rotation, angles
+
+def _interpolate(a, b, t: float):
+    '''
+    Returns the rotation t of the way from a to b.
+    '''
+    if isinstance(a, Rotation) and isinstance(b, Rotation) and a.order() == b.order():
+        return Rotation(*(a[i] + (b[i]-a[i])*t for i in range(3)), a.order())
+    return a.quaternion().slerp(b.quaternion(), t)
@@ -0,0 +1,95 @@
+from linear_algebra import Vector, Vec3
+import math
+
+import numpy as np
+
+
+class Lighting:
+    '''
+    How faces get shaded (flat, one color per face): the face's color times its brightness, capped at 255.
+    A face's brightness is ambient plus, for every light, intensity*(1 - angle/pi), where angle is between the face's
+      normal and the way the light travels. So a face squarely facing a light gets all of it, one edge on gets half
+      and one facing away gets none.
+    The camera light shines from the camera, traveling from it to each face's center. Directional lights travel the
+      same way everywhere (like the sun).
+    The defaults (camera light 1, no ambient, no directional lights) shade faces the way they have always looked.
+    Every Camera has one (camera.lighting), and everything it draws is shaded through it a batch at a time.
+    '''
+    def __init__(self, ambient: float = 0, camera_light: float = 1, lights: [(Vector, float)] = ()):
+        self.ambient = ambient
+        self.camera_light = camera_light
+        self._lights = []
+        self._version = 0
+        for direction, intensity in lights:
+            self.add_light(direction, intensity)
+
+    def add_light(self, direction: Vector, intensity: float = 1):
+        '''
+        Adds a directional light, traveling in direction (any length).
+        '''
+        direction = Vec3(*direction)
+        length = direction.mag()
+        assert length > 0
+        self._lights.append((direction/length, intensity))
+        self._version += 1
+
+    def clear_lights(self):
+        '''
+        Removes every directional light (not the camera light or ambient).
+        '''
+        self._lights = []
+        self._version += 1
+
+    def lights(self) -> [(Vec3, float)]:
+        '''
+        Returns the directional lights as (unit direction, intensity).
+        '''
+        return list(self._lights)
+
+    def version(self) -> int:
+        '''
+        Returns a number that goes up every time a directional light is added or removed (ambient and camera_light
+          are plain attributes, so compare those too).
+        '''
+        return self._version
+
+    def brightness(self, normals, cam_to_center) -> 'np.ndarray':
+        '''
+        Returns the (M,) brightness of faces with the given (M,3) normals (any length) and centers (as (M,3) vectors
+          from the camera to them).
+        '''
+        normals = np.asarray(normals, dtype=float).reshape(-1, 3)
+        brightness = np.full(len(normals), float(self.ambient))
+        lengths = np.linalg.norm(normals, axis=1)
+        if self.camera_light:
+            cam_to_center = np.asarray(cam_to_center, dtype=float).reshape(-1, 3)
+            cos = _cos(np.einsum('ij,ij->i', normals, cam_to_center), lengths*np.linalg.norm(cam_to_center, axis=1))
+            brightness += self.camera_light*(1 - np.arccos(cos)/math.pi)
+        if self._lights:
+            directions = np.array([tuple(d) for d, i in self._lights], dtype=float)
+            intensities = np.array([i for d, i in self._lights], dtype=float)
+            cos = _cos(normals@directions.T, lengths[:,None])
+            brightness += (1 - np.arccos(cos)/math.pi)@intensities
+        return brightness
+
+    def shade(self, normals, cam_to_center, colors) -> 'np.ndarray':
+        '''
+        Returns the (M,4) shaded colors of faces (see brightness), all in one pass. colors is an (M,3) or (M,4)
+          array of every face's color, or one color for all of them. Alpha is kept as it is (255 if not given).
+        '''
+        brightness = self.brightness(normals, cam_to_center)
+        colors = np.asarray(colors, dtype=float)
+        returning = np.empty((len(brightness), 4))
+        returning[:,:3] = np.clip(brightness[:,None]*colors[...,:3], 0, 255)
+        returning[:,3] = colors[...,3] if colors.shape[-1] > 3 else 255
+        return returning
+
+
+def _cos(dots, lengths) -> 'np.ndarray':
+    '''
+    Returns dots/lengths clipped to [-1,1], with 0 (side on, so half lit) where a length is 0, which happens for
+      faces with no area (collinear or repeated vertices) and faces with the camera right at their center.
+    '''
+    dots, lengths = np.broadcast_arrays(dots, lengths)
+    cos = np.divide(dots, lengths, out=np.zeros(dots.shape), where=lengths > 0)
+    return np.clip(cos, -1, 1)
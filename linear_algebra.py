@@ -1,10 +1,14 @@
 import math
 
+import numpy as np
+
 SANITIZATION_LIMIT = .000001 #Used to convert |values| < this to 0
 
 
 
 class Vector:
+    __slots__ = ('_values',)
+
     def __init__(self, *values):
         self._values = [*values]
 
@@ -71,6 +75,8 @@ class Vector:
         '''
         assert vectors[0].dimension() - 1 == len(vectors)
         assert all(vectors[0].dimension() == i.dimension() for i in vectors)
+        if len(vectors) == 2: #3D, no need for a Matrix
+            return Vec3(*vectors[0]).cross(vectors[1])
 
         da_matrix = Matrix(vectors)
         return Vector(*(da_matrix.cofactor(x, -2) for x in range(len(vectors)+1)))
@@ -148,39 +154,191 @@ class Vector:
 
 
 
+class Vec3(Vector):
+    '''
+    A Vector which is always 3D. Stores x, y, z directly (no list) and does all of its math unrolled,
+      so it is a good deal faster than a general Vector. Works anywhere a Vector does.
+    '''
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x: float = 0, y: float = 0, z: float = 0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def dimension(self) -> int:
+        return 3
+
+    def mag(self) -> float:
+        return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
+
+    def dot(self, v: Vector) -> float:
+        return self.x*v[0] + self.y*v[1] + self.z*v[2]
+
+    def cross(self, v: Vector) -> 'Vec3':
+        '''
+        Returns the cross product self x v.
+        '''
+        vx, vy, vz = v[0], v[1], v[2]
+        return Vec3(self.y*vz - self.z*vy, self.z*vx - self.x*vz, self.x*vy - self.y*vx)
+
+    def sanitize(self):
+        if abs(self.x) < SANITIZATION_LIMIT: self.x = 0
+        if abs(self.y) < SANITIZATION_LIMIT: self.y = 0
+        if abs(self.z) < SANITIZATION_LIMIT: self.z = 0
+
+    def angle_diff(self, v: Vector) -> float:
+        return math.acos(self.dot(v)/(self.mag()*v.mag()))
+
+    #Dunder methods
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __len__(self):
+        return 3
+
+    def __add__(self, right):
+        if isinstance(right, Vec3):
+            return Vec3(self.x+right.x, self.y+right.y, self.z+right.z)
+        elif isinstance(right, (Vector, tuple, list)):
+            assert len(right) == 3
+            return Vec3(self.x+right[0], self.y+right[1], self.z+right[2])
+        elif isinstance(right, (int, float)):
+            return Vec3(self.x+right, self.y+right, self.z+right)
+        else:
+            return NotImplemented
+
+    def __radd__(self, left):
+        return self + left
+
+    def __sub__(self, right):
+        if isinstance(right, Vec3):
+            return Vec3(self.x-right.x, self.y-right.y, self.z-right.z)
+        elif isinstance(right, (Vector, tuple, list)):
+            assert len(right) == 3
+            return Vec3(self.x-right[0], self.y-right[1], self.z-right[2])
+        elif isinstance(right, (int, float)):
+            return Vec3(self.x-right, self.y-right, self.z-right)
+        else:
+            return NotImplemented
+
+    def __rsub__(self, left):
+        if isinstance(left, (Vector, tuple, list)):
+            assert len(left) == 3
+            return Vec3(left[0]-self.x, left[1]-self.y, left[2]-self.z)
+        return NotImplemented
+
+    def __mul__(self, right):
+        '''
+        When "multiplying" with another Vector, returns the dot product.
+        '''
+        if isinstance(right, Vec3):
+            return self.x*right.x + self.y*right.y + self.z*right.z
+        elif isinstance(right, Vector):
+            assert right.dimension() == 3
+            return self.dot(right)
+        elif isinstance(right, (int, float)):
+            return Vec3(self.x*right, self.y*right, self.z*right)
+        else:
+            return NotImplemented
+
+    def __rmul__(self, left):
+        if isinstance(left, (int, float)):
+            return Vec3(self.x*left, self.y*left, self.z*left)
+        return NotImplemented
+
+    def __truediv__(self, right):
+        if isinstance(right, (int, float)):
+            return Vec3(self.x/right, self.y/right, self.z/right)
+        else:
+            return NotImplemented
+
+    def __repr__(self):
+        return f'Vec3({self.x}, {self.y}, {self.z})'
+
+    def __getitem__(self, index):
+        if index == 0: return self.x
+        if index == 1: return self.y
+        if index == 2: return self.z
+        return (self.x, self.y, self.z)[index]
+
+    def __setitem__(self, index, value):
+        if index == 0 or index == -3: self.x = value
+        elif index == 1 or index == -2: self.y = value
+        elif index == 2 or index == -1: self.z = value
+        else: raise IndexError(index)
+
+
+
+
 class Matrix:
+    '''
+    A rows x columns matrix, stored as one flat row major list (row y, column x is self._values[y*columns + x]), so
+      getting at a value is a single index and multiplying doesn't build anything in between.
+    matrix[y] hands out row y as a _MatrixRow, which reads and writes straight through to the values, so
+      matrix[y][x] = v still changes the matrix.
+    transform_points does N points (an (N,3) NumPy array) at once, with a cached NumPy copy of the values.
+    '''
+    __slots__ = ('_values', '_rows', '_columns', '_array')
+    __array_ufunc__ = None #So array@matrix comes to __rmatmul__ instead of NumPy
+
     def __init__(self, iterable):
         '''
         If the iterable is 2D, the Matrix will deep copy that iterable into its own personal 2D list.
         If the iterable is 1D, the Matrix will initialize as a vertical Matrix ( [1,2,3] => [[1],[2],[3]])
         '''
-        self._matrix = []
+        values = []
+        rows = 0
+        columns = None
         for i in iterable:
             if '__iter__' in type(i).__dict__: #2D iterable / This index in the iterable can also be iterated over.
-                self._matrix.append([j for j in i]) #Append a list to the matrix which contains all the values of this part of the 2D array.
+                row = [j for j in i] #All the values of this part of the 2D array.
             else: #1D iterable.
-                self._matrix.append([i])
-        self._verify()
+                row = [i]
+            if columns is None: columns = len(row)
+            assert len(row) == columns #All the rows have the same length
+            values.extend(row)
+            rows += 1
+        self._values = values
+        self._rows = rows
+        self._columns = columns if columns is not None else 0
+        self._array = None
 
     def sanitize(self):
         '''
         Changes all values in the Matrix which are near 0 (as defined by SANITIZATION_LIMIT) to 0.
         '''
-        for row in range(len(self._matrix)):
-            for col in range(len(self._matrix[row])):
-                if abs(self._matrix[row][col]) < SANITIZATION_LIMIT: self._matrix[row][col] = 0
+        values = self._values
+        for i in range(len(values)):
+            if abs(values[i]) < SANITIZATION_LIMIT: values[i] = 0
+        self._array = None
                 
     def rows(self) -> int:
-        return len(self._matrix)
+        return self._rows
 
     def columns(self) -> int:
-        return len(self._matrix[0])
+        return self._columns
+
+    def values(self) -> list:
+        '''
+        Returns the flat row major list of values (the matrix's own, so don't change it).
+        '''
+        return self._values
+
+    def array(self) -> 'np.ndarray':
+        '''
+        Returns the values as a (rows, columns) float NumPy array, made once and kept (read only).
+        '''
+        if self._array is None:
+            self._array = np.array(self._values, dtype=float).reshape(self._rows, self._columns)
+            self._array.flags.writeable = False
+        return self._array
 
     def column_vector(self, col: int) -> Vector:
         '''
         Returns the column vector of the given column in the matrix.
         '''
-        return Vector(*(i[col] for i in self._matrix))
+        return Vector(*self._values[col::self._columns])
 
     def row_vector(self, row: int) -> Vector:
         '''
@@ -192,17 +350,33 @@ class Matrix:
         '''
         Will create a new Matrix which is transposed.
         '''
-        return Matrix([[self[col,row] for row in range(self.rows())] for col in range(self.columns())])
+        values, columns = self._values, self._columns
+        return Matrix._flat([v for col in range(columns) for v in values[col::columns]], columns, self._rows)
 
     def determinant(self) -> float:
         '''
         Returns the determinant of the matrix.
-        Works recursively. Also determines the determinant using the top row, if you care.
+        Uses the closed form for matrices up to 3x3, and an LU decomposition for anything bigger.
         '''
         assert self.square()
-        if self.rows() == 1:
-            return self[0,0]
-        return sum(self[x,0]*self.exclude(x,0).determinant()*(1 if x%2==0 else -1) for x in range(self.columns()))
+        n = self.rows()
+        m = self._values
+        if n == 1:
+            return m[0]
+        if n == 2:
+            return m[0]*m[3] - m[1]*m[2]
+        if n == 3:
+            return (m[0]*(m[4]*m[8] - m[5]*m[7])
+                    - m[1]*(m[3]*m[8] - m[5]*m[6])
+                    + m[2]*(m[3]*m[7] - m[4]*m[6]))
+
+        decomposition = self._lu()
+        if decomposition is None: return 0
+        lu, perm, sign = decomposition
+        det = sign
+        for i in range(n):
+            det *= lu[i][i]
+        return det
 
     def cofactor(self, x: int, y: int) -> float:
         '''
@@ -219,13 +393,53 @@ class Matrix:
         '''
         return Matrix([self.cofactor(x,y) for x in range(self.columns())] for y in range(self.rows()))
 
-    def inverse(self) -> 'Matrix':
+    def inverse(self, orthonormal: bool = False) -> 'Matrix':
+        '''
+        Returns an inverse of the current matrix.
+        If the matrix is known to be orthonormal (like a rotation matrix) the inverse is just the transpose.
+        3x3 matrices use the closed form (adjugate / determinant), everything else is solved with an LU decomposition.
         '''
-        Returns an inverse of the current matrix, which is 1/determinant
-           times the transposed cofactor matrix.
+        assert self.square()
+        if orthonormal:
+            return self.transpose()
+
+        n = self.rows()
+        if n == 3:
+            m = self._values
+            det = self.determinant()
+            assert det != 0
+            return Matrix._flat([(m[4]*m[8] - m[5]*m[7])/det,
+                                 (m[2]*m[7] - m[1]*m[8])/det,
+                                 (m[1]*m[5] - m[2]*m[4])/det,
+                                 (m[5]*m[6] - m[3]*m[8])/det,
+                                 (m[0]*m[8] - m[2]*m[6])/det,
+                                 (m[2]*m[3] - m[0]*m[5])/det,
+                                 (m[3]*m[7] - m[4]*m[6])/det,
+                                 (m[1]*m[6] - m[0]*m[7])/det,
+                                 (m[0]*m[4] - m[1]*m[3])/det], 3, 3)
+
+        decomposition = self._lu()
+        assert decomposition is not None
+        columns = [self._lu_solve(decomposition, [1 if i == col else 0 for i in range(n)]) for col in range(n)]
+        return Matrix([[columns[col][row] for col in range(n)] for row in range(n)])
+
+    def solve(self, b):
+        '''
+        Returns x such that self@x == b, using an LU decomposition with partial pivoting.
+        b can be a Vector (returns a Vector) or a Matrix with multiple columns (returns a Matrix).
         '''
-        assert self.determinant() != 0
-        return 1/self.determinant() * self.cofactor_matrix().transpose()
+        assert self.square()
+        decomposition = self._lu()
+        assert decomposition is not None
+        if isinstance(b, Vector):
+            assert b.dimension() == self.rows()
+            return Vector(*self._lu_solve(decomposition, list(b)))
+        elif isinstance(b, Matrix):
+            assert b.rows() == self.rows()
+            columns = [self._lu_solve(decomposition, b._values[col::b._columns]) for col in range(b.columns())]
+            return Matrix([[columns[col][row] for col in range(b.columns())] for row in range(b.rows())])
+        else:
+            raise TypeError()
 
     def exclude(self, col: int, row: int) -> 'Matrix':
         '''
@@ -238,7 +452,83 @@ class Matrix:
         Creates a new matrix which is this Matrix with m2's values added to the right of this matrix. [[1,2,3]] + [[4,5,6]] = [[1,2,3,4,5,6]]
         '''
         assert self.rows() == m2.rows()
-        return Matrix([[(self[x,y] if x < self.columns() else m2[x-self.columns(),y]) for x in range(self.columns()+m2.columns())] for y in range(self.rows())])
+        return Matrix([self[y] + m2[y] for y in range(self.rows())])
+
+    def transform_point(self, v: Vector) -> Vec3:
+        '''
+        For a 4x4 affine matrix (see Matrix.affine), returns the 3D point v transformed by it.
+        Same as (v, 1)*matrix without building anything in between.
+        '''
+        m = self._values
+        x, y, z = v[0], v[1], v[2]
+        return Vec3(x*m[0] + y*m[4] + z*m[8] + m[12],
+                    x*m[1] + y*m[5] + z*m[9] + m[13],
+                    x*m[2] + y*m[6] + z*m[10] + m[14])
+
+    def transform_points(self, points: 'np.ndarray') -> 'np.ndarray':
+        '''
+        transform_point for an (N,3) array of points at once (for a 4x4 affine matrix), returns an (N,3) array.
+          An (N,rows) array is instead taken as N vectors multiplied on the left (v*matrix), giving (N,columns).
+        '''
+        assert points.ndim == 2
+        m = self.array()
+        if points.shape[1] == self._rows: return points@m
+        assert self._rows == self._columns == 4 and points.shape[1] == 3 #Points through an affine matrix
+        return points@m[:3,:3] + m[3,:3]
+
+    def transform_direction(self, v: Vector) -> Vec3:
+        '''
+        For a 4x4 affine matrix, returns the direction v (like a normal) turned by it, without the translation.
+        '''
+        m = self._values
+        x, y, z = v[0], v[1], v[2]
+        return Vec3(x*m[0] + y*m[4] + z*m[8],
+                    x*m[1] + y*m[5] + z*m[9],
+                    x*m[2] + y*m[6] + z*m[10])
+
+    def imatmul(self, right: 'Matrix') -> 'Matrix':
+        '''
+        In place self@right (right must be square), so no new Matrix is made. Returns self.
+        Only for matrices nothing else holds on to, since anything caching by the matrix won't notice the change.
+        '''
+        assert isinstance(right, Matrix) and self._columns == right._rows == right._columns
+        a, b = self._values, right._values
+        n = self._columns
+        if n == 4:
+            b0, b1, b2, b3, b4, b5, b6, b7, b8, b9, b10, b11, b12, b13, b14, b15 = b
+            for i in range(0, len(a), 4):
+                x, y, z, w = a[i], a[i+1], a[i+2], a[i+3]
+                a[i] = x*b0 + y*b4 + z*b8 + w*b12
+                a[i+1] = x*b1 + y*b5 + z*b9 + w*b13
+                a[i+2] = x*b2 + y*b6 + z*b10 + w*b14
+                a[i+3] = x*b3 + y*b7 + z*b11 + w*b15
+        elif n == 3:
+            b0, b1, b2, b3, b4, b5, b6, b7, b8 = b
+            for i in range(0, len(a), 3):
+                x, y, z = a[i], a[i+1], a[i+2]
+                a[i] = x*b0 + y*b3 + z*b6
+                a[i+1] = x*b1 + y*b4 + z*b7
+                a[i+2] = x*b2 + y*b5 + z*b8
+        else:
+            for i in range(0, len(a), n):
+                row = a[i:i+n]
+                for col in range(n):
+                    total = 0
+                    for k in range(n):
+                        total += row[k]*b[k*n + col]
+                    a[i + col] = total
+        self._array = None
+        return self
+
+    def scale_(self, factor: float) -> 'Matrix':
+        '''
+        In place self*factor, so no new Matrix is made (see imatmul). Returns self.
+        '''
+        values = self._values
+        for i in range(len(values)):
+            values[i] *= factor
+        self._array = None
+        return self
 
     def square(self) -> bool:
         '''
@@ -247,46 +537,117 @@ class Matrix:
         return self.rows() == self.columns()
 
     #Private methods
-    def _verify(self):
+    def _lu(self) -> ('LU rows', 'permutation', 'sign'):
+        '''
+        LU decomposition with partial pivoting, PA = LU. L (unit diagonal, not stored) and U are packed
+        into one list of rows. Returns None if the matrix is singular.
+        '''
+        n = self.rows()
+        values = self._values
+        lu = [values[row*n:(row+1)*n] for row in range(n)] #Copies, since they get worked on in place
+        perm = list(range(n))
+        sign = 1
+        for k in range(n):
+            pivot = max(range(k, n), key=lambda i: abs(lu[i][k]))
+            if lu[pivot][k] == 0: return None
+            if pivot != k:
+                lu[k], lu[pivot] = lu[pivot], lu[k]
+                perm[k], perm[pivot] = perm[pivot], perm[k]
+                sign = -sign
+            pivot_row = lu[k]
+            for i in range(k+1, n):
+                row = lu[i]
+                factor = row[k]/pivot_row[k]
+                row[k] = factor
+                for j in range(k+1, n):
+                    row[j] -= factor*pivot_row[j]
+        return lu, perm, sign
+
+    @staticmethod
+    def _lu_solve(decomposition, b: list) -> list:
+        '''
+        Solves for a single right hand side using an output of _lu().
+        '''
+        lu, perm, sign = decomposition
+        n = len(lu)
+        x = [b[p] for p in perm]
+        for i in range(n): #Forward substitution (L has a unit diagonal)
+            row = lu[i]
+            for j in range(i):
+                x[i] -= row[j]*x[j]
+        for i in range(n-1, -1, -1): #Back substitution
+            row = lu[i]
+            for j in range(i+1, n):
+                x[i] -= row[j]*x[j]
+            x[i] /= row[i]
+        return x
+
+    @staticmethod
+    def _flat(values: list, rows: int, columns: int) -> 'Matrix':
         '''
-        Asserts all the rows have the same length.
+        Makes a Matrix straight from a flat row major list (which it keeps, not copies).
         '''
-        for row in self:
-            assert len(row) == len(self[0])
+        m = Matrix.__new__(Matrix)
+        m._values = values
+        m._rows = rows
+        m._columns = columns
+        m._array = None
+        return m
 
 
     #Static Methods
+    @staticmethod
+    def affine(rotation: 'Matrix', translation: Vector) -> 'Matrix':
+        '''
+        Returns the 4x4 matrix which rotates a point by the 3x3 rotation matrix and then translates it,
+          for points multiplied on the left like (x, y, z, 1)*matrix. Chain them with @, child@parent.
+        '''
+        r = rotation._values
+        return Matrix._flat([r[0], r[1], r[2], 0,
+                             r[3], r[4], r[5], 0,
+                             r[6], r[7], r[8], 0,
+                             translation[0], translation[1], translation[2], 1], 4, 4)
+
     @staticmethod
     def rotation_matrix(angle: float, axis) -> 'Matrix':
         '''
         Returns the 3D rotation matrix to rotate around the given axis (0, 1, 2 = x, y, z) by angle radians.
         '''
+        cos, sin = math.cos(angle), math.sin(angle)
         if axis == 0:
-            return Matrix([ [1,                 0,                  0],
-                            [0,                 math.cos(angle),    -math.sin(angle)],
-                            [0,                 math.sin(angle),    math.cos(angle)]])
+            return Matrix._flat([1,                 0,                  0,
+                                 0,                 cos,                -sin,
+                                 0,                 sin,                cos], 3, 3)
         elif axis == 1:
-            return Matrix([ [math.cos(angle),   0,                  math.sin(angle)],
-                            [0,                 1,                  0],
-                            [-math.sin(angle),  0,                  math.cos(angle)]])
+            return Matrix._flat([cos,               0,                  sin,
+                                 0,                 1,                  0,
+                                 -sin,              0,                  cos], 3, 3)
         elif axis == 2:
-            return Matrix([ [math.cos(angle),   -math.sin(angle),   0],
-                            [math.sin(angle),   math.cos(angle),    0],
-                            [0,                 0,                  1]])
+            return Matrix._flat([cos,               -sin,               0,
+                                 sin,               cos,                0,
+                                 0,                 0,                  1], 3, 3)
 
     #Dunder methods
     def __str__(self):
-        return '[' + '\n'.join(', '.join(str(j) for j in i) for i in self._matrix) + ']'
+        return '[' + '\n'.join(', '.join(str(j) for j in row) for row in self) + ']'
 
     def __repr__(self):
-        return 'Matrix(' + str(self._matrix) + ')'
+        return 'Matrix(' + str([row for row in self]) + ')'
+
+    def __iter__(self):
+        '''
+        Goes through the rows (as new lists).
+        '''
+        values, columns = self._values, self._columns
+        for i in range(0, len(values), columns):
+            yield values[i:i+columns]
 
     def __mul__(self, right):
         if type(right) in {int, float}:
-            return Matrix((self[x,y]*right for x in range(len(self._matrix[y]))) for y in range(len(self._matrix)))
+            return Matrix._flat([v*right for v in self._values], self._rows, self._columns)
         elif isinstance(right, Matrix): #Multiply each value to the value in the equivalent spot in the other matrix
             assert self.columns() == right.columns() and self.rows() == right.rows()
-            return Matrix((self[x,y]*right[x,y] for x in range(len(self._matrix[y]))) for y in range(len(self._matrix)))
+            return Matrix._flat([v*w for v, w in zip(self._values, right._values)], self._rows, self._columns)
         elif isinstance(right, Vector): #Do matrix multiplication with the vector
             assert right.dimension() == self.columns()
             return self@Matrix(right)
@@ -296,45 +657,145 @@ class Matrix:
     def __rmul__(self, left):
         if isinstance(left, Vector):
             assert left.dimension() == self.rows()
-            return Matrix(left).transpose()@self
+            return Matrix._flat(list(left), 1, left.dimension())@self
         return self*left
 
     def __matmul__(self,right):
         '''
         In case I forget, multiplies the row vectors of this Matrix by
         the column vectors of the other Matrix
+        With a NumPy array it's the plain NumPy matrix product, matrix@array (see transform_points for
+          transforming an array of points).
         '''
         if isinstance(right, Matrix):
-            assert self.columns() == right.rows()
-            return Matrix([self.row_vector(row)*right.column_vector(col) for col in range(right.columns())] for row in range(self.rows()))
+            assert self._columns == right._rows
+            a, b = self._values, right._values
+            n, m, p = self._rows, self._columns, right._columns
+            if n == m == p == 4:
+                a0, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, a14, a15 = a
+                b0, b1, b2, b3, b4, b5, b6, b7, b8, b9, b10, b11, b12, b13, b14, b15 = b
+                return Matrix._flat([a0*b0 + a1*b4 + a2*b8 + a3*b12, a0*b1 + a1*b5 + a2*b9 + a3*b13,
+                                     a0*b2 + a1*b6 + a2*b10 + a3*b14, a0*b3 + a1*b7 + a2*b11 + a3*b15,
+                                     a4*b0 + a5*b4 + a6*b8 + a7*b12, a4*b1 + a5*b5 + a6*b9 + a7*b13,
+                                     a4*b2 + a5*b6 + a6*b10 + a7*b14, a4*b3 + a5*b7 + a6*b11 + a7*b15,
+                                     a8*b0 + a9*b4 + a10*b8 + a11*b12, a8*b1 + a9*b5 + a10*b9 + a11*b13,
+                                     a8*b2 + a9*b6 + a10*b10 + a11*b14, a8*b3 + a9*b7 + a10*b11 + a11*b15,
+                                     a12*b0 + a13*b4 + a14*b8 + a15*b12, a12*b1 + a13*b5 + a14*b9 + a15*b13,
+                                     a12*b2 + a13*b6 + a14*b10 + a15*b14, a12*b3 + a13*b7 + a14*b11 + a15*b15], 4, 4)
+            if n == m == p == 3:
+                a0, a1, a2, a3, a4, a5, a6, a7, a8 = a
+                b0, b1, b2, b3, b4, b5, b6, b7, b8 = b
+                return Matrix._flat([a0*b0 + a1*b3 + a2*b6, a0*b1 + a1*b4 + a2*b7, a0*b2 + a1*b5 + a2*b8,
+                                     a3*b0 + a4*b3 + a5*b6, a3*b1 + a4*b4 + a5*b7, a3*b2 + a4*b5 + a5*b8,
+                                     a6*b0 + a7*b3 + a8*b6, a6*b1 + a7*b4 + a8*b7, a6*b2 + a7*b5 + a8*b8], 3, 3)
+            values = []
+            for i in range(0, n*m, m):
+                row = a[i:i+m]
+                for col in range(p):
+                    total = 0
+                    for k in range(m):
+                        total += row[k]*b[k*p + col]
+                    values.append(total)
+            return Matrix._flat(values, n, p)
         elif isinstance(right, Vector):
             assert right.dimension() == self.columns()
             return self@Matrix(right)
+        elif isinstance(right, np.ndarray):
+            return self.array()@right
         else:
             return NotImplemented
 
+    def __rmatmul__(self, left):
+        '''
+        array@matrix, the plain NumPy matrix product.
+        '''
+        if isinstance(left, np.ndarray):
+            return left@self.array()
+        return NotImplemented
+
     def __getitem__(self, index):
         '''
         Can do matrix[y][x] or matrix[x,y]. Works with slice notation.
         '''
-        if type(index) is slice: #This will return multiple rows (as a new Matrix)
-            return Matrix(self._matrix[index])
-        elif type(index) is int: #Will return a row, so you can do [y][x]
-            return self._matrix[index]
+        if type(index) is int: #Will return a row, so you can do [y][x]
+            if index < 0: index += self._rows
+            if not 0 <= index < self._rows: raise IndexError(index)
+            return _MatrixRow(self, index)
         elif type(index) is tuple: #[x, y], slice notation
             if len(index) != 2: raise TypeError()
-            new_matrix = None
-            if type(index[1]) is int: new_matrix = [self._matrix[index[1]]]
-            elif type(index[1]) is slice: new_matrix = self._matrix[index[1]]
+            x, y = index
+            if type(x) is int and type(y) is int:
+                if x < 0: x += self._columns
+                if y < 0: y += self._rows
+                if not (0 <= x < self._columns and 0 <= y < self._rows): raise IndexError(index)
+                return self._values[y*self._columns + x]
+            rows = [y] if type(y) is int else range(self._rows)[y]
+            new_matrix = [self[row] for row in rows]
             for row in range(len(new_matrix)):
-                if type(index[0]) is int: new_matrix[row] = [new_matrix[row][index[0]]]
-                elif type(index[0]) is slice: new_matrix[row] = new_matrix[row][index[0]]
+                if type(x) is int: new_matrix[row] = [new_matrix[row][x]]
+                elif type(x) is slice: new_matrix[row] = new_matrix[row][x]
             return Matrix(new_matrix) if (len(new_matrix) != 1 or len(new_matrix[0]) != 1) else new_matrix[0][0]
+        elif type(index) is slice: #This will return multiple rows (as a new Matrix)
+            return Matrix([self[row] for row in range(self._rows)[index]])
         else:
             raise TypeError()
 
 
 
+class _MatrixRow:
+    '''
+    One row of a Matrix (see Matrix.__getitem__), without copying it: reading it reads the matrix's values and
+      writing it (row[x] = v, or a slice) writes them, throwing away the matrix's cached NumPy copy.
+    Otherwise it acts like the list of the row's values.
+    '''
+    __slots__ = ('_matrix', '_start')
+
+    def __init__(self, matrix: Matrix, row: int):
+        self._matrix = matrix
+        self._start = row*matrix._columns
+
+    def __len__(self):
+        return self._matrix._columns
+
+    def __iter__(self):
+        values, start = self._matrix._values, self._start
+        return iter(values[start:start + self._matrix._columns])
+
+    def __getitem__(self, index):
+        columns = self._matrix._columns
+        if type(index) is slice:
+            return self._matrix._values[self._start:self._start + columns][index]
+        if index < 0: index += columns
+        if not 0 <= index < columns: raise IndexError(index)
+        return self._matrix._values[self._start + index]
+
+    def __setitem__(self, index, value):
+        columns = self._matrix._columns
+        if type(index) is slice:
+            indices = range(columns)[index]
+            value = list(value)
+            if len(value) != len(indices): raise ValueError('A Matrix row can\'t change length')
+            for i, v in zip(indices, value):
+                self._matrix._values[self._start + i] = v
+        else:
+            if index < 0: index += columns
+            if not 0 <= index < columns: raise IndexError(index)
+            self._matrix._values[self._start + index] = value
+        self._matrix._array = None
+
+    def __add__(self, right):
+        return list(self) + list(right)
+
+    def __radd__(self, left):
+        return list(left) + list(self)
+
+    def __eq__(self, right):
+        return list(self) == list(right) if isinstance(right, (list, tuple, _MatrixRow)) else NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 if __name__ == '__main__':
 
     a = Matrix([[1,2,3],
@@ -342,5 +803,7 @@ if __name__ == '__main__':
                 [7,8,9]])
     assert a[1,2] == 8
     assert a[2][1] == 8
+    a[2][1] = 10
+    assert a[1,2] == 10
 
     
\ No newline at end of file
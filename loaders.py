@@ -0,0 +1,189 @@
+from linear_algebra import Vector
+from rotation import Rotation
+import shapes
+
+import os
+import re
+
+import numpy as np
+
+CACHE_SUFFIX = '.mesh' #The cache of model.obj is model.obj.mesh
+
+_BLOCK_BYTES = 1 << 22 #How much of a file is read at a time
+_CACHE_MAGIC = b'3d_space mesh 1\n'
+_HEADER_SIZE = len(_CACHE_MAGIC) + 6*8 #Magic, then source size, source mtime, flip_z, vertex count, face count, face size
+_STL_RECORD = np.dtype([('normal', '<f4', (3,)), ('points', '<f4', (3, 3)), ('attributes', '<u2')])
+_OBJ_REFERENCES = re.compile(rb'/\S*') #The texture/normal parts of v/vt/vn face corners
+
+
+def load_mesh(path: str, color = None, outline = None, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0),
+                    cull_back: bool = False, cache: bool = True, flip_z: bool = True, batch_edges: bool = False) -> shapes.Mesh:
+    '''
+    Loads a Wavefront .obj or binary .stl file as one Mesh (see load_arrays). Faces with no area (which mesh files
+      often have) are kept as they are, they just get shaded side on.
+    '''
+    vertices, faces = load_arrays(path, cache, flip_z)
+    return shapes.Mesh(vertices, faces, color, outline, location, rotation, cull_back, batch_edges)
+
+def load_arrays(path: str, cache: bool = True, flip_z: bool = True) -> ('(N,3) vertices', '(M,k) faces'):
+    '''
+    Returns the vertex array and face array (indices into the vertices) of an .obj or .stl file.
+    With cache, the first load also writes the arrays to a binary file next to it (path + CACHE_SUFFIX), and later
+      loads memory map that file instead of parsing (until the file changes), so the arrays are only read from disk
+      as they get used.
+    Mesh files are right handed (looking down -z) and this engine is left handed (looking down +z), so with flip_z
+      every z is negated, which also keeps the fronts of faces facing out.
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    assert extension in ('.obj', '.stl'), f'Unknown mesh file type {extension}'
+    if cache:
+        arrays = read_cache(path, flip_z)
+        if arrays is not None: return arrays
+
+    vertices, faces = load_obj(path, flip_z) if extension == '.obj' else load_stl(path, flip_z)
+    if cache:
+        try:
+            write_cache(path, vertices, faces, flip_z)
+        except OSError: #Can't write next to the file, so it just doesn't get cached
+            pass
+    return vertices, faces
+
+def load_obj(path: str, flip_z: bool = True) -> ('(N,3) vertices', '(M,k) faces'):
+    '''
+    Reads the vertices (v lines) and faces (f lines, with negative and v/vt/vn style indices) of a Wavefront .obj
+      file, a block of lines at a time so only the arrays are kept. Everything else (normals, texture coordinates,
+      groups, materials) is skipped. If every face has the same number of vertices they are kept as they are,
+      otherwise every face is cut into a fan of triangles.
+    '''
+    vertex_blocks = []
+    index_blocks = [] #Every face's indices one after the other
+    count_blocks = [] #How many indices each face has
+    vertex_count = 0
+    with open(path, 'rb') as f:
+        for lines in iter(lambda: f.readlines(_BLOCK_BYTES), []):
+            vertex_lines, face_lines, before = [], [], []
+            for line in lines:
+                if line.startswith((b'v ', b'v\t')):
+                    vertex_lines.append(line[2:])
+                elif line.startswith((b'f ', b'f\t')):
+                    face_lines.append(line[2:])
+                    before.append(vertex_count + len(vertex_lines)) #Negative indices count back from here
+
+            if vertex_lines:
+                tokens = b' '.join(vertex_lines).split()
+                if len(tokens) != 3*len(vertex_lines): #Some have a w or a color after x y z
+                    tokens = [t for line in vertex_lines for t in line.split()[:3]]
+                vertex_blocks.append(np.array(tokens, dtype=float).reshape(-1, 3))
+                vertex_count += len(vertex_lines)
+
+            if face_lines:
+                counts = np.array([len(line.split()) for line in face_lines], dtype=np.int64)
+                assert counts.min() >= 3, 'Faces need at least 3 vertices'
+                indices = np.array(_OBJ_REFERENCES.sub(b'', b' '.join(face_lines)).split(), dtype=np.int64)
+                before = np.repeat(np.array(before, dtype=np.int64), counts)
+                index_blocks.append(np.where(indices < 0, indices + before, indices - 1))
+                count_blocks.append(counts)
+
+    vertices = np.concatenate(vertex_blocks) if vertex_blocks else np.zeros((0, 3))
+    indices = np.concatenate(index_blocks) if index_blocks else np.zeros(0, dtype=np.int64)
+    counts = np.concatenate(count_blocks) if count_blocks else np.zeros(0, dtype=np.int64)
+    assert indices.size == 0 or (0 <= indices.min() and indices.max() < len(vertices)), 'Face index out of range'
+
+    if len(counts) == 0:
+        faces = np.zeros((0, 3), dtype=np.int64)
+    elif (counts == counts[0]).all():
+        faces = indices.reshape(-1, int(counts[0]))
+    else: #Fans: face v0 v1 ... vk becomes triangles (v0, vj, vj+1)
+        fans = counts - 2
+        firsts = np.repeat(np.cumsum(counts) - counts, fans)
+        j = np.arange(int(fans.sum())) - np.repeat(np.cumsum(fans) - fans, fans) + 1
+        faces = np.stack((indices[firsts], indices[firsts + j], indices[firsts + j + 1]), axis=1)
+
+    if flip_z: vertices[:,2] *= -1
+    return vertices, faces
+
+def load_stl(path: str, flip_z: bool = True) -> ('(N,3) vertices', '(M,3) faces'):
+    '''
+    Reads the triangles of a binary .stl file, a block at a time, and joins their corners into shared vertices.
+    '''
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.read(80) #Header
+        count = int(np.frombuffer(f.read(4), dtype='<u4')[0]) if size >= 84 else -1
+        assert size == 84 + _STL_RECORD.itemsize*count, 'Not a binary STL file (ASCII STL isn\'t supported)'
+
+        corners = np.empty((3*count, 3), dtype=np.float32)
+        block = _BLOCK_BYTES//_STL_RECORD.itemsize
+        for start in range(0, count, block):
+            records = np.fromfile(f, dtype=_STL_RECORD, count=min(block, count - start))
+            corners[3*start:3*(start + len(records))] = records['points'].reshape(-1, 3)
+
+    vertices, faces = _weld(corners)
+    vertices = vertices.astype(float)
+    faces = faces.reshape(-1, 3)
+    if flip_z: vertices[:,2] *= -1
+    return vertices, faces
+
+def write_cache(path: str, vertices, faces, flip_z: bool = True):
+    '''
+    Writes the arrays loaded from the mesh file at path to its cache file (a header, then the raw arrays).
+    '''
+    vertices = np.ascontiguousarray(vertices, dtype='<f8').reshape(-1, 3)
+    faces = np.ascontiguousarray(faces, dtype='<i8')
+    source = os.stat(path)
+    header = np.array([source.st_size, source.st_mtime_ns, int(flip_z), len(vertices), len(faces), faces.shape[1]], dtype='<i8')
+
+    temporary = path + CACHE_SUFFIX + '.tmp' #Written under another name first, so a half written cache is never read
+    with open(temporary, 'wb') as f:
+        f.write(_CACHE_MAGIC)
+        f.write(header.tobytes())
+        vertices.tofile(f)
+        faces.tofile(f)
+    os.replace(temporary, path + CACHE_SUFFIX)
+
+def read_cache(path: str, flip_z: bool = True) -> ('(N,3) vertices', '(M,k) faces'):
+    '''
+    Returns the memory mapped arrays from the mesh file at path's cache file, None if there is no cache or it is out
+      of date.
+    '''
+    try:
+        source = os.stat(path)
+        with open(path + CACHE_SUFFIX, 'rb') as f:
+            header = f.read(_HEADER_SIZE)
+    except OSError:
+        return None
+    if len(header) != _HEADER_SIZE or not header.startswith(_CACHE_MAGIC): return None
+    size, mtime, flipped, vertex_count, face_count, face_size = np.frombuffer(header, dtype='<i8', offset=len(_CACHE_MAGIC)).tolist()
+    if (size, mtime, flipped) != (source.st_size, source.st_mtime_ns, int(flip_z)): return None
+
+    vertices = np.zeros((0, 3))
+    faces = np.zeros((0, face_size), dtype=np.int64)
+    if vertex_count: vertices = np.memmap(path + CACHE_SUFFIX, dtype='<f8', mode='r', offset=_HEADER_SIZE, shape=(vertex_count, 3))
+    if face_count: faces = np.memmap(path + CACHE_SUFFIX, dtype='<i8', mode='r', offset=_HEADER_SIZE + 24*vertex_count, shape=(face_count, face_size))
+    return vertices, faces
+
+def _weld(corners: 'np.ndarray') -> ('(N,3) vertices', '(M,) indices'):
+    '''
+    Joins corners at exactly the same spot into one vertex (numbered in the order they first show up), returns the
+      vertices and each corner's vertex index. Sorts one 64 bit hash per corner instead of the corners themselves,
+      which is a lot faster, and checks the result (falling back to sorting the corners if two hashes collide).
+    '''
+    if len(corners) == 0: return corners, np.zeros(0, dtype=np.int64)
+    bits = (corners + np.float32(0)).view(np.uint32).astype(np.uint64) #+0 makes -0.0 into 0.0
+    keys = bits[:,0]*np.uint64(0x9E3779B97F4A7C15) ^ bits[:,1]*np.uint64(0xC2B2AE3D27D4EB4F) ^ bits[:,2]*np.uint64(0x165667B19E3779F9)
+    order = np.argsort(keys)
+    keys = keys[order]
+    new = np.empty(len(keys), dtype=bool)
+    new[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=new[1:])
+    firsts = np.minimum.reduceat(order, np.flatnonzero(new)) #The first corner of every vertex
+    ranks = np.empty(len(firsts), dtype=np.int64)
+    ranks[np.argsort(firsts)] = np.arange(len(firsts))
+    indices = np.empty(len(order), dtype=np.int64)
+    indices[order] = ranks[np.cumsum(new) - 1]
+    vertices = corners[np.sort(firsts)]
+
+    if not (vertices[indices] == corners).all(): #A hash collision
+        vertices, indices = np.unique(corners, axis=0, return_inverse=True)
+        indices = indices.reshape(-1).astype(np.int64)
+    return vertices, indices
@@ -1,67 +1,270 @@
 import shapes
-from linear_algebra import Vector
+from linear_algebra import Vector, Vec3, Matrix
 from rotation import Rotation
-import math
+from node import Node, merge_spheres
+from draw_buffer import DrawBuffer
 
+import numpy as np
 
-class Model:
 
-    def __init__(self, *sub_objects, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0)):
-        self._loc = location
-        self._rot = rotation
-        self._objects = [*sub_objects]
-
-    def move(self, movement: Vector):
-        '''
-        Moves the object's location by just adding it to movement.
-        '''
-        self._loc += movement
+class Model(Node):
+    '''
+    A node holding other nodes (shapes and Models), which move along with it.
+    A frozen Model (see freeze) draws from its faces baked into world space arrays instead of drawing every object.
+    '''
 
-    def move_rotation(self, movement: Vector):
-        '''
-        Moves the object relative to the object's rotation.
-        '''
-        self._loc += movement*self._rot
-
-    def rotate(self, rotation: Rotation):
-        self._rot += rotation
+    def __init__(self, *sub_objects, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0)):
+        Node.__init__(self, location, rotation)
+        self._objects = []
+        self._frozen = False
+        self._baked = None
+        self._baked_world = None #The world matrix and bounds the bake was made with
+        self._baked_bounds = None
+        for o in sub_objects:
+            self.add_object(o)
 
     def add_object(self, obj):
         self._objects.append(obj)
+        obj._parent = self
+        self._contents_changed()
 
-    def draw(self, camera, higher_movement: [Vector] = list(), higher_rotation: [Rotation] = list()) \
+    def draw(self, camera, parent_matrix: Matrix = None) \
                     -> ['center distance', 'cam location', 'drawing type', 'drawing arguments (ex. list of vectors)']:
-        #newpts = mypoints*rotation + location
-        #newpts = newpts*higher_rotation + higher_movement
-        #cam(newpts)
-        #new_move = 
+        #Every sub object gets this model's world matrix, so each point only needs one transform
+        world = self.world_matrix(parent_matrix)
+        bounds = self.world_bounds(parent_matrix)
+        if not camera.sphere_visible(*bounds): #Skip the whole subtree
+            camera.culled_faces += self.face_count()
+            return []
+        if camera.occluded(*bounds):
+            camera.occluded_faces += self.face_count()
+            return []
+        if self._frozen:
+            return self._bake(parent_matrix).draw(camera)
 
         returning = []
+        unshaded, spots = [], [] #The single shapes get shaded all together at the end
+        for o in self._objects:
+            if isinstance(o, shapes.BaseObject):
+                face = o.draw_unshaded(camera, world)
+                if face is not None:
+                    unshaded.append(face)
+                    spots.append(len(returning))
+                    returning.append(None)
+            else:
+                returning.extend(o.draw(camera, world))
 
+        for spot, drawing in zip(spots, shapes.shade_drawings(camera, unshaded)):
+            returning[spot] = drawing
+        return returning
+
+    def draw_into(self, camera, buffer, parent_matrix: Matrix = None):
+        '''
+        Adds everything in front of the screen to a DrawBuffer (in the same order draw gives) instead of returning it.
+        '''
+        world = self.world_matrix(parent_matrix)
+        bounds = self.world_bounds(parent_matrix)
+        if not camera.sphere_visible(*bounds):
+            camera.culled_faces += self.face_count()
+            return
+        if camera.occluded(*bounds):
+            camera.occluded_faces += self.face_count()
+            return
+        if self._frozen:
+            self._bake(parent_matrix).draw_into(camera, buffer)
+            return
+
+        unshaded = [] #The single shapes go in with their own colors, which get shaded together in batches
         for o in self._objects:
             if isinstance(o, shapes.BaseObject):
-                returning.append(o.draw(camera, higher_movement + [self._loc], higher_rotation + [self._rot]))
+                face = o.draw_unshaded(camera, world)
+                if face is not None and face[0][1] == camera.IN_FRONT: unshaded.append(face)
             else:
-                returning.extend(o.draw(camera, higher_movement + [self._loc], higher_rotation + [self._rot]))
+                self._add_shaded(camera, buffer, unshaded) #Keeping the faces in the same order draw gives
+                unshaded = []
+                o.draw_into(camera, buffer, world)
+        self._add_shaded(camera, buffer, unshaded)
+
+    def freeze(self):
+        '''
+        For models that don't move: on the next draw, bakes every face under this model into world space arrays of
+          vertices, normals and centers, so from then on drawing it only culls, projects and shades them (all at once
+          instead of object by object).
+        Anything that would change the faces (this model, a parent or anything under it moving, or objects being
+          added) makes it bake again on the next draw, so it still draws right, just not faster.
+        '''
+        self._frozen = True
+
+    def thaw(self):
+        '''
+        Goes back to drawing every object on its own, and lets go of the baked arrays.
+        '''
+        self._frozen = False
+        self._baked = None
+        self._baked_world = None
+        self._baked_bounds = None
 
+    def frozen(self) -> bool:
+        return self._frozen
+
+    def nodes(self) -> [Node]:
+        returning = [self]
+        for o in self._objects:
+            returning.extend(o.nodes())
         return returning
 
-    def _translate_pt(self, v: Vector, higher_movement= Vector(0,0,0), higher_rotation = Rotation(0,0,0)) -> Vector:
+    def world_faces(self, parent_matrix: Matrix = None) -> [('world points', 'color', 'outline', 'drawing type', 'face id', 'cull back')]:
+        world = self.world_matrix(parent_matrix)
+        returning = []
+        for o in self._objects:
+            returning.extend(o.world_faces(world))
+        return returning
+
+    #Private methods
+    def _bake(self, parent_matrix: Matrix = None) -> '_BakedFaces':
         '''
-        Will translate a point based on this object's location, rotation, and a higher power's location+rotation.
+        Returns the baked faces, baking them again if they are stale. Anything changing under this model throws its
+          bounds away (see Node._contents_changed) and anything moving it replaces its world matrix, so the bake is
+          stale when it was made with different ones.
         '''
-        new_v = (self._rot*v) + self._loc
-        new_v = (higher_rotation*new_v) + higher_movement
-        return new_v
+        world = self.world_matrix(parent_matrix)
+        if self._baked is None or self._baked_world is not world or self._baked_bounds is not self._bounds:
+            self._baked = _BakedFaces(self.world_faces(parent_matrix))
+            self._baked_world = world
+            self._baked_bounds = self._bounds
+        return self._baked
+
+    @staticmethod
+    def _add_shaded(camera, buffer, unshaded: list):
+        '''
+        Shades a batch of faces from draw_unshaded and adds them to a DrawBuffer together.
+        '''
+        if unshaded: buffer.add_drawings([face[0] for face in unshaded], shapes.shade_colors(camera, unshaded))
+
+    def _compute_bounds(self) -> (Vec3, float):
+        return merge_spheres(o.parent_bounds() for o in self._objects)
+
+    def _compute_face_count(self) -> int:
+        return sum(o.face_count() for o in self._objects)
 
 
 class Cube(Model):
+    '''
+    A cube made of one Mesh, so each of its 8 corners is transformed and projected once per frame.
+    '''
+    _CORNERS = [(-1,-1,-1), (1,-1,-1), (1,1,-1), (-1,1,-1), (1,-1,1), (-1,-1,1), (-1,1,1), (1,1,1)]
+    _FACES = [(0,1,2,3), (4,5,6,7), (1,4,7,2), (5,0,3,6), (3,2,7,6), (5,4,1,0)]
+
     def __init__(self, edge_length, color, location, rotation):
-        sub_objs = []
-        sub_objs.append(shapes.Quadrilateral(Vector(-edge_length/2,-edge_length/2,0),Vector(edge_length/2,-edge_length/2,0),Vector(edge_length/2,edge_length/2,0),Vector(-edge_length/2,edge_length/2,0),color,location=Vector(0,0,-edge_length/2),rotation=Rotation(0,0,0)))
-        sub_objs.append(shapes.Quadrilateral(Vector(-edge_length/2,-edge_length/2,0),Vector(edge_length/2,-edge_length/2,0),Vector(edge_length/2,edge_length/2,0),Vector(-edge_length/2,edge_length/2,0),color,location=Vector(0,0,edge_length/2),rotation=Rotation(0,math.pi,0)))
-        sub_objs.append(shapes.Quadrilateral(Vector(-edge_length/2,-edge_length/2,0),Vector(edge_length/2,-edge_length/2,0),Vector(edge_length/2,edge_length/2,0),Vector(-edge_length/2,edge_length/2,0),color,location=Vector(edge_length/2,0,0),rotation=Rotation(0,math.pi/2,0)))
-        sub_objs.append(shapes.Quadrilateral(Vector(-edge_length/2,-edge_length/2,0),Vector(edge_length/2,-edge_length/2,0),Vector(edge_length/2,edge_length/2,0),Vector(-edge_length/2,edge_length/2,0),color,location=Vector(-edge_length/2,0,0),rotation=Rotation(0,-math.pi/2,0)))
-        sub_objs.append(shapes.Quadrilateral(Vector(-edge_length/2,-edge_length/2,0),Vector(edge_length/2,-edge_length/2,0),Vector(edge_length/2,edge_length/2,0),Vector(-edge_length/2,edge_length/2,0),color,location=Vector(0,edge_length/2,0),rotation=Rotation(-math.pi/2,0,0)))
-        sub_objs.append(shapes.Quadrilateral(Vector(-edge_length/2,-edge_length/2,0),Vector(edge_length/2,-edge_length/2,0),Vector(edge_length/2,edge_length/2,0),Vector(-edge_length/2,edge_length/2,0),color,location=Vector(0,-edge_length/2,0),rotation=Rotation(math.pi/2,0,0)))
-        Model.__init__(self,*sub_objs,location= location,rotation= rotation)
\ No newline at end of file
+        corners = [[i*edge_length/2 for i in corner] for corner in self._CORNERS]
+        Model.__init__(self, shapes.Mesh(corners, self._FACES, color, cull_back=True), location= location, rotation= rotation)
+
+    @staticmethod
+    def instances(edge_length, locations, rotations = None, colors = None, color = None) -> shapes.InstancedMesh:
+        '''
+        Returns many cubes as one InstancedMesh: a (K,3) array of locations, optionally (K,3) rotation angles and
+          (K,3) or (K,4) colors (otherwise they are all color).
+        '''
+        corners = [[i*edge_length/2 for i in corner] for corner in Cube._CORNERS]
+        return shapes.InstancedMesh(corners, Cube._FACES, locations, rotations, colors, color, cull_back=True)
+
+
+class _BakedFaces:
+    '''
+    Faces (from world_faces) baked into flat arrays for a frozen Model: the vertices (shared corners joined), every
+      face's corners (indices into the vertices, one face after the other), normal, center and bounding sphere.
+    '''
+    def __init__(self, faces: [('world points', 'color', 'outline', 'drawing type', 'face id', 'cull back')]):
+        lengths = [len(face[0]) for face in faces]
+        self._lengths = np.array(lengths, dtype=np.intp)
+        self._starts = np.cumsum(self._lengths) - self._lengths
+        self._faces = [(outline, draw_type, face_id) for points, color, outline, draw_type, face_id, cull_back in faces]
+        self._draw_types = np.array([face[3] for face in faces], dtype=np.int8)
+        self._outlines = np.array([DrawBuffer.NO_COLOR if face[2] == None else (*face[2][:3], face[2][3] if len(face[2]) > 3 else 255)
+                                    for face in faces], dtype=float).reshape(-1, 4)
+        self._face_ids = np.array([face[4] for face in faces], dtype=np.int64)
+        self._cull_back = np.array([face[5] for face in faces], dtype=bool)
+        self._colors = np.array([(0,0,0,255) if color == None else (*color[:3], color[3] if len(color) > 3 else 255)
+                                    for points, color, *rest in faces], dtype=float).reshape(-1, 4)
+
+        points = np.array([p for face in faces for p in face[0]], dtype=float).reshape(-1, 3)
+        self._vertices, self._corners = points, np.zeros(0, dtype=np.intp)
+        self._normals, self._centers, self._bound_centers, self._radii = np.zeros((0, 3)), np.zeros((0, 3)), np.zeros((0, 3)), np.zeros(0)
+        if not faces: return
+
+        self._vertices, corners = np.unique(points, axis=0, return_inverse=True)
+        self._corners = corners.reshape(-1)
+        starts = self._starts
+        self._normals = np.cross(points[starts + 1] - points[starts], points[starts + 2] - points[starts + 1])
+        self._centers = np.add.reduceat(points, starts)/self._lengths[:,None]
+        #Bounding spheres centered on each face's bounding box, like the shapes' own
+        self._bound_centers = (np.minimum.reduceat(points, starts) + np.maximum.reduceat(points, starts))/2
+        self._radii = np.maximum.reduceat(np.linalg.norm(points - np.repeat(self._bound_centers, self._lengths, axis=0), axis=1), starts)
+
+    def draw(self, camera) -> [('center distance', 'cam location', 'drawing type', 'drawing arguments (ex. list of vectors)', 'face id')]:
+        '''
+        Returns the drawings of the faces (in the same order), throwing away off screen faces, and back facing faces
+          of ones with cull back, before projecting.
+        '''
+        projected = self._project(camera)
+        if projected is None: return []
+        order, starts, lengths, screen, locations, depths, colors = projected
+
+        vertex_depths = depths.tolist()
+        face_depths = np.maximum.reduceat(depths, starts).tolist()
+        face_locations = np.maximum.reduceat(locations, starts).tolist()
+        screen = screen.tolist() #[x, y] lists, which pygame takes as points just like Vectors
+        colors = colors.tolist()
+        ends = (starts + lengths).tolist()
+        starts = starts.tolist()
+
+        faces = self._faces
+        returning = []
+        for i, face in enumerate(order.tolist()):
+            outline, draw_type, face_id = faces[face]
+            returning.append((face_depths[i], face_locations[i], draw_type, screen[starts[i]:ends[i]], colors[i], outline, vertex_depths[starts[i]:ends[i]], face_id))
+        return returning
+
+    def draw_into(self, camera, buffer):
+        '''
+        Adds the faces in front of the screen to a DrawBuffer, as arrays, instead of returning them.
+        '''
+        projected = self._project(camera)
+        if projected is None: return
+        order, starts, lengths, screen, locations, depths, colors = projected
+        buffer.add_faces(np.maximum.reduceat(depths, starts), self._draw_types[order], screen, depths, lengths, colors,
+                         self._outlines[order], self._face_ids[order], keep = np.maximum.reduceat(locations, starts) == camera.IN_FRONT)
+
+    #Private methods
+    def _project(self, camera) -> ('faces', 'starts', 'lengths', '(P,2) screen points', '(P,) locations', '(P,) depths', '(M,4) colors'):
+        '''
+        Culls, projects and shades the faces, returns the indices of the ones left, where each one's points start and
+          how many there are, every one of their points projected and their shaded colors. None if none are left.
+        '''
+        if len(self._faces) == 0: return None
+        eye = np.array(tuple(camera.location()), dtype=float)
+        cam_to_center = self._centers - eye
+        keep = camera.spheres_visible(self._bound_centers, self._radii)
+        keep &= ~self._cull_back | (np.einsum('ij,ij->i', self._normals, cam_to_center) > 0)
+        occluded = keep & camera.spheres_occluded(self._bound_centers, self._radii)
+        camera.culled_faces += len(keep) - int(keep.sum())
+        camera.occluded_faces += int(occluded.sum())
+        order = np.flatnonzero(keep & ~occluded)
+        if len(order) == 0: return None
+        cam_to_center, normals = cam_to_center[order], self._normals[order]
+
+        #Only project the vertices the kept faces use, each one once
+        with camera.profiler.stage('project'):
+            lengths = self._lengths[order]
+            starts = np.cumsum(lengths) - lengths
+            corners = self._corners[np.repeat(self._starts[order] - starts, lengths) + np.arange(lengths.sum())]
+            used = np.zeros(len(self._vertices), dtype=bool)
+            used[corners] = True
+            corners = (np.cumsum(used) - 1)[corners] #Now indices into the used vertices
+            screen, locations, depths = camera.project_many(self._vertices[used])
+            screen, locations, depths = screen[corners], locations[corners], depths[corners]
+
+        with camera.profiler.stage('shade'):
+            colors = camera.lighting.shade(normals, cam_to_center, self._colors[order])
+
+        return order, starts, lengths, screen, locations, depths, colors
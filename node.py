@@ -0,0 +1,216 @@
+from linear_algebra import Vector, Vec3, Matrix
+from rotation import Rotation
+
+
+class Node:
+    '''
+    Anything in the scene with a location and rotation (Models and BaseObjects).
+    Keeps its full world transform (its own transform followed by every parent's) as one cached
+      4x4 affine matrix. The cache is rebuilt only when this node moves/rotates, or when the parent's
+      world matrix it was built from is replaced (which only happens when an ancestor moved/rotated).
+    Also keeps a bounding sphere around everything it draws (in its own space) for culling. Moving a node
+      only changes its parent's (and their parents') bounds, so those are thrown away up the chain.
+    Every node also has a version, which goes up whenever it or anything under it changes (see Renderer's
+      track_changes), and an edit count, which only goes up for changes other than nodes moving (see ScenePool).
+    '''
+
+    def __init__(self, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0)):
+        self._loc = Vec3(*location)
+        self._rot = rotation
+
+        self._local_matrix = None
+        self._world_matrix = None
+        self._world_parent = None #The parent world matrix self._world_matrix was built from
+
+        self._parent = None #Set when added to a Model
+        self._bounds = None
+        self._face_count = None
+        self._bounds_listener = None #For top level nodes, called with the node when its world bounds change (see BVH)
+        self._version = 0
+        self._edits = 0
+
+    def move(self, movement: Vector):
+        '''
+        Moves the object's location by just adding it to movement.
+        '''
+        self._loc += movement
+        self._transform_changed()
+
+    def move_rotation(self, movement: Vector):
+        '''
+        Moves the object relative to the object's rotation.
+        '''
+        self._loc += self._rot*Vec3(*movement)
+        self._transform_changed()
+
+    def rotate(self, rotation: Rotation):
+        self._rot += rotation
+        self._transform_changed()
+
+    def local_matrix(self) -> Matrix:
+        '''
+        Returns the 4x4 affine matrix for this node's own rotation then location.
+        '''
+        if self._local_matrix is None:
+            self._local_matrix = Matrix.affine(self._rot.matrix(), self._loc)
+        return self._local_matrix
+
+    def world_matrix(self, parent_matrix: Matrix = None) -> Matrix:
+        '''
+        Returns the 4x4 affine matrix taking points in this node's space to world space, given the
+          parent's world matrix (None for a top level node).
+        '''
+        if self._world_matrix is None or self._world_parent is not parent_matrix:
+            local = self.local_matrix()
+            self._world_matrix = local if parent_matrix is None else local@parent_matrix
+            self._world_parent = parent_matrix
+        return self._world_matrix
+
+    def bounds(self) -> (Vec3, float):
+        '''
+        Returns the center and radius of a sphere around everything this node draws, in its own space
+          (before its own rotation/location).
+        '''
+        if self._bounds is None:
+            self._bounds = self._compute_bounds()
+        return self._bounds
+
+    def parent_bounds(self) -> (Vec3, float):
+        '''
+        Returns the bounding sphere in the parent's space (after this node's rotation/location).
+        '''
+        center, radius = self.bounds()
+        return self.local_matrix().transform_point(center), radius
+
+    def world_bounds(self, parent_matrix: Matrix = None) -> (Vec3, float):
+        '''
+        Returns the bounding sphere in world space.
+        '''
+        center, radius = self.bounds()
+        return self.world_matrix(parent_matrix).transform_point(center), radius
+
+    def face_count(self) -> int:
+        '''
+        Returns how many faces this node draws.
+        '''
+        if self._face_count is None:
+            self._face_count = self._compute_face_count()
+        return self._face_count
+
+    def version(self) -> int:
+        '''
+        Returns a number that goes up every time this node or anything under it moves, rotates or otherwise changes
+          what it draws, so if it's the same as before the node draws the same as before (from the same camera).
+        '''
+        return self._version
+
+    def edits(self) -> int:
+        '''
+        Returns a number that goes up every time what this node or anything under it draws changes other than by
+          nodes moving or rotating (like objects being added), so if it's the same as before, setting every node's
+          location and rotation is enough to make a copy draw the same.
+        '''
+        return self._edits
+
+    def nodes(self) -> ['Node']:
+        '''
+        Returns this node and every node under it, parents before their children (always in the same order).
+        '''
+        return [self]
+
+    def transform(self) -> (Vec3, Rotation):
+        '''
+        Returns this node's location and rotation.
+        '''
+        return self._loc, self._rot
+
+    def set_transform(self, location: Vector, rotation: Rotation):
+        '''
+        Moves and rotates this node to the given location and rotation (not relative to the current ones).
+        '''
+        self._loc = Vec3(*location)
+        self._rot = rotation
+        self._transform_changed()
+
+    def world_faces(self, parent_matrix: Matrix = None) -> [('world points', 'color', 'outline', 'drawing type', 'face id', 'cull back')]:
+        '''
+        Returns every face this node draws, in world space, as (list of (x, y, z) points, color, outline color,
+          drawing type, face id, cull back) tuples. For geometry that gets preprocessed as a whole (see BSPTree).
+        '''
+        return []
+
+    #Private methods
+    def _transform_state(self) -> tuple:
+        '''
+        Returns this node's transform along with the matrices cached for it, for _restore_transform.
+        '''
+        return self._loc, self._rot, self._local_matrix, self._world_matrix, self._world_parent
+
+    def _restore_transform(self, state: tuple):
+        '''
+        Puts back a transform from _transform_state, cached matrices and all, without _transform_changed: the
+          version stays and the bounds listener isn't called (the parents' bounds are only thrown away). For undoing
+          a move that is made again before anything is drawn (see Interpolation), _transform_changed has to be
+          called after otherwise.
+        '''
+        self._loc, self._rot, self._local_matrix, self._world_matrix, self._world_parent = state
+        node = self._parent
+        while node is not None and node._bounds is not None:
+            node._bounds = None
+            node = node._parent
+
+    def _compute_bounds(self) -> (Vec3, float):
+        return Vec3(0,0,0), 0
+
+    def _compute_face_count(self) -> int:
+        return 0
+
+    def _transform_changed(self):
+        '''
+        Throws away the cached matrices. Children notice on their own, since this node's world matrix
+          will be a new object next time it is passed down to them. The parent's bounds include this node's
+          transform though, so those are thrown away.
+        '''
+        self._local_matrix = None
+        self._world_matrix = None
+        self._version += 1
+        if self._parent is not None: self._parent._contents_changed(edited=False)
+        elif self._bounds_listener is not None: self._bounds_listener(self)
+
+    def _contents_changed(self, edited: bool = True):
+        '''
+        Throws away the cached bounds/face count here and in every parent. Stops early when they are already
+          gone, since a parent can't have cached bounds without its children having them. The versions (and with
+          edited, the edit counts) go up all the way though.
+        '''
+        node = self
+        while node is not None:
+            node._version += 1
+            if edited: node._edits += 1
+            node = node._parent
+
+        node = self
+        while node is not None and (node._bounds is not None or node._face_count is not None):
+            node._bounds = None
+            node._face_count = None
+            if node._parent is None and node._bounds_listener is not None: node._bounds_listener(node)
+            node = node._parent
+
+
+def sphere_around(points: [Vector]) -> (Vec3, float):
+    '''
+    Returns the center and radius of a sphere holding all the points (centered on their bounding box).
+    '''
+    points = [Vec3(*p) for p in points]
+    if not points: return Vec3(0,0,0), 0
+    center = Vec3(*((min(p[i] for p in points) + max(p[i] for p in points))/2 for i in range(3)))
+    return center, max((p-center).mag() for p in points)
+
+def merge_spheres(spheres: [(Vec3, float)]) -> (Vec3, float):
+    '''
+    Returns the center and radius of a sphere holding all of the given spheres.
+    '''
+    spheres = list(spheres)
+    if not spheres: return Vec3(0,0,0), 0
+    center = Vec3(*((min(c[i]-r for c, r in spheres) + max(c[i]+r for c, r in spheres))/2 for i in range(3)))
+    return center, max((c-center).mag() + r for c, r in spheres)
@@ -0,0 +1,180 @@
+import math
+
+import numpy as np
+
+
+class OcclusionBuffer:
+    '''
+    A low resolution depth buffer of a few big objects (occluders), to skip whatever is hidden behind them before its
+      faces are projected and shaded.
+    Every cell (CELL x CELL pixels) keeps the depth of the nearest occluder face that covers it completely, taking
+      the face's farthest point (what the painter's algorithm sorts it by, so the face really is drawn over anything
+      farther). Only filled faces fully in front of the screen count (and only facing the camera if they have cull
+      back), so it never hides something that would have shown.
+    On top of the cells there is a pyramid of coarser levels, each keeping the farthest depth of 2x2 cells of the
+      level below. A sphere is hidden if its nearest point is farther than that over every cell its screen rect
+      touches, which is read from the level where the rect is at most 2 cells across (4 lookups, hierarchical Z).
+    '''
+    CELL = 8 #Pixels per cell side
+    MARGIN = 2 #Pixels added around tested spheres, for outlines
+
+    def __init__(self, screen_size: (int, int)):
+        self._size = screen_size
+        self._columns = max(1, math.ceil(screen_size[0]/self.CELL))
+        self._rows = max(1, math.ceil(screen_size[1]/self.CELL))
+        self._levels = [np.full((self._rows, self._columns), np.inf)]
+        self._matrix = None
+        self._reach = None
+
+        #Stats for the last build
+        self.occluders = 0
+        self.occluder_faces = 0
+
+    def size(self) -> (int, int):
+        return self._size
+
+    def build(self, camera, occluders: list):
+        '''
+        Clears the buffer and draws the occluders' faces (anything with world_faces) into it, as seen from camera.
+        '''
+        m = np.array(camera.view_projection().values(), dtype=float).reshape(4, 4)
+        self._matrix = m.ravel().tolist()
+        self._reach = tuple(np.linalg.norm(m[:3], axis=0).tolist()) #How far each column moves per unit moved in the world
+        eye = np.array(tuple(camera.location()), dtype=float)
+        depths = np.full((self._rows, self._columns), np.inf)
+
+        self.occluders = len(occluders)
+        self.occluder_faces = 0
+        for o in occluders:
+            for points, color, outline, draw_type, face_id, cull_back in o.world_faces():
+                if color == None or len(points) < 3: continue #Not filled
+                if cull_back:
+                    (ax, ay, az), (bx, by, bz), (cx, cy, cz) = points[0], points[1], points[2]
+                    ux, uy, uz, vx, vy, vz = bx - ax, by - ay, bz - az, cx - bx, cy - by, cz - bz
+                    to_face = np.mean(points, axis=0) - eye
+                    if (uy*vz - uz*vy)*to_face[0] + (uz*vx - ux*vz)*to_face[1] + (ux*vy - uy*vx)*to_face[2] <= 0: continue
+                points = np.array(points, dtype=float)
+                projected = points@m[:3] + m[3] #(x*w, y*w, depth, w)
+                if (projected[:,2] <= 0).any() or (projected[:,3] <= 0).any(): continue #Not fully in front
+                if self._fill_face(depths, projected[:,:2]/projected[:,3:], projected[:,2].max()):
+                    self.occluder_faces += 1
+
+        #Each level keeps the farthest of every 2x2 cells below (cells past the edge count as hidden by nothing)
+        self._levels = [depths]
+        while depths.shape[0] > 1 or depths.shape[1] > 1:
+            rows, columns = depths.shape
+            padded = np.full((rows + rows % 2, columns + columns % 2), np.inf)
+            padded[:rows, :columns] = depths
+            depths = np.maximum(np.maximum(padded[0::2, 0::2], padded[1::2, 0::2]), np.maximum(padded[0::2, 1::2], padded[1::2, 1::2]))
+            self._levels.append(depths)
+
+    def occluded(self, center, radius: float) -> bool:
+        '''
+        Returns True if a sphere (in world space) is certainly hidden behind the occluders.
+        '''
+        if self._matrix == None: return False
+        m, (reach_x, reach_y, reach_depth, reach_w) = self._matrix, self._reach
+        x, y, z = center[0], center[1], center[2]
+        w = x*m[3] + y*m[7] + z*m[11] + m[15]
+        if w - radius*reach_w <= 0: return False #Reaches behind the focus, so its screen rect is unbounded
+        near = x*m[2] + y*m[6] + z*m[10] + m[14] - radius*reach_depth
+
+        #Every point of the sphere has x*w and y*w within radius*reach of the center's, and w too, so its screen
+        #point is between the ratios of those ranges' ends
+        sx, sy = x*m[0] + y*m[4] + z*m[8] + m[12], x*m[1] + y*m[5] + z*m[9] + m[13]
+        near_w, far_w = w - radius*reach_w, w + radius*reach_w
+        xs = ((sx - radius*reach_x)/near_w, (sx - radius*reach_x)/far_w, (sx + radius*reach_x)/near_w, (sx + radius*reach_x)/far_w)
+        ys = ((sy - radius*reach_y)/near_w, (sy - radius*reach_y)/far_w, (sy + radius*reach_y)/near_w, (sy + radius*reach_y)/far_w)
+        return self._hidden(min(xs), min(ys), max(xs), max(ys), near)
+
+    def spheres_occluded(self, centers, radii) -> 'np.ndarray':
+        '''
+        occluded for an (N,3) array of centers and (N,) array of radii all at once, returns an (N,) bool array.
+        '''
+        centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        radii = np.broadcast_to(np.asarray(radii, dtype=float), (len(centers),))
+        hidden = np.zeros(len(centers), dtype=bool)
+        if self._matrix == None or len(centers) == 0: return hidden
+        m = np.array(self._matrix).reshape(4, 4)
+
+        reach = np.array(self._reach)*radii[:,None] #(N,4), like occluded
+        projected = centers@m[:3] + m[3]
+        w = projected[:,3]
+        testable = w - reach[:,3] > 0
+        near = projected[:,2] - reach[:,2]
+        ends = np.stack((w - reach[:,3], w + reach[:,3]), axis=1)
+        ends[~testable] = 1 #Untestable ones are thrown out
+        sides = np.stack((projected[:,:2] - reach[:,:2], projected[:,:2] + reach[:,:2]), axis=1)
+        ratios = sides[:,:,None,:]/ends[:,None,:,None] #(N,2,2,2): both ends of x*w and y*w over both ends of w
+        low, high = ratios.min(axis=(1,2)), ratios.max(axis=(1,2))
+
+        #Cells the rects touch, then the level where each rect is at most 2 cells across
+        left, top, right, bottom, inside = self._cells(low[:,0], low[:,1], high[:,0], high[:,1])
+        testable &= inside
+        span = np.maximum(np.maximum(right - left, bottom - top), 1)
+        level = np.minimum(np.ceil(np.log2(span)).astype(np.intp), len(self._levels) - 1)
+        farthest = np.full(len(centers), np.inf)
+        for l in np.unique(level[testable]).tolist():
+            which = np.flatnonzero(testable & (level == l))
+            depths = self._levels[l]
+            x0, y0 = left[which] >> l, top[which] >> l
+            x1, y1 = (right[which] - 1) >> l, (bottom[which] - 1) >> l
+            farthest[which] = np.maximum(np.maximum(depths[y0, x0], depths[y0, x1]), np.maximum(depths[y1, x0], depths[y1, x1]))
+        hidden[testable] = near[testable] > farthest[testable]
+        return hidden
+
+    #Private methods
+    def _hidden(self, min_x: float, min_y: float, max_x: float, max_y: float, near: float) -> bool:
+        '''
+        Returns True if everything in a screen rect is farther than near behind the occluders.
+        '''
+        cell = self.CELL
+        left, top = max(0, math.floor((min_x - self.MARGIN)/cell)), max(0, math.floor((min_y - self.MARGIN)/cell))
+        right = min(self._columns, math.floor((max_x + self.MARGIN)/cell) + 1)
+        bottom = min(self._rows, math.floor((max_y + self.MARGIN)/cell) + 1)
+        if left >= right or top >= bottom: return False #Off the screen
+        level = min(math.ceil(math.log2(max(right - left, bottom - top))), len(self._levels) - 1)
+        depths = self._levels[level]
+        x0, y0, x1, y1 = left >> level, top >> level, (right - 1) >> level, (bottom - 1) >> level
+        return near > max(depths[y0, x0], depths[y0, x1], depths[y1, x0], depths[y1, x1])
+
+    def _cells(self, min_x, min_y, max_x, max_y):
+        '''
+        _hidden's cells for arrays of rects: the cells (left, top, right, bottom, right and bottom not included) each
+          rect (plus MARGIN) touches, clipped to the buffer, and whether any are left.
+        '''
+        cell = self.CELL
+        left = np.clip(np.floor((min_x - self.MARGIN)/cell), 0, self._columns).astype(np.intp)
+        top = np.clip(np.floor((min_y - self.MARGIN)/cell), 0, self._rows).astype(np.intp)
+        right = np.clip(np.floor((max_x + self.MARGIN)/cell) + 1, 0, self._columns).astype(np.intp)
+        bottom = np.clip(np.floor((max_y + self.MARGIN)/cell) + 1, 0, self._rows).astype(np.intp)
+        return left, top, right, bottom, (left < right) & (top < bottom)
+
+    def _fill_face(self, depths: 'np.ndarray', screen: 'np.ndarray', depth: float) -> bool:
+        '''
+        Writes depth into the cells a face (its (k,2) screen points) covers completely, where it's nearer than what
+          is there. A cell is covered if all 4 corners are inside every edge, which for a face that isn't convex is
+          still inside it. Returns False if it covers no cell.
+        '''
+        cell = self.CELL
+        left = max(0, math.floor(screen[:,0].min()/cell))
+        top = max(0, math.floor(screen[:,1].min()/cell))
+        right = min(self._columns, math.ceil(screen[:,0].max()/cell))
+        bottom = min(self._rows, math.ceil(screen[:,1].max()/cell))
+        if left >= right or top >= bottom: return False
+
+        #Signed area, so every edge test points inwards whichever way the face winds
+        nxt = np.roll(screen, -1, axis=0)
+        area = float((screen[:,0]*nxt[:,1] - nxt[:,0]*screen[:,1]).sum())
+        if area == 0: return False
+        xs = np.arange(left, right + 1, dtype=float)*cell
+        ys = np.arange(top, bottom + 1, dtype=float)*cell
+        inside = np.ones((len(ys), len(xs)), dtype=bool)
+        for (ax, ay), (bx, by) in zip(screen.tolist(), nxt.tolist()):
+            edge = ((bx - ax)*(ys[:,None] - ay) - (by - ay)*(xs[None,:] - ax))*area
+            inside &= edge >= 0
+        covered = inside[:-1,:-1] & inside[1:,:-1] & inside[:-1,1:] & inside[1:,1:]
+        if not covered.any(): return False
+        cells = depths[top:bottom, left:right]
+        np.minimum(cells, np.where(covered, depth, np.inf), out=cells)
+        return True
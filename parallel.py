@@ -0,0 +1,359 @@
+from camera import Camera
+from linear_algebra import Vec3
+from rotation import Rotation, Quaternion
+import shapes
+
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+import pickle
+import weakref
+
+import numpy as np
+
+_NO_COLOR = (math.nan,)*4 #The color fields of a drawing without one
+
+
+class ScenePool:
+    '''
+    Draws a list of top level objects (Models/shapes) across a pool of worker processes, each one doing the
+      transforms, projection and shading for its own share of the objects (split by face count).
+    The workers start with their own copy of the scene (forked on the first frame, or restarted if objects are added),
+      and from then on only what changed is sent: the camera settings (lighting included) through a pipe, and the
+      locations and rotations of the nodes that moved, and the locations, rotations and colors of the instances of
+      InstancedMeshes that changed, through shared memory (the workers build the matrices themselves). A top level object changed any other way (see Node.edits) is pickled over to its worker again,
+      or the workers are restarted if it now has more or fewer faces. The drawings come back through shared memory
+      as flat arrays (no pickled Vectors), and are put back together in the same order a single process would draw
+      them, so the depth sorted frame is exactly the same. That includes the edges drawings of Meshes with
+      batch_edges, which have no fill color (NaN in the color fields).
+    Use start (sends the frame out) then finish (waits and collects it), so the main process can do other work
+      (like the static objects) while the workers draw.
+    '''
+    TRANSFORM_FIELDS = 8 #Per node: x, y, z, rotation kind (0 Rotation, 1 Quaternion), then x, y, z, order or w, x, y, z
+    FACE_FIELDS = 8 #Per face: distance, drawing type, red, green, blue, alpha (NaN for no color), face id, point count
+    POINT_FIELDS = 3 #Per point: x, y, depth
+    INSTANCE_FIELDS = 10 #Per instance: x, y, z, x, y, z angles, red, green, blue, alpha (NaN without instance colors)
+
+    def __init__(self, objects: list, workers: int):
+        assert workers >= 1
+        self._objects = objects #Not copied, so added objects get noticed
+        self._workers = workers
+        self._processes = []
+        self._node_count = None
+        self._finalizer = None
+        self._pending = None
+
+    def workers(self) -> int:
+        return self._workers
+
+    def start(self, camera: Camera, objects: list = None):
+        '''
+        Sends the frame to the workers: objects (default all of them, otherwise some of them in drawing order, like
+          a BVH query gives) are drawn through a copy of camera.
+        '''
+        assert self._pending is None, 'finish the last frame first'
+        nodes = [n for o in self._objects for n in o.nodes()]
+        if len(nodes) != self._node_count: self._restart(nodes) #Objects were added somewhere
+
+        #Objects changed other than by moving go over whole, or start the workers over if their drawings won't fit
+        edited = {i: o.world_faces() for i, o in enumerate(self._objects) if o.edits() != self._edits[i]}
+        if any(self._sizes(self._objects[i], faces) != self._sizes_of[i] for i, faces in edited.items()):
+            self._restart(nodes)
+            edited = {}
+        copies = {}
+        for i, faces in edited.items():
+            self._add_outlines(self._objects[i], faces)
+            self._edits[i] = self._objects[i].edits()
+            copies[i] = _pickle_object(self._objects[i])
+
+        #Only the nodes that moved since the last frame get written
+        transforms, sent = self._transforms, self._sent
+        for i, node in enumerate(nodes):
+            row = _pack_transform(*node.transform())
+            if row != sent[i]:
+                transforms[i] = row
+                sent[i] = row
+
+        #Same for the instances, of the InstancedMeshes that changed at all
+        changed = []
+        for j, (i, mesh, first) in enumerate(self._instanced):
+            if mesh.version() == self._instance_versions[j]: continue
+            self._instance_versions[j] = mesh.version()
+            rows = _pack_instances(mesh)
+            if not np.array_equal(self._instances[first:first + len(rows)], rows, equal_nan=True):
+                self._instances[first:first + len(rows)] = rows
+                changed.append(i)
+
+        indices = list(range(len(self._objects))) if objects is None else [self._index[id(o)] for o in objects]
+        settings = camera.settings()
+        for worker, connection in enumerate(self._connections):
+            connection.send((settings, [i for i in indices if self._worker_of[i] == worker],
+                             {i: copy for i, copy in copies.items() if self._worker_of[i] == worker}, changed))
+        self._pending = (camera, indices)
+
+    def finish(self) -> [['distance', 'drawing type', 'drawing arguments']]:
+        '''
+        Waits for the workers and returns everything in front of the screen, unsorted (like Renderer.collect).
+          Adds the workers' culled faces and projected vertices to the camera's stats.
+        '''
+        assert self._pending is not None, 'start a frame first'
+        camera, indices = self._pending
+        self._pending = None
+
+        #Per object: (worker, first face, face count, first point)
+        placed = {}
+        results = []
+        for worker, connection in enumerate(self._connections):
+            drawn, face_total, point_total, culled, projected = connection.recv()
+            camera.culled_faces += culled
+            camera.projected_vertices += projected
+            faces, points = self._results[worker]
+            results.append((faces[:face_total].tolist(), points[:point_total].tolist()))
+            face = point = 0
+            for i, face_count, point_count in drawn:
+                placed[i] = (worker, face, face_count, point)
+                face += face_count
+                point += point_count
+
+        outlines = self._outlines
+        drawings = []
+        for i in indices:
+            worker, face, face_count, point = placed[i]
+            faces, points = results[worker]
+            for dist, draw_type, r, g, b, a, face_id, count in faces[face:face + face_count]:
+                count = int(count)
+                face_id = int(face_id)
+                face_points = points[point:point + count]
+                point += count
+                color = None if math.isnan(r) else [r, g, b, a]
+                drawings.append([dist, int(draw_type), [[p[:2] for p in face_points], color, outlines[face_id], [p[2] for p in face_points]], face_id])
+        return drawings
+
+    def draw(self, camera: Camera, objects: list = None) -> [['distance', 'drawing type', 'drawing arguments']]:
+        '''
+        start and finish in one go.
+        '''
+        self.start(camera, objects)
+        return self.finish()
+
+    def close(self):
+        '''
+        Stops the workers and frees the shared memory (a new pool is started if it is used again).
+        '''
+        if self._finalizer is not None: self._finalizer()
+        self._processes = []
+        self._node_count = None
+        self._pending = None
+
+    #Private methods
+    def _restart(self, nodes: list):
+        self.close()
+        objects = self._objects
+        self._index = {id(o): i for i, o in enumerate(objects)}
+
+        #Sizes of everything a worker could send back, and the outlines (they pass through drawing untouched)
+        self._outlines = {}
+        self._sizes_of = []
+        for o in objects:
+            faces = o.world_faces()
+            self._sizes_of.append(self._sizes(o, faces))
+            self._add_outlines(o, faces)
+        face_counts = [faces for faces, points in self._sizes_of]
+        point_counts = [points for faces, points in self._sizes_of]
+        self._edits = [o.edits() for o in objects]
+
+        #Biggest objects first, each to the worker with the fewest faces so far
+        workers = max(1, min(self._workers, len(objects)))
+        loads = [0]*workers
+        self._worker_of = [0]*len(objects)
+        for i in sorted(range(len(objects)), key=lambda i: -face_counts[i]):
+            worker = loads.index(min(loads))
+            self._worker_of[i] = worker
+            loads[worker] += face_counts[i]
+
+        memory = [shared_memory.SharedMemory(create=True, size=max(1, len(nodes)*self.TRANSFORM_FIELDS*8))]
+        self._transforms = np.ndarray((len(nodes), self.TRANSFORM_FIELDS), dtype=float, buffer=memory[0].buf)
+        self._sent = [None]*len(nodes)
+
+        #Every InstancedMesh's instances get rows of their own: (node index, mesh, first row)
+        self._instanced = []
+        instance_rows = {} #Node index -> (first row, instance count)
+        row_count = 0
+        for i, node in enumerate(nodes):
+            if isinstance(node, shapes.InstancedMesh):
+                self._instanced.append((i, node, row_count))
+                instance_rows[i] = (row_count, node.instance_count())
+                row_count += node.instance_count()
+        memory.append(shared_memory.SharedMemory(create=True, size=max(1, row_count*self.INSTANCE_FIELDS*8)))
+        self._instances = np.ndarray((row_count, self.INSTANCE_FIELDS), dtype=float, buffer=memory[1].buf)
+        self._instance_versions = [None]*len(self._instanced) #None never matches, so they're all written on the first frame
+        self._results = []
+        self._connections = []
+        self._processes = []
+        node_starts = np.cumsum([0] + [len(o.nodes()) for o in objects]).tolist()
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        for worker in range(workers):
+            mine = [i for i in range(len(objects)) if self._worker_of[i] == worker]
+            face_capacity = sum(face_counts[i] for i in mine)
+            point_capacity = sum(point_counts[i] for i in mine)
+            faces = shared_memory.SharedMemory(create=True, size=max(1, face_capacity*self.FACE_FIELDS*8))
+            points = shared_memory.SharedMemory(create=True, size=max(1, point_capacity*self.POINT_FIELDS*8))
+            memory.extend((faces, points))
+            self._results.append((np.ndarray((face_capacity, self.FACE_FIELDS), dtype=float, buffer=faces.buf),
+                                  np.ndarray((point_capacity, self.POINT_FIELDS), dtype=float, buffer=points.buf)))
+
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=_work, daemon=True,
+                                      args=(worker_connection, objects, [(i, node_starts[i], node_starts[i+1]) for i in mine],
+                                            memory[0].name, len(nodes), memory[1].name, instance_rows,
+                                            faces.name, face_capacity, points.name, point_capacity))
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+        self._node_count = len(nodes)
+        self._finalizer = weakref.finalize(self, _shutdown, self._connections, self._processes, memory)
+
+    def _add_outlines(self, o, faces: [('world points', 'color', 'outline', 'drawing type', 'face id', 'cull back')]):
+        '''
+        Keeps the outlines of an object's faces (from its world_faces) and edges drawings by face id.
+        '''
+        for points, color, outline, draw_type, face_id, cull_back in faces:
+            self._outlines[face_id] = outline
+        for face_id, outline, point_count in self._edges(o):
+            self._outlines[face_id] = outline
+
+    @classmethod
+    def _sizes(cls, o, faces: [('world points', 'color', 'outline', 'drawing type', 'face id', 'cull back')]) -> (int, int):
+        '''
+        Returns the most faces and points an object's drawings can have, from its world_faces and edges drawings.
+        '''
+        edges = cls._edges(o)
+        return len(faces) + len(edges), sum(len(f[0]) for f in faces) + sum(point_count for face_id, outline, point_count in edges)
+
+    @staticmethod
+    def _edges(o) -> [('face id', 'outline', 'most points')]:
+        '''
+        Returns the edges drawing (see Mesh's batch_edges) of every Mesh under o that has one: its face id, outline
+          and the most points it can have (both ends of every edge of every copy).
+        '''
+        returning = []
+        for node in o.nodes():
+            if isinstance(node, shapes.Mesh) and node._batch_edges:
+                copies = node.instance_count() if isinstance(node, shapes.InstancedMesh) else 1
+                returning.append((node._edges_id, node._outline, 2*len(node._edge_strips()[0])*copies))
+        return returning
+
+
+def _shutdown(connections: list, processes: list, memory: list):
+    for connection in connections:
+        try:
+            connection.send(None)
+        except OSError: #Already gone
+            pass
+        connection.close()
+    for process in processes:
+        process.join()
+    for m in memory:
+        m.close()
+        m.unlink()
+
+def _pickle_object(o) -> bytes:
+    '''
+    Returns a pickled copy of a top level object for a worker, without its bounds listener (the BVH/BSPTree it
+      belongs to stays here).
+    '''
+    listener, o._bounds_listener = o._bounds_listener, None
+    try:
+        return pickle.dumps(o, pickle.HIGHEST_PROTOCOL)
+    finally:
+        o._bounds_listener = listener
+
+def _pack_instances(mesh: shapes.InstancedMesh) -> 'np.ndarray':
+    colors = mesh.colors()
+    return np.concatenate((mesh.locations(), mesh.rotations(),
+                           np.full((mesh.instance_count(), 4), np.nan) if colors is None else colors), axis=1)
+
+def _pack_transform(location: Vec3, rotation: Rotation) -> tuple:
+    if isinstance(rotation, Quaternion):
+        return (*location, 1, rotation[0], rotation[1], rotation[2], rotation[3])
+    order = rotation.order()
+    return (*location, 0, rotation[0], rotation[1], rotation[2], order[0]*9 + order[1]*3 + order[2])
+
+def _unpack_transform(row: list) -> (Vec3, Rotation):
+    x, y, z, kind, a, b, c, d = row
+    if kind == 1: return Vec3(x, y, z), Quaternion(a, b, c, d)
+    d = int(d)
+    return Vec3(x, y, z), Rotation(a, b, c, (d//9, d//3 % 3, d % 3))
+
+def _work(connection, objects: list, mine: [(int, int, int)], transforms_name: str, node_count: int,
+                instances_name: str, instance_rows: {int: (int, int)}, faces_name: str, face_capacity: int,
+                points_name: str, point_capacity: int):
+    '''
+    A worker process's loop: gets (camera settings, object indices, pickled copies of edited objects, InstancedMesh
+      node indices whose instances changed) for every frame, draws those objects and writes the drawings in front of
+      the screen to its shared face and point arrays.
+    '''
+    memory = [shared_memory.SharedMemory(name=name) for name in (transforms_name, instances_name, faces_name, points_name)]
+    transforms = np.ndarray((node_count, ScenePool.TRANSFORM_FIELDS), dtype=float, buffer=memory[0].buf)
+    instances = np.ndarray((sum(count for first, count in instance_rows.values()), ScenePool.INSTANCE_FIELDS), dtype=float, buffer=memory[1].buf)
+    faces = np.ndarray((face_capacity, ScenePool.FACE_FIELDS), dtype=float, buffer=memory[2].buf)
+    points = np.ndarray((point_capacity, ScenePool.POINT_FIELDS), dtype=float, buffer=memory[3].buf)
+
+    #Only this worker's nodes are kept in sync. Their copies don't belong to the main process's BVH/BSPTree
+    nodes = {}
+    first_node = {}
+    for i, first, last in mine:
+        objects[i]._bounds_listener = None
+        first_node[i] = first
+        for j, node in enumerate(objects[i].nodes()):
+            nodes[first + j] = node
+    synced = np.full((node_count, ScenePool.TRANSFORM_FIELDS), np.nan) #NaN never matches, so everything gets synced on the first frame
+
+    try:
+        while True:
+            message = connection.recv()
+            if message is None: break
+            settings, indices, copies, changed = message
+
+            for i, copy in copies.items(): #Edited objects replace the old copies (with the same node count)
+                objects[i] = pickle.loads(copy)
+                for j, node in enumerate(objects[i].nodes()):
+                    nodes[first_node[i] + j] = node
+            for i in changed:
+                if i in nodes:
+                    first, count = instance_rows[i]
+                    rows = instances[first:first + count]
+                    nodes[i].set_instances(rows[:,:3], rows[:,3:6], None if count == 0 or np.isnan(rows[0,6]) else rows[:,6:])
+            for i in np.flatnonzero((transforms != synced).any(axis=1)).tolist():
+                if i in nodes:
+                    nodes[i].set_transform(*_unpack_transform(transforms[i].tolist()))
+            synced[:] = transforms
+
+            camera = Camera(**settings)
+            drawn, face_rows, point_rows = [], [], []
+            for i in indices:
+                o = objects[i]
+                drawings = [o.draw(camera)] if isinstance(o, shapes.BaseObject) else o.draw(camera)
+                face_count = point_count = 0
+                for drawing in drawings:
+                    if drawing is None: continue #Culled
+                    dist, loc, draw_type, face_points, color, outline, depths, face_id = drawing
+                    if loc != Camera.IN_FRONT: continue
+                    face_rows.append((dist, draw_type, *(_NO_COLOR if color is None else color), face_id, len(face_points)))
+                    point_rows.extend((p[0], p[1], d) for p, d in zip(face_points, depths))
+                    face_count += 1
+                    point_count += len(face_points)
+                drawn.append((i, face_count, point_count))
+
+            if face_rows:
+                faces[:len(face_rows)] = face_rows
+                points[:len(point_rows)] = point_rows
+            connection.send((drawn, len(face_rows), len(point_rows), camera.culled_faces, camera.projected_vertices))
+    except (EOFError, KeyboardInterrupt): #The main process went away
+        pass
+    finally:
+        del transforms, instances, faces, points
+        for m in memory:
+            m.close()
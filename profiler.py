@@ -0,0 +1,176 @@
+from collections import deque
+import csv
+import json
+import time
+
+
+class _Stage:
+    '''
+    Times one stage. Time adds up if the stage is entered more than once in a frame.
+    '''
+    __slots__ = ('_totals', '_name', '_start')
+
+    def __init__(self, totals: dict, name: str):
+        self._totals = totals
+        self._name = name
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._totals[self._name] = self._totals.get(self._name, 0) + time.perf_counter() - self._start
+        return False
+
+
+class _NullStage:
+    '''
+    What a disabled Profiler hands out, does nothing.
+    '''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    '''
+    Opt-in per frame instrumentation. Time a stage with
+        with profiler.stage('sort'):
+            ...
+    and add to a counter with profiler.count('draw calls', n). Call end_frame() once per frame, which keeps the
+      last window frames of every stage/counter (for rolling percentiles) and writes a record to the stream if there is one.
+    When disabled, stage() hands out a shared object that does nothing and count() returns right away, so leaving the
+      calls in costs next to nothing.
+    The stream gets one record per frame as JSON lines: the frame's stage times (ms) and counters, plus the rolling
+      p50/p90/p99 of each stage. As CSV it gets one row per stage and counter every frame instead (frame, name, value
+      and, for stages, the rolling p50/p90/p99), so stages and counters that only show up after the first frame still
+      get written.
+    '''
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, enabled: bool = True, window: int = 120, stream = None, stream_format: str = 'json'):
+        assert stream_format in {'json', 'csv'}
+        self.enabled = enabled
+        self._window = window
+
+        self._frame = 0
+        self._times = {} #This frame's stage totals (seconds)
+        self._counts = {} #This frame's counters
+        self._stages = {} #Reused _Stage per name
+        self._history = {} #name -> deque of the last window frames' values
+
+        self._stream = stream
+        self._format = stream_format
+        self._csv = None
+
+    def stage(self, name: str):
+        '''
+        Returns a context manager timing the named stage.
+        '''
+        if not self.enabled: return _NULL_STAGE
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(self._times, name)
+        return stage
+
+    def count(self, name: str, amount: int = 1):
+        '''
+        Adds amount to the named counter for this frame.
+        '''
+        if not self.enabled: return
+        self._counts[name] = self._counts.get(name, 0) + amount
+
+    def end_frame(self):
+        '''
+        Finishes the frame: stores its values in the rolling window and streams a record.
+        '''
+        if not self.enabled: return
+        self._frame += 1
+        for name, seconds in self._times.items():
+            self._add_history(name, seconds*1000)
+        for name, amount in self._counts.items():
+            self._add_history(name, amount)
+
+        if self._stream is not None:
+            self._write_record()
+
+        self._times.clear()
+        self._counts.clear()
+
+    def percentiles(self, name: str, percentiles: (int) = PERCENTILES) -> [float]:
+        '''
+        Returns the given percentiles of the named stage (ms) or counter over the rolling window.
+        '''
+        values = sorted(self._history.get(name, ()))
+        if not values: return [0 for p in percentiles]
+        return [values[min(len(values)-1, int(len(values)*p/100))] for p in percentiles]
+
+    def stage_names(self) -> [str]:
+        return [name for name in self._history if name in self._stages]
+
+    def counter_names(self) -> [str]:
+        return [name for name in self._history if name not in self._stages]
+
+    def summary(self) -> dict:
+        '''
+        Returns {name: {'p50': ..., 'p90': ..., 'p99': ...}} for every stage and counter.
+        '''
+        return {name: dict(zip((f'p{p}' for p in self.PERCENTILES), self.percentiles(name))) for name in self._history}
+
+    def draw_overlay(self, surface, position: (int, int) = (5, 5), color = (255,255,255), font = None):
+        '''
+        Draws the rolling percentiles of every stage and counter onto a pygame Surface.
+        '''
+        if not self.enabled: return
+        import pygame
+
+        if font is None:
+            font = pygame.font.Font(None, 18)
+        rows = [('stage (ms)', [f'p{p}' for p in self.PERCENTILES])]
+        rows += [(name, [f'{v:.2f}' for v in self.percentiles(name)]) for name in self.stage_names()]
+        rows += [(name, [f'{v:.0f}' for v in self.percentiles(name)]) for name in self.counter_names()]
+
+        x, y = position
+        line = font.get_linesize()
+        background = pygame.Surface((130 + 50*len(self.PERCENTILES), len(rows)*line + 4), pygame.SRCALPHA)
+        background.fill((0,0,0,150))
+        surface.blit(background, (x-3, y-2))
+        for name, values in rows:
+            surface.blit(font.render(name, True, color), (x, y))
+            for i, value in enumerate(values):
+                text = font.render(value, True, color)
+                surface.blit(text, (x + 170 + 50*i - text.get_width(), y)) #Right aligned columns
+            y += line
+
+    #Private methods
+    def _add_history(self, name: str, value: float):
+        history = self._history.get(name)
+        if history is None:
+            history = self._history[name] = deque(maxlen=self._window)
+        history.append(value)
+
+    def _write_record(self):
+        if self._format == 'json':
+            record = {'frame': self._frame}
+            record.update((name, seconds*1000) for name, seconds in self._times.items())
+            record.update(self._counts)
+            for name in self._times:
+                for p, value in zip(self.PERCENTILES, self.percentiles(name)):
+                    record[f'{name} p{p}'] = value
+            self._stream.write(json.dumps(record) + '\n')
+            return
+
+        if self._csv is None:
+            self._csv = csv.writer(self._stream)
+            self._csv.writerow(['frame', 'name', 'value'] + [f'p{p}' for p in self.PERCENTILES])
+        for name, seconds in self._times.items():
+            self._csv.writerow([self._frame, name, seconds*1000] + self.percentiles(name))
+        for name, amount in self._counts.items():
+            self._csv.writerow([self._frame, name, amount] + ['']*len(self.PERCENTILES))
@@ -1,27 +1,59 @@
 from linear_algebra import Vector
 from rotation import Rotation
 from camera import Camera
+from renderer import Renderer
+from profiler import Profiler
+from frame_loop import FixedStepLoop
 import shapes
 from models import Model
 import models
+import argparse
 import math
 
 import pygame
 
 _FPS = 20
+_MAX_FPS = 120 #Drawing cap with fixed_step
 _WINDOW_SIZE = (800,500)
 _BG_COLOR = pygame.Color(100,100,100)
 
 class ThreeDApp:
-    def __init__(self):
+    def __init__(self, profile: bool = False, profile_output: str = None, depth_buffer: bool = False, workers: int = 0,
+                        fixed_step: bool = False, tick_rate: float = _FPS, occlusion: bool = False):
+        '''
+        profile turns on the per stage profiler overlay (F3 shows/hides it while running). profile_output is a .json or
+          .csv file to stream the profiler's per frame records to (hiding the overlay doesn't stop that). depth_buffer draws with the NumPy Rasterizer. workers
+          draws the moving objects in that many worker processes.
+        fixed_step runs the world at tick_rate ticks a second (see FixedStepLoop) and draws as often as it can (up to
+          _MAX_FPS), in between ticks, with frames drawn by a second thread (and put on the screen by this one).
+        occlusion skips whatever is hidden behind the biggest cubes (see Renderer), which redraws every frame instead
+          of only what changed.
+        '''
+        self._depth_buffer = depth_buffer
+        self._workers = workers
+        self._occlusion = occlusion
+        self._fixed_step = fixed_step
+        self._tick_rate = tick_rate if fixed_step else _FPS
+        self._step = _FPS/self._tick_rate #The world moves at the same speed at any tick rate
+        self._loop = None
+
         #Camera stuffs
         self._cam = None
+        self._renderer = None
+
+        #Profiling
+        self._profile_file = open(profile_output, 'w', newline='') if profile_output else None
+        self._profiler = Profiler(enabled = profile or profile_output != None, stream = self._profile_file,
+                                  stream_format = 'csv' if profile_output and profile_output.endswith('.csv') else 'json')
+        self._overlay = profile #Showing the overlay, separate from the profiler recording
         
         #Pygame
         self._running = True
         self._frame = 0
+        self._ticks = 0
         self._fps = 20
         self._surface = None
+        self._overlay_shown = False #The profiler overlay was drawn last frame, so it needs drawing over
 
         #Example shapes
         self._shapes = None
@@ -42,18 +74,26 @@ class ThreeDApp:
 
             self._initialize()
 
+            if self._fixed_step:
+                self._loop = FixedStepLoop(self._tick, self._build_frame, self._present_frame, self._movers,
+                                           self._tick_rate, _MAX_FPS, profiler = self._profiler, show = self._show_frame)
+
             while self._running:
-                clock.tick(self._fps)
                 self._frame += 1
+                if self._loop != None:
+                    self._loop.frame()
+                    continue
 
-                self._update_world()
-                self._handle_keys()
-                self._handle_mouse()
-
+                clock.tick(self._fps)
+                self._tick()
                 self._redraw()
+                self._profiler.end_frame()
 
         finally:
+            if self._loop != None: self._loop.close()
             pygame.quit()
+            if self._renderer != None: self._renderer.close()
+            if self._profile_file != None: self._profile_file.close()
 
     def _initialize(self) -> None:
         '''
@@ -76,7 +116,9 @@ class ThreeDApp:
         self._model3 = models.Cube(1000,(100,100,2555),location = Vector(0,0,2000),rotation=Rotation(0,0,0))
         self._shapes.append(self._model)
         self._shapes.append(self._model2)
-        self._shapes.append(self._model3)
+        self._renderer = Renderer(self._cam, self._shapes, self._profiler, static = [self._model3], #_model3 never moves
+                                  depth_buffer = self._depth_buffer, workers = self._workers,
+                                  occlusion = self._occlusion, track_changes = not self._occlusion)
         # self._model = Model(location = Vector(0,0,500), rotation=Rotation(0,.5,0))
         #self._shapes.append(self._model)
         #self._model.add_object(shapes.Quadrilateral(Vector(-100,-100,0),Vector(100,-100,0),Vector(100,100,0),Vector(-100,100,0),(255,100,100),location=Vector(0,0,-100),rotation=Rotation(0,0,0)))
@@ -98,17 +140,36 @@ class ThreeDApp:
 
         self._resize_display(_WINDOW_SIZE)
 
+    def _tick(self) -> None:
+        '''
+        One step of the world: updates it and handles input.
+        '''
+        self._ticks += 1
+        with self._profiler.stage('update'):
+            self._update_world()
+        with self._profiler.stage('input'):
+            self._handle_keys()
+            self._handle_mouse()
+
+    def _movers(self) -> list:
+        '''
+        Everything that moves from tick to tick (interpolated between ticks with fixed_step).
+        '''
+        return [n for s in self._shapes for n in s.nodes()] + [self._cam]
+
     def _update_world(self) -> None:
         '''
-        Updates the world once per frame, by checking events and such.        
+        Updates the world once per tick, by checking events and such.        
         '''
         for event in pygame.event.get():
             self._handle_event(event)
         
-        self._model.rotate((0,.05,0))
-        self._model.move((0,math.sin(self._frame/25)*2,0))
-        self._model2.rotate((0,-.03,0))
-        self._model2.move((0,-math.sin(self._frame/25)*3,0))
+        step = self._step
+        time = self._ticks*step
+        self._model.rotate((0,.05*step,0))
+        self._model.move((0,math.sin(time/25)*2*step,0))
+        self._model2.rotate((0,-.03*step,0))
+        self._model2.move((0,-math.sin(time/25)*3*step,0))
 
     def _handle_event(self, event) -> None:
         '''
@@ -118,8 +179,12 @@ class ThreeDApp:
             self._stop_running()
         elif event.type == pygame.VIDEORESIZE:
             self._resize_display(event.size)
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED): #What was on the window might be gone
+            self._renderer.invalidate()
         elif event.type == pygame.KEYDOWN:
-            pass
+            if event.key == pygame.K_F3:
+                self._overlay = not self._overlay
+                self._profiler.enabled = self._overlay or self._profile_file != None #Keeps recording while streaming
 
     def _handle_keys(self) -> None:
         '''
@@ -129,7 +194,7 @@ class ThreeDApp:
 
         movement = [0,0,0]
 
-        to_move = 10
+        to_move = 10*self._step
         if keys[pygame.K_LCTRL]:
             to_move *= 5
         if keys[pygame.K_LSHIFT]:
@@ -167,6 +232,33 @@ class ThreeDApp:
         '''
         Draws everything :)
         '''
+        self._show_frame(self._present_frame(self._build_frame()))
+
+    def _build_frame(self) -> ('draw list', 'dirty rects', 'profiler overlay'):
+        '''
+        Builds the frame to draw: the draw list and the parts of the screen that changed (None for all of it).
+        Only the parts of the screen that changed are drawn and updated (nothing at all if nothing moved), unless the
+          profiler overlay is showing, which changes every frame.
+        '''
+        drawings = self._renderer.draw_list()
+        rects = self._renderer.dirty_rects()
+        rates = f'{self._loop.tick_rate():.0f} ticks/s, {self._loop.frame_rate():.0f} fps - ' if self._loop != None else ''
+        occluded = f', {self._cam.occluded_faces} occluded' if self._occlusion else ''
+        pygame.display.set_caption(f'3D Space - {rates}{self._cam.culled_faces} faces culled{occluded}')
+        overlay = self._overlay
+        if overlay or self._overlay_shown: rects = None
+        self._overlay_shown = overlay
+        return drawings, rects, overlay
+
+    def _present_frame(self, frame: ('draw list', 'dirty rects', 'profiler overlay')) -> '[rects] or None':
+        '''
+        Draws a built frame onto the window's surface. Returns the parts of it to put on the screen (None for all of it).
+        '''
+        drawings, rects, overlay = frame
+        if rects != None:
+            if rects: self._renderer.draw(self._surface, drawings, _BG_COLOR, rects)
+            return rects
+
         #Background color
         pygame.draw.rect(self._surface, _BG_COLOR, 
                                     pygame.Rect(0, 0, self._surface.get_width(),
@@ -184,34 +276,20 @@ class ThreeDApp:
         if not behind: pygame.draw.polygon(self._surface, self._rect_color, rect_trans)
         '''
         #Shapes
-        drawings = []
-        for s in self._shapes:
-            if isinstance(s, shapes.BaseObject):
-                dist, loc, draw_type, *draw_args = s.draw(self._cam)
-                if loc == Camera.IN_FRONT:
-                    drawings.append([dist, draw_type, draw_args])
-            else: #model
-                shps = s.draw(self._cam)
-                for dist, loc, draw_type, *draw_args in shps:
-                    if loc == Camera.IN_FRONT:
-                        drawings.append([dist, draw_type, draw_args])
-
-
-        sort_dist = sorted(drawings, key=lambda x: x[0], reverse=True)
-        for s in sort_dist:
-            if s[1] == shapes.BaseObject.FILL:
-                pygame.draw.polygon(self._surface,s[2][1],s[2][0])
-            elif s[1] == shapes.BaseObject.OUTLINE:
-                pygame.draw.lines(self._surface, s[2][2],True,s[2][0],4)
-            elif s[1] == shapes.BaseObject.FILL_OUTLINE:
-                pygame.draw.polygon(self._surface,s[2][1],s[2][0])
-                pygame.draw.lines(self._surface, s[2][2],True,s[2][0],1)
-            elif s[1] == shapes.BaseObject.IMAGE:
-                pass
-            else:
-                pass
-
-        pygame.display.flip()
+        self._renderer.draw(self._surface, drawings)
+
+        if overlay: self._profiler.draw_overlay(self._surface)
+        return None
+
+    def _show_frame(self, rects: [(int, int, int, int)]) -> None:
+        '''
+        Puts the parts of the drawn frame _present_frame gave on the screen (all of it for None). Always called on the
+          main thread, since SDL only allows touching the display from there.
+        '''
+        if rects == []: return
+        with self._profiler.stage('present'):
+            if rects != None: pygame.display.update(rects)
+            else: pygame.display.flip()
 
     def _stop_running(self) -> None:
         '''
@@ -223,6 +301,7 @@ class ThreeDApp:
         '''
         Resizes the display.
         '''
+        if self._loop != None: self._loop.wait() #Not while a frame is being drawn onto the old one
         self._surface = pygame.display.set_mode(size, pygame.RESIZABLE)
         self._cam.resize(size)
 
@@ -244,4 +323,13 @@ class ThreeDApp:
         return returning
 
 if __name__ == '__main__':
-    ThreeDApp().run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='3D engine example.')
+    parser.add_argument('--profile', action='store_true', help='show the per stage profiler overlay (toggle with F3)')
+    parser.add_argument('--profile-output', metavar='FILE', help='stream per frame profiler records to a .json (JSON lines) or .csv file')
+    parser.add_argument('--depth-buffer', action='store_true', help='draw with the NumPy depth buffered rasterizer instead of pygame polygons')
+    parser.add_argument('--workers', type=int, default=0, metavar='N', help='draw the moving objects in N worker processes')
+    parser.add_argument('--fixed-step', action='store_true', help='run the world at a fixed tick rate and draw interpolated frames on a second thread')
+    parser.add_argument('--tick-rate', type=float, default=_FPS, metavar='HZ', help='world ticks per second with --fixed-step')
+    parser.add_argument('--occlusion', action='store_true', help='skip whatever is hidden behind the biggest cubes (occlusion culling)')
+    args = parser.parse_args()
+    ThreeDApp(args.profile, args.profile_output, args.depth_buffer, args.workers, args.fixed_step, args.tick_rate, args.occlusion).run()
\ No newline at end of file
@@ -0,0 +1,292 @@
+import itertools
+
+import numpy as np
+
+import shapes
+
+
+class Rasterizer:
+    '''
+    Software rasterizer: fills a draw list's faces into a color buffer, keeping a depth buffer so the nearest face
+      wins at every pixel (no depth sort needed, and faces cutting through each other come out right).
+    Works on whole batches of triangles at once with NumPy (polygons are split into triangle fans), so lots of small
+      faces cost a few array operations instead of one pygame call each.
+    The buffers can be blitted onto a pygame Surface (blit), or used as arrays headless (color_buffer/depth_buffer).
+    Depth is interpolated as 1/depth, which is linear on the screen, so it's perspective correct.
+    '''
+    BATCH_PIXELS = 1 << 18 #How many candidate pixels (triangle bounding box area) get tested at once
+    OUTLINE_BIAS = 1e-3 #Outlines count as this much (relatively) nearer, so they show up on their own face
+
+    def __init__(self, size: (int, int)):
+        self._size = tuple(size)
+        width, height = self._size
+        self._pixels = np.zeros((height, width), dtype=np.uint32) #Whole pixels, so writing one is one store
+        self._color = self._pixels.view(np.uint8).reshape(height, width, 4)[:,:,:3] #The same memory as RGB(x)
+        self._inverse_depth = np.zeros((height, width)) #1/depth, 0 is infinitely far away
+        self.triangles = 0 #Triangles filled since the last clear
+
+    def size(self) -> (int, int):
+        return self._size
+
+    def clear(self, background = (0,0,0)):
+        self._pixels.fill(self._pack(np.array([tuple(background)[:3]], dtype=np.uint8))[0])
+        self._inverse_depth.fill(0)
+        self.triangles = 0
+
+    def color_buffer(self) -> 'np.ndarray':
+        '''
+        Returns the (height, width, 3) uint8 color buffer (not a copy).
+        '''
+        return self._color
+
+    def depth_buffer(self) -> 'np.ndarray':
+        '''
+        Returns the (height, width) depth at every pixel, inf where nothing was drawn.
+        '''
+        with np.errstate(divide='ignore'):
+            return 1/self._inverse_depth
+
+    def load(self, surface):
+        '''
+        Copies a pygame Surface's pixels in as the background (everything counts as infinitely far away).
+        '''
+        import pygame
+
+        self._color[:] = pygame.surfarray.pixels3d(surface).swapaxes(0, 1)
+        self._inverse_depth[:] = 0
+        self.triangles = 0
+
+    def blit(self, surface):
+        '''
+        Copies the color buffer onto a pygame Surface of the same size.
+        '''
+        import pygame
+
+        pygame.surfarray.blit_array(surface, self._color.swapaxes(0, 1))
+
+    def draw(self, drawings: list):
+        '''
+        Draws a draw list ([distance, drawing type, [2D points, fill color, outline color, point depths], face id]
+          entries, in any order).
+        '''
+        fills = [d[2] for d in drawings if d[1] in (shapes.BaseObject.FILL, shapes.BaseObject.FILL_OUTLINE)]
+        outlines = [d[2] for d in drawings if d[1] in (shapes.BaseObject.OUTLINE, shapes.BaseObject.FILL_OUTLINE)]
+        edges = [d[2] for d in drawings if d[1] in (shapes.BaseObject.OUTLINE_EDGES, shapes.BaseObject.FILL_OUTLINE_EDGES)]
+
+        #Faces with the same number of points go together
+        groups = {}
+        for args in fills:
+            groups.setdefault(len(args[0]), []).append(args)
+        chain = itertools.chain.from_iterable
+        for count, group in groups.items():
+            if count < 3: continue
+            points = np.fromiter(chain([p for args in group for p in args[0]]), float, len(group)*count*2).reshape(-1, count, 2)
+            inverse_depths = 1/np.fromiter(chain([args[3] for args in group]), float, len(group)*count).reshape(-1, count)
+            colors = np.fromiter(chain([args[1][:3] for args in group]), float, len(group)*3).reshape(-1, 3)
+            colors = np.clip(colors, 0, 255).astype(np.uint8)
+
+            #Fan: points 0, i, i+1
+            fan = np.array([(0, i, i+1) for i in range(1, count-1)], dtype=np.intp)
+            self.fill_triangles(points[:,fan].reshape(-1, 3, 2), inverse_depths[:,fan].reshape(-1, 3), np.repeat(colors, len(fan), axis=0))
+
+        if outlines or edges:
+            starts, ends, inverse_depths, colors = [], [], [], []
+            for args in edges: #Already (start, end) pairs
+                depths = [1/z for z in args[3]]
+                color = tuple(args[2] if args[2] != None else (0,0,0))[:3]
+                for i in range(0, len(args[0]), 2):
+                    starts.append((args[0][i][0], args[0][i][1]))
+                    ends.append((args[0][i+1][0], args[0][i+1][1]))
+                    inverse_depths.append((depths[i], depths[i+1]))
+                    colors.append(color)
+            for args in outlines:
+                points = [(p[0], p[1]) for p in args[0]]
+                depths = [1/z for z in args[3]]
+                color = tuple(args[2] if args[2] != None else (0,0,0))[:3]
+                for i in range(len(points)):
+                    starts.append(points[i])
+                    ends.append(points[(i+1) % len(points)])
+                    inverse_depths.append((depths[i], depths[(i+1) % len(points)]))
+                    colors.append(color)
+            self.draw_lines(np.array(starts, dtype=float), np.array(ends, dtype=float), np.array(inverse_depths, dtype=float),
+                            np.clip(np.array(colors, dtype=float), 0, 255).astype(np.uint8))
+
+    def draw_buffer(self, buffer):
+        '''
+        Draws a DrawBuffer, straight from its arrays (no draw list), in the same order draw would.
+        '''
+        order = buffer.order()
+        types, starts, lengths = buffer.draw_types()[order], buffer.starts()[order], buffer.lengths()[order]
+        points, point_depths = buffer.points(), buffer.point_depths()
+
+        #Faces with the same number of points go together, in the order each count first shows up
+        fill = (types == shapes.BaseObject.FILL) | (types == shapes.BaseObject.FILL_OUTLINE)
+        counts, firsts = np.unique(lengths[fill], return_index=True)
+        for count in counts[np.argsort(firsts)].tolist():
+            if count < 3: continue
+            group = fill & (lengths == count)
+            fan = np.array([(0, i, i+1) for i in range(1, count-1)], dtype=np.intp)
+            corners = starts[group][:,None,None] + fan #(faces, triangles, 3) point indices
+            colors = buffer.fills()[order[group],:3]
+            self.fill_triangles(points[corners].reshape(-1, 3, 2), 1/point_depths[corners].reshape(-1, 3), np.repeat(colors, len(fan), axis=0))
+
+        #Outlines go all the way around their faces, edges (see Mesh's batch_edges) are (start, end) point pairs
+        outline = (types == shapes.BaseObject.OUTLINE) | (types == shapes.BaseObject.FILL_OUTLINE)
+        edges = (types == shapes.BaseObject.OUTLINE_EDGES) | (types == shapes.BaseObject.FILL_OUTLINE_EDGES)
+        if outline.any() or edges.any():
+            lines = outline | edges
+            starts, lengths, edges = starts[lines], lengths[lines], edges[lines]
+            face = np.repeat(np.arange(len(lengths)), lengths)
+            corner = np.arange(len(face)) - np.repeat(np.cumsum(lengths) - lengths, lengths) #Which point of its face
+            pairs = edges[face]
+            keep = ~pairs | (corner % 2 == 0)
+            face, corner, pairs = face[keep], corner[keep], pairs[keep]
+            first = starts[face] + corner
+            second = np.where(pairs, first + 1, starts[face] + (corner + 1) % lengths[face])
+            self.draw_lines(points[first], points[second], 1/np.stack((point_depths[first], point_depths[second]), axis=1),
+                            buffer.outlines()[order[lines],:3][face])
+
+    def fill_triangles(self, points: 'np.ndarray', inverse_depths: 'np.ndarray', colors: 'np.ndarray'):
+        '''
+        Fills (T,3,2) screen space triangles with (T,3) per point 1/depth and (T,3) uint8 colors.
+        A pixel is filled if its center is inside the triangle (edges included).
+        '''
+        width, height = self._size
+        if len(points) == 0: return
+
+        #Rows of pixel centers each triangle covers, clipped to the screen
+        top = np.maximum(np.ceil(points[:,:,1].min(axis=1) - .5), 0).astype(np.int64)
+        bottom = np.minimum(np.floor(points[:,:,1].max(axis=1) - .5), height-1).astype(np.int64)
+        a, b, c = points[:,0], points[:,1], points[:,2]
+        area = (b[:,0]-a[:,0])*(c[:,1]-a[:,1]) - (b[:,1]-a[:,1])*(c[:,0]-a[:,0])
+        keep = (top <= bottom) & (area != 0) & (points[:,:,0].max(axis=1) >= 0) & (points[:,:,0].min(axis=1) <= width)
+        if not keep.all():
+            points, inverse_depths, colors, top, bottom, area = points[keep], inverse_depths[keep], colors[keep], top[keep], bottom[keep], area[keep]
+        if len(points) == 0: return
+        self.triangles += len(points)
+        colors = self._pack(colors)
+
+        #Batches of triangles covering about BATCH_PIXELS of bounding box
+        box = (bottom - top + 1)*(np.ceil(points[:,:,0].max(axis=1)) - np.floor(points[:,:,0].min(axis=1)) + 1)
+        ends = np.searchsorted(np.cumsum(box), np.arange(1, int(box.sum())//self.BATCH_PIXELS + 1)*self.BATCH_PIXELS)
+        start = 0
+        for end in [*np.unique(ends).tolist(), len(points)]:
+            end = max(end, start + 1)
+            if start >= len(points): break
+            batch = slice(start, end)
+            self._fill_batch(points[batch], inverse_depths[batch], colors[batch], top[batch], bottom[batch], area[batch])
+            start = end
+
+    def draw_lines(self, starts: 'np.ndarray', ends: 'np.ndarray', inverse_depths: 'np.ndarray', colors: 'np.ndarray'):
+        '''
+        Draws (L,2) to (L,2) one pixel wide lines with (L,2) per end 1/depth and (L,3) uint8 colors, depth tested.
+        '''
+        if len(starts) == 0: return
+
+        #Clip to the screen first (1/depth is linear on the screen, so it's clipped the same way)
+        width, height = self._size
+        direction = ends - starts
+        enter, leave = np.zeros(len(starts)), np.ones(len(starts))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for axis, limit in ((0, width), (1, height)):
+                t0 = (0 - starts[:,axis])/direction[:,axis]
+                t1 = (limit - starts[:,axis])/direction[:,axis]
+                parallel = direction[:,axis] == 0
+                outside = parallel & ((starts[:,axis] < 0) | (starts[:,axis] >= limit))
+                enter = np.where(parallel, enter, np.maximum(enter, np.minimum(t0, t1)))
+                leave = np.where(parallel, leave, np.minimum(leave, np.maximum(t0, t1)))
+                leave[outside] = -1
+        keep = enter <= leave
+        starts, direction, inverse_depths, colors, enter, leave = starts[keep], direction[keep], inverse_depths[keep], colors[keep], enter[keep], leave[keep]
+        if len(starts) == 0: return
+        colors = self._pack(colors)
+        ends = starts + direction*leave[:,None]
+        starts = starts + direction*enter[:,None]
+        change = inverse_depths[:,1] - inverse_depths[:,0]
+        inverse_depths = np.stack((inverse_depths[:,0] + change*enter, inverse_depths[:,0] + change*leave), axis=1)
+
+        steps = np.ceil(np.abs(ends - starts).max(axis=1)).astype(np.int64) + 1
+        line = np.repeat(np.arange(len(starts)), steps)
+        t = (np.arange(len(line)) - np.repeat(np.cumsum(steps) - steps, steps))/np.maximum(np.repeat(steps, steps) - 1, 1)
+        xy = starts[line] + (ends - starts)[line]*t[:,None]
+        inverse = (inverse_depths[line,0]*(1-t) + inverse_depths[line,1]*t)*(1 + self.OUTLINE_BIAS)
+        x, y = np.floor(xy[:,0]).astype(np.int64), np.floor(xy[:,1]).astype(np.int64)
+        inside = (x >= 0) & (x < self._size[0]) & (y >= 0) & (y < self._size[1])
+        self._write(y[inside]*self._size[0] + x[inside], inverse[inside], colors[line[inside]])
+
+    #Private methods
+    def _fill_batch(self, points, inverse_depths, colors, top, bottom, area):
+        '''
+        Scanline fill: every row of every triangle becomes a span of pixels, found from the three edges.
+        '''
+        width, height = self._size
+
+        #One entry per row of each triangle
+        rows = bottom - top + 1
+        triangle = np.repeat(np.arange(len(points)), rows)
+        y = np.arange(len(triangle)) - np.repeat(np.cumsum(rows) - rows, rows) + top[triangle]
+        center = y + .5
+
+        #Each edge keeps the pixel centers on its inner side, E = ex*x + ey*y + e >= 0, which for a row is a bound on
+        #  x: a lower one if ex > 0, an upper one if ex < 0 (horizontal edges only ever cut rows outside the box).
+        #  The bound is linear in y, so every triangle gets a table of them (plus its 1/depth plane), looked up per row
+        table = np.empty((len(points), 15))
+        sign = np.sign(area)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k, (i, j) in enumerate(((0, 1), (1, 2), (2, 0))):
+                ax, ay, bx, by = points[:,i,0], points[:,i,1], points[:,j,0], points[:,j,1]
+                ex, ey, e = -(by-ay)*sign, (bx-ax)*sign, ((by-ay)*ax - (bx-ax)*ay)*sign
+                slope, intercept = -ey/ex, -e/ex
+                table[:,k] = np.where(ex > 0, slope, 0)
+                table[:,3+k] = np.where(ex > 0, intercept, -np.inf)
+                table[:,6+k] = np.where(ex < 0, slope, 0)
+                table[:,9+k] = np.where(ex < 0, intercept, np.inf)
+
+        #1/depth is linear on the screen too, so it's a plane through the three points
+        x0, y0 = points[:,0,0], points[:,0,1]
+        v0, v1, v2 = inverse_depths[:,0], inverse_depths[:,1], inverse_depths[:,2]
+        table[:,12] = ((v1-v0)*(points[:,2,1]-y0) - (v2-v0)*(points[:,1,1]-y0))/area
+        table[:,13] = ((v2-v0)*(points[:,1,0]-x0) - (v1-v0)*(points[:,2,0]-x0))/area
+        table[:,14] = v0 - table[:,12]*x0 - table[:,13]*y0
+
+        row_table = table[triangle]
+        left, right = [row_table[:,k]*center + row_table[:,3+k] for k in (0, 6)]
+        for k in (1, 2):
+            np.maximum(left, row_table[:,k]*center + row_table[:,3+k], out=left)
+            np.minimum(right, row_table[:,6+k]*center + row_table[:,9+k], out=right)
+        first = np.maximum(np.ceil(left - .5), 0)
+        last = np.minimum(np.floor(right - .5), width-1)
+        count = np.maximum(last - first + 1, 0).astype(np.int64)
+        first = np.where(count > 0, first, 0).astype(np.int64)
+
+        #Where each span starts on the 1/depth plane, and how much it changes per pixel across
+        span_inverse = row_table[:,12]*(first + .5) + row_table[:,13]*center + row_table[:,14]
+        span_pixel = y*width + first
+        span_dx = row_table[:,12]
+
+        #One entry per pixel: pixel k of the whole batch is pixel k - (span's start in the batch) of its span
+        shift = np.cumsum(count) - count
+        span = np.repeat(np.arange(len(count)), count)
+        across = np.arange(len(span))
+        pixels = (span_pixel - shift)[span] + across
+        inverse = (span_inverse - span_dx*shift)[span] + span_dx[span]*across
+        self._write(pixels, inverse, colors[triangle][span])
+
+    @staticmethod
+    def _pack(colors: 'np.ndarray') -> 'np.ndarray':
+        '''
+        Turns (N,3) uint8 colors into (N,) uint32 whole pixels (laid out like self._pixels).
+        '''
+        packed = np.zeros((len(colors), 4), dtype=np.uint8)
+        packed[:,:3] = colors
+        return packed.view(np.uint32).reshape(-1)
+
+    def _write(self, pixels: 'np.ndarray', inverse: 'np.ndarray', colors: 'np.ndarray'):
+        '''
+        Depth tested write of flat pixel indices, with packed colors. When several land on one pixel, the nearest one is kept.
+        '''
+        if len(pixels) == 0: return
+        depth = self._inverse_depth.reshape(-1)
+        np.maximum.at(depth, pixels, inverse)
+        nearest = inverse == depth[pixels]
+        self._pixels.reshape(-1)[pixels[nearest]] = colors[nearest]
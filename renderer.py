@@ -0,0 +1,513 @@
+from camera import Camera
+from profiler import Profiler
+from bvh import BVH
+from draw_order import DrawOrder
+from bsp import BSPTree
+from raster import Rasterizer
+from parallel import ScenePool
+from draw_buffer import DrawBuffer
+from occlusion import OcclusionBuffer
+import shapes
+
+import heapq
+import math
+
+import numpy as np
+
+
+class Renderer:
+    '''
+    Runs the drawing pipeline for a list of top level objects (Models/shapes):
+        Draw every object through the camera, keep what is fully in front of the screen and depth sort it (back to front).
+    None of this needs a window, so it can run headless. The resulting draw list can be drawn onto any pygame
+      Surface, including an offscreen one (see render).
+    A draw list is a list of [distance, drawing type, [2D points, fill color, outline color, point depths], face id].
+    If given a Profiler, times the 'visible' (BVH query), 'scene' (includes the shapes' 'project' and 'shade'), 'sort'
+      and 'raster' stages and counts faces submitted/culled, vertices projected and draw calls.
+    With use_bvh, the objects are kept in a BVH and only the ones the camera might see are drawn each frame
+      (for scenes with lots of objects, most of them off screen).
+    With coherent_sort, the depth sort starts from last frame's order and only repairs it (see DrawOrder), which pays
+      off for big draw lists.
+    Objects that never move can be given as static instead. They go in a BSPTree (built once and cached), which hands
+      back their faces already in back to front order, so they are never sorted; the (sorted) moving objects' faces
+      are merged in between them by distance. If there are only static objects, nothing is sorted at all.
+    With depth_buffer, draw uses the NumPy Rasterizer (with a depth buffer) instead of one pygame call per face, and
+      draw lists aren't sorted at all.
+    With workers, the objects are drawn by that many worker processes (see ScenePool) while the main process does the
+      static objects, the sorting and the drawing. The frame comes out exactly the same as with one process. Call close
+      when done with the renderer to stop them.
+    With track_changes, the camera's, lighting's and objects' versions are kept from frame to frame. If none of them
+      changed, draw_list hands back the last draw list without drawing anything. If only some objects changed (and
+      not the camera), only those are drawn again (the others' faces from last frame are used as they are, so the
+      camera's stats only count what was drawn), and dirty_rects gives the parts of the screen that need drawing
+      again: where those objects were last frame and where they are now. Draw just those (draw's rects) and update
+      just those on the display. Changes the versions don't see (like changing a Mesh's arrays in place) need an
+      invalidate.
+    draw_commands is draw_list's array based twin: it fills the renderer's DrawBuffer (the same one every frame)
+      straight from the shapes and sorts it by index, and draw takes it like a draw list (the Rasterizer reads its
+      arrays as they are). Not with workers or track_changes.
+    With occlusion (or a list of occluders), every frame first draws a few big objects into a low resolution
+      OcclusionBuffer, and anything certainly hidden behind them (Models, Meshes, instances, shapes, frozen and
+      static faces, tested by their bounding spheres) is skipped before its faces are projected and shaded. The
+      occluders are the given ones, otherwise the MAX_OCCLUDERS objects (moving or static, with at most
+      OCCLUDER_FACES faces) that look biggest from the camera. The camera needs a screen size. Faces skipped are
+      counted as 'faces occluded' (the camera's occluded_faces). Not with track_changes, and workers don't use it.
+    '''
+    MAX_DIRTY_RECTS = 16 #Past this many, dirty_rects asks for the whole screen instead
+    DIRTY_MARGIN = 3 #Pixels added around dirty rects, for outlines and rounding
+    MAX_OCCLUDERS = 4
+    OCCLUDER_FACES = 32
+    def __init__(self, camera: Camera, objects: list = None, profiler: Profiler = None, use_bvh: bool = False,
+                        coherent_sort: bool = False, static: list = None, depth_buffer: bool = False,
+                        workers: int = 0, track_changes: bool = False, occlusion: bool = False, occluders: list = None):
+        self._cam = camera
+        self._objects = objects if objects != None else []
+        self._profiler = profiler if profiler != None else Profiler(enabled=False)
+        self._cam.profiler = self._profiler
+        self._bvh = BVH(self._objects) if use_bvh else None
+        self._draw_order = DrawOrder() if coherent_sort else None
+        self._bsp = BSPTree(static) if static else None
+        self._depth_buffer = depth_buffer
+        self._rasterizer = None #Made on the first draw, at the surface's size
+        self._pool = ScenePool(self._objects, workers) if workers > 0 else None
+
+        #Change tracking: the last frame's versions, draw list and unsorted drawings with every object's part of them
+        self._track_changes = track_changes
+        self._last_versions = None
+        self._last_drawings = None
+        self._last_collected = []
+        self._last_ranges = {}
+        self._collected_ranges = {} #id(object) -> (object, start, end) in what collect last returned
+        self._reuse = None #The last frame's ranges collect can use again this frame
+        self._dirty = None
+        self._scratch = None #Surface the dirty rects are drawn on, made at the surface's size
+        self._commands = DrawBuffer()
+
+        self._occlusion = occlusion or occluders != None
+        assert not (self._occlusion and track_changes), 'Occlusion culling doesn\'t work with track_changes'
+        self._occluders = occluders #None to choose them every frame
+        self._occlusion_buffer = None #Made on the first frame, at the camera's screen size
+
+    def profiler(self) -> Profiler:
+        return self._profiler
+
+    def bsp(self) -> BSPTree:
+        '''
+        Returns the static objects' BSP tree (None if there are no static objects).
+        '''
+        return self._bsp
+
+    def add_object(self, obj):
+        self._objects.append(obj)
+        if self._bvh != None: self._bvh.insert(obj)
+
+    def add_static(self, obj):
+        '''
+        Adds an object that never moves (the BSP tree gets rebuilt on the next frame).
+        '''
+        if self._bsp == None: self._bsp = BSPTree()
+        self._bsp.add_object(obj)
+
+    def dirty_rects(self) -> [(int, int, int, int)]:
+        '''
+        With track_changes, returns the (left, top, width, height) screen rects that changed in the last draw_list,
+          [] if nothing did, or None if everything needs drawing again (the camera changed, say). Always None
+          without track_changes, or with workers or the depth buffer.
+        '''
+        return self._dirty
+
+    def invalidate(self):
+        '''
+        Makes the next draw_list draw everything, for changes the versions don't see (or a display that lost what
+          was on it).
+        '''
+        self._last_versions = None
+
+    def close(self):
+        '''
+        Stops the worker processes, if there are any.
+        '''
+        if self._pool != None: self._pool.close()
+
+    def draw_list(self) -> [['distance', 'drawing type', 'drawing arguments']]:
+        '''
+        Returns the depth sorted draw list for the current frame (unsorted with depth_buffer). Also resets the
+          camera's per frame stats.
+        With track_changes, if nothing changed since the last frame, returns the last draw list again (and leaves the
+          stats as they were).
+        '''
+        versions = self._versions() if self._track_changes else None
+        if versions != None and versions == self._last_versions:
+            self._dirty = []
+            self._profiler.count('frames skipped')
+            return self._last_drawings
+
+        self._cam.reset_stats()
+        self._reuse = self._reusable(versions)
+        self._start_occlusion()
+        with self._profiler.stage('scene'):
+            if self._pool != None: #The workers draw the moving objects while this process does the static ones
+                self._pool.start(self._cam, self._visible())
+                static = self.collect_static()
+                drawings = self._pool.finish()
+            else:
+                drawings = collected = self.collect()
+                static = self.collect_static()
+        self._cam.occlusion = None
+        if self._depth_buffer:
+            drawings.extend(static)
+        else:
+            with self._profiler.stage('sort'):
+                drawings = self.depth_sort(drawings)
+                if static:
+                    drawings = self.merge(static, drawings)
+
+        self._profiler.count('faces submitted', len(drawings))
+        self._profiler.count('faces culled', self._cam.culled_faces)
+        if self._occlusion: self._profiler.count('faces occluded', self._cam.occluded_faces)
+        self._profiler.count('vertices projected', self._cam.projected_vertices)
+
+        if versions != None:
+            if self._pool == None and not self._depth_buffer:
+                self._dirty = self._find_dirty(versions, collected)
+                self._last_collected = collected
+                self._last_ranges = self._collected_ranges
+            self._last_versions = versions
+            self._last_drawings = drawings
+        return drawings
+
+    def draw_commands(self) -> DrawBuffer:
+        '''
+        Returns the current frame as a DrawBuffer, depth sorted (unsorted with depth_buffer), like draw_list. The
+          buffer is reused, so it only holds this frame until the next call.
+        '''
+        assert self._pool == None, 'draw_commands doesn\'t work with workers'
+        buffer = self._commands
+        buffer.clear()
+        self._cam.reset_stats()
+        self._start_occlusion()
+        with self._profiler.stage('scene'):
+            for s in self._visible():
+                s.draw_into(self._cam, buffer)
+            moving = len(buffer)
+            if self._bsp != None: self._bsp.draw_into(self._cam, buffer)
+        self._cam.occlusion = None
+        if not self._depth_buffer:
+            with self._profiler.stage('sort'):
+                static = len(buffer) > moving
+                if static: #Only the moving faces get sorted, the static ones are already in order
+                    depths = buffer.depths()
+                    order = self._draw_order.order(buffer.face_ids()[:moving], depths[:moving]) if self._draw_order != None \
+                                else np.argsort(-depths[:moving], kind='stable')
+                    depths = depths.tolist()
+                    buffer.set_order(list(heapq.merge(range(moving, len(buffer)), order.tolist(), key=depths.__getitem__, reverse=True)))
+                else:
+                    buffer.sort(self._draw_order)
+
+        self._profiler.count('faces submitted', len(buffer))
+        self._profiler.count('faces culled', self._cam.culled_faces)
+        if self._occlusion: self._profiler.count('faces occluded', self._cam.occluded_faces)
+        self._profiler.count('vertices projected', self._cam.projected_vertices)
+        return buffer
+
+    def choose_occluders(self) -> list:
+        '''
+        Returns the objects occlusion culling uses when none are given: of the visible and static objects with at
+          most OCCLUDER_FACES faces, the MAX_OCCLUDERS that look biggest (bounding radius over distance) with their
+          center in front of the camera (only their faces fully in front go into the buffer).
+        '''
+        m = self._cam.view_projection().values()
+        sizes = []
+        for o in list(self._visible()) + (self._bsp.objects() if self._bsp != None else []):
+            if o.face_count() > self.OCCLUDER_FACES: continue
+            (x, y, z), radius = o.world_bounds()
+            w = x*m[3] + y*m[7] + z*m[11] + m[15] #How far in front of the focus
+            if w > 0: sizes.append((radius/w, o))
+        return [o for size, o in heapq.nlargest(self.MAX_OCCLUDERS, sizes, key=lambda size: size[0])]
+
+    def occlusion_buffer(self) -> OcclusionBuffer:
+        '''
+        Returns the last frame's OcclusionBuffer (None without occlusion).
+        '''
+        return self._occlusion_buffer
+
+    def collect(self) -> [['distance', 'drawing type', 'drawing arguments']]:
+        '''
+        Draws every object through the camera and returns everything that is in front of the screen, unsorted.
+        '''
+        drawings = []
+        ranges = self._collected_ranges = {}
+        reuse, self._reuse = self._reuse, None
+        for s in self._visible():
+            start = len(drawings)
+            if reuse != None and id(s) in reuse: #Unchanged and seen from the same camera, so it draws the same
+                obj, first, last = reuse[id(s)]
+                drawings.extend(self._last_collected[first:last])
+            elif isinstance(s, shapes.BaseObject):
+                drawing = s.draw(self._cam)
+                if drawing is not None: #Not culled
+                    dist, loc, draw_type, *draw_args, face_id = drawing
+                    if loc == Camera.IN_FRONT:
+                        drawings.append([dist, draw_type, draw_args, face_id])
+            else: #model
+                shps = s.draw(self._cam)
+                for dist, loc, draw_type, *draw_args, face_id in shps:
+                    if loc == Camera.IN_FRONT:
+                        drawings.append([dist, draw_type, draw_args, face_id])
+            ranges[id(s)] = (s, start, len(drawings))
+        return drawings
+
+    def collect_static(self) -> [['distance', 'drawing type', 'drawing arguments']]:
+        '''
+        Returns the static objects' drawings that are in front of the screen, in back to front order.
+        '''
+        if self._bsp == None: return []
+        return [[dist, draw_type, draw_args, face_id] for dist, loc, draw_type, *draw_args, face_id in self._bsp.draw(self._cam)
+                    if loc == Camera.IN_FRONT]
+
+    @staticmethod
+    def merge(static: list, drawings: list) -> list:
+        '''
+        Merges two back to front draw lists into one, keeping each one's own order (at every step the farther of the
+          two next drawings goes first).
+        '''
+        if not drawings: return static
+        return list(heapq.merge(static, drawings, key=lambda x: x[0], reverse=True))
+
+    def depth_sort(self, drawings: list) -> list:
+        '''
+        Sorts drawings back to front (painter's algorithm).
+        '''
+        if self._draw_order != None:
+            return self._draw_order.sort(drawings)
+        return sorted(drawings, key=lambda x: x[0], reverse=True)
+
+    def draw(self, surface, drawings: list, background = None, rects: [(int, int, int, int)] = None):
+        '''
+        Draws a draw list (or DrawBuffer) onto a pygame Surface, filling it with background first if given.
+        With rects (like dirty_rects gives), only those parts of the surface are filled and drawn over (with every
+          face touching them, in order), the rest is left as it is. Not with the depth buffer, which draws it all, or
+          a DrawBuffer. The faces are drawn whole on a scratch surface and only the rects copied over, since pygame
+          draws a line clipped to a rect a pixel off here and there from the same line drawn whole.
+        '''
+        import pygame #Only needed when actually drawing, so headless draw lists work without pygame
+
+        commands = isinstance(drawings, DrawBuffer)
+        if self._depth_buffer:
+            with self._profiler.stage('raster'):
+                if self._rasterizer == None or self._rasterizer.size() != surface.get_size():
+                    self._rasterizer = Rasterizer(surface.get_size())
+                if background != None: self._rasterizer.clear(background)
+                else: self._rasterizer.load(surface)
+                if commands: self._rasterizer.draw_buffer(drawings)
+                else: self._rasterizer.draw(drawings)
+                self._rasterizer.blit(surface)
+            self._profiler.count('triangles rasterized', self._rasterizer.triangles)
+            return
+
+        if rects == None or commands:
+            if background != None:
+                surface.fill(background)
+            with self._profiler.stage('raster'):
+                draw_calls = self._draw_commands(surface, drawings) if commands else self._draw_faces(surface, drawings)
+            self._profiler.count('draw calls', draw_calls)
+            return
+
+        draw_calls = 0
+        with self._profiler.stage('raster'):
+            if self._scratch == None or self._scratch.get_size() != surface.get_size():
+                self._scratch = pygame.Surface(surface.get_size(), 0, surface)
+            scratch = self._scratch
+            boxes = [self._screen_rect([s]) for s in drawings] if rects else []
+            for rect in rects:
+                rect = pygame.Rect(rect).clip(scratch.get_rect())
+                if background != None: scratch.fill(background, rect)
+                else: scratch.blit(surface, rect, rect)
+                draw_calls += self._draw_faces(scratch, [s for s, box in zip(drawings, boxes) if rect.colliderect(box)])
+                surface.blit(scratch, rect, rect) #Within the surface's own clip
+        self._profiler.count('draw calls', draw_calls)
+
+    def render(self, size: (int, int), background = (100,100,100)) -> 'pygame.Surface':
+        '''
+        Renders the current frame to a new offscreen Surface of the given size (no window needed).
+        '''
+        import pygame
+
+        screen = self._cam.screen_size()
+        if screen == None or tuple(screen) != tuple(size): self._cam.resize(size) #Resizing counts as the camera changing
+        surface = pygame.Surface(size)
+        self.draw(surface, self.draw_list(), background)
+        return surface
+
+    #Private methods
+    @staticmethod
+    def _draw_faces(surface, drawings: list) -> int:
+        '''
+        Draws the faces onto the surface with pygame, one call per fill/outline, returns how many calls it took.
+        '''
+        import pygame
+
+        draw_calls = 0
+        for s in drawings:
+            if s[1] == shapes.BaseObject.FILL:
+                pygame.draw.polygon(surface,s[2][1],s[2][0])
+                draw_calls += 1
+            elif s[1] == shapes.BaseObject.OUTLINE:
+                pygame.draw.lines(surface, s[2][2],True,s[2][0],4)
+                draw_calls += 1
+            elif s[1] == shapes.BaseObject.FILL_OUTLINE:
+                pygame.draw.polygon(surface,s[2][1],s[2][0])
+                pygame.draw.lines(surface, s[2][2],True,s[2][0],1)
+                draw_calls += 2
+            elif s[1] == shapes.BaseObject.OUTLINE_EDGES:
+                draw_calls += Renderer._draw_edges(surface, s[2][2], s[2][0], 4)
+            elif s[1] == shapes.BaseObject.FILL_OUTLINE_EDGES:
+                draw_calls += Renderer._draw_edges(surface, s[2][2], s[2][0], 1)
+            elif s[1] == shapes.BaseObject.IMAGE:
+                pass
+            else:
+                pass
+        return draw_calls
+
+    @staticmethod
+    def _draw_commands(surface, buffer: DrawBuffer) -> int:
+        '''
+        _draw_faces for a DrawBuffer, in its order.
+        '''
+        import pygame
+
+        types, starts, lengths = buffer.draw_types().tolist(), buffer.starts().tolist(), buffer.lengths().tolist()
+        fills, outlines, points = buffer.fills().tolist(), buffer.outlines().tolist(), buffer.points().tolist()
+        draw_calls = 0
+        for i in buffer.order().tolist():
+            draw_type = types[i]
+            face = points[starts[i]:starts[i] + lengths[i]]
+            if draw_type == shapes.BaseObject.FILL:
+                pygame.draw.polygon(surface, fills[i], face)
+                draw_calls += 1
+            elif draw_type == shapes.BaseObject.OUTLINE:
+                pygame.draw.lines(surface, outlines[i], True, face, 4)
+                draw_calls += 1
+            elif draw_type == shapes.BaseObject.FILL_OUTLINE:
+                pygame.draw.polygon(surface, fills[i], face)
+                pygame.draw.lines(surface, outlines[i], True, face, 1)
+                draw_calls += 2
+            elif draw_type == shapes.BaseObject.OUTLINE_EDGES:
+                draw_calls += Renderer._draw_edges(surface, outlines[i], face, 4)
+            elif draw_type == shapes.BaseObject.FILL_OUTLINE_EDGES:
+                draw_calls += Renderer._draw_edges(surface, outlines[i], face, 1)
+        return draw_calls
+
+    @staticmethod
+    def _draw_edges(surface, color, points: list, width: int) -> int:
+        '''
+        Draws (start, end) point pairs (see Mesh's batch_edges) as lines, one call for every strip of them that runs on
+          (an edge starting where the last one ended), returns how many calls it took.
+        '''
+        import pygame
+
+        draw_calls = 0
+        strip = points[:2]
+        for i in range(2, len(points), 2):
+            if points[i] == strip[-1]:
+                strip.append(points[i+1])
+            else:
+                pygame.draw.lines(surface, color, False, strip, width)
+                draw_calls += 1
+                strip = points[i:i+2]
+        if strip:
+            pygame.draw.lines(surface, color, False, strip, width)
+            draw_calls += 1
+        return draw_calls
+
+    def _versions(self) -> tuple:
+        '''
+        Returns everything change tracking compares from frame to frame: what the camera sees (camera, lighting and
+          static objects) and the (id, version) of every object.
+        '''
+        lighting = self._cam.lighting
+        static = tuple(o.version() for o in self._bsp.objects()) if self._bsp != None else ()
+        view = (id(self._cam), self._cam.version(), id(lighting), lighting.version(), lighting.ambient, lighting.camera_light, static)
+        return view, [(id(o), o.version()) for o in self._objects]
+
+    def _reusable(self, versions: tuple) -> {int: ('object', int, int)}:
+        '''
+        Returns the last frame's ranges (see collect) of the objects that haven't changed since, if the camera
+          hasn't either (None if nothing can be used again).
+        '''
+        if versions == None or self._pool != None or self._last_versions == None or versions[0] != self._last_versions[0]: return None
+        last = dict(self._last_versions[1])
+        ranges = self._last_ranges
+        return {key: ranges[key] for key, version in versions[1] if key in ranges and last.get(key) == version}
+
+    def _find_dirty(self, versions: tuple, collected: list) -> [(int, int, int, int)]:
+        '''
+        Returns the screen rects of the objects that changed since the last frame, where they were then and where
+          they are now (merged where they overlap). None if the whole screen changed.
+        '''
+        if self._last_versions == None or versions[0] != self._last_versions[0]: return None
+        last = dict(self._last_versions[1])
+        rects = []
+        for key, version in versions[1]:
+            if last.get(key) == version: continue
+            if key in self._last_ranges:
+                obj, start, end = self._last_ranges[key]
+                rects.append(self._screen_rect(self._last_collected[start:end]))
+            if key in self._collected_ranges:
+                obj, start, end = self._collected_ranges[key]
+                rects.append(self._screen_rect(collected[start:end]))
+        rects = self._merge_rects([r for r in rects if r != None])
+        return rects if len(rects) <= self.MAX_DIRTY_RECTS else None
+
+    @classmethod
+    def _screen_rect(cls, drawings: list) -> (int, int, int, int):
+        '''
+        Returns the (left, top, width, height) rect around the drawings' points (plus DIRTY_MARGIN), None if there are none.
+        '''
+        xs = [p[0] for s in drawings for p in s[2][0]]
+        if not xs: return None
+        ys = [p[1] for s in drawings for p in s[2][0]]
+        left, top = math.floor(min(xs)) - cls.DIRTY_MARGIN, math.floor(min(ys)) - cls.DIRTY_MARGIN
+        return (left, top, math.ceil(max(xs)) + cls.DIRTY_MARGIN - left, math.ceil(max(ys)) + cls.DIRTY_MARGIN - top)
+
+    @staticmethod
+    def _merge_rects(rects: [(int, int, int, int)]) -> [(int, int, int, int)]:
+        '''
+        Joins overlapping rects into the rect around them, until none overlap.
+        '''
+        merged = []
+        for left, top, width, height in rects:
+            right, bottom = left + width, top + height
+            i = 0
+            while i < len(merged):
+                l, t, r, b = merged[i]
+                if left < r and l < right and top < b and t < bottom:
+                    left, top, right, bottom = min(left, l), min(top, t), max(right, r), max(bottom, b)
+                    merged.pop(i)
+                    i = 0
+                else:
+                    i += 1
+            merged.append((left, top, right, bottom))
+        return [(l, t, r - l, b - t) for l, t, r, b in merged]
+
+    def _start_occlusion(self):
+        '''
+        Draws this frame's occluders into the occlusion buffer and hands it to the camera, so the shapes skip what
+          is behind them (until the frame's faces are collected).
+        '''
+        self._cam.occlusion = None
+        size = self._cam.screen_size()
+        if not self._occlusion or size == None: return
+        with self._profiler.stage('occlusion'):
+            if self._occlusion_buffer == None or self._occlusion_buffer.size() != size:
+                self._occlusion_buffer = OcclusionBuffer(size)
+            self._occlusion_buffer.build(self._cam, self._occluders if self._occluders != None else self.choose_occluders())
+        self._cam.occlusion = self._occlusion_buffer
+
+    def _visible(self) -> list:
+        '''
+        Returns the objects the camera might see (all of them without use_bvh).
+        '''
+        if self._bvh == None: return self._objects
+        with self._profiler.stage('visible'):
+            return self._bvh.query(self._cam)
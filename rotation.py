@@ -1,4 +1,5 @@
-from linear_algebra import Vector, Matrix
+from linear_algebra import Vector, Vec3, Matrix
+import math
 
 
 class Rotation:
@@ -16,9 +17,10 @@ class Rotation:
         self._z = z
         self._order = rotation_order
 
+        #Matrices (and the quaternion) are only computed when first needed, and thrown away when an angle changes
         self._rot_matrix = None
         self._inv_matrix = None
-        self._compute_matrices()
+        self._quaternion = None
 
     def _compute_matrices(self):
         '''
@@ -27,8 +29,42 @@ class Rotation:
         self._rot_matrix = Matrix.rotation_matrix(self[self._order[0]], self._order[0])
         for axis in self._order[1:]:
             self._rot_matrix = self._rot_matrix@Matrix.rotation_matrix(self[axis], axis)
-        self._inv_matrix = self._rot_matrix.inverse()
+        self._inv_matrix = self._rot_matrix.inverse(orthonormal=True)
 
+    def _invalidate(self):
+        '''
+        Marks the cached matrices and quaternion as stale.
+        '''
+        self._rot_matrix = None
+        self._inv_matrix = None
+        self._quaternion = None
+
+    def matrix(self) -> Matrix:
+        '''
+        Returns the rotation matrix (vectors are multiplied on the left, v*matrix).
+        '''
+        if self._rot_matrix is None: self._compute_matrices()
+        return self._rot_matrix
+
+    def inverse_matrix(self) -> Matrix:
+        '''
+        Returns the inverse rotation matrix (vectors are multiplied on the left, v*matrix).
+        '''
+        if self._inv_matrix is None: self._compute_matrices()
+        return self._inv_matrix
+
+    def order(self) -> (int, int, int):
+        '''
+        Returns the rotation order (axes 0, 1, 2 = x, y, z, in the order they are rotated around).
+        '''
+        return self._order
+
+    def quaternion(self) -> 'Quaternion':
+        '''
+        Returns the Quaternion which rotates vectors the same way as this rotation.
+        '''
+        if self._quaternion is None: self._quaternion = Quaternion.from_rotation(self)
+        return self._quaternion
 
     def __getitem__(self, index):
         '''
@@ -42,23 +78,32 @@ class Rotation:
         if index == 0 or index == 'x': self._x = value
         if index == 1 or index == 'y': self._y = value
         if index == 2 or index == 'z': self._z = value
+        self._invalidate()
 
     
     def __mul__(self, right):
         '''
         Only works with vectors, returns the result of rotating the vector
         '''
-        return (right*self._rot_matrix).row_vector(0)
+        if isinstance(right, Vec3): #Unrolled v*matrix
+            m = self.matrix().values()
+            x, y, z = right.x, right.y, right.z
+            return Vec3(x*m[0] + y*m[3] + z*m[6], x*m[1] + y*m[4] + z*m[7], x*m[2] + y*m[5] + z*m[8])
+        return (right*self.matrix()).row_vector(0)
 
     def __truediv__(self, right):
         '''
         Only works with vectors, returns the result of rotating the vector in the inverse way
         '''
-        return (right*self._inv_matrix).row_vector(0)
+        if isinstance(right, Vec3): #Unrolled v*matrix
+            m = self.inverse_matrix().values()
+            x, y, z = right.x, right.y, right.z
+            return Vec3(x*m[0] + y*m[3] + z*m[6], x*m[1] + y*m[4] + z*m[7], x*m[2] + y*m[5] + z*m[8])
+        return (right*self.inverse_matrix()).row_vector(0)
 
     def __add__(self, right):
         '''
-        For adding to the rotation total.
+        For adding to the rotation total. Cheap, since the new Rotation's matrices aren't computed until used.
         '''
         if isinstance(right, Rotation) or type(right) in {tuple, list}:
             return Rotation(self[0]+right[0],self[1]+right[1],self[2]+right[2],self._order)
@@ -67,6 +112,169 @@ class Rotation:
 
 
 
+class Quaternion:
+    '''
+    A unit quaternion (w + xi + yj + zk) rotation. Rotates vectors the same way a Rotation does
+      (so q*v is the same as Rotation*v), but composing, normalizing and interpolating them is cheap
+      and never needs a matrix inverse.
+    Adding a Rotation/Quaternion to a Quaternion rotates by this one first and then by the right one,
+      which is the same as adding Euler angles when only the last axis in the rotation order changes.
+    '''
+    def __init__(self, w: float = 1, x: float = 0, y: float = 0, z: float = 0):
+        self._w = w
+        self._x = x
+        self._y = y
+        self._z = z
+
+        self._rot_matrix = None
+
+    def conjugate(self) -> 'Quaternion':
+        '''
+        Returns the conjugate, which for a unit quaternion is the inverse rotation.
+        '''
+        return Quaternion(self._w, -self._x, -self._y, -self._z)
+
+    def norm(self) -> float:
+        '''
+        Returns the length of the quaternion (1 for rotations).
+        '''
+        return math.sqrt(self._w*self._w + self._x*self._x + self._y*self._y + self._z*self._z)
+
+    def normalize(self) -> 'Quaternion':
+        '''
+        Returns this quaternion scaled to length 1. Do this every so often after lots of compositions,
+          since float error slowly builds up.
+        '''
+        n = self.norm()
+        assert n != 0
+        return Quaternion(self._w/n, self._x/n, self._y/n, self._z/n)
+
+    def dot(self, q: 'Quaternion') -> float:
+        return self._w*q._w + self._x*q._x + self._y*q._y + self._z*q._z
+
+    def slerp(self, q: 'Quaternion', t: float) -> 'Quaternion':
+        '''
+        Spherical linear interpolation from this rotation (t=0) to q (t=1), taking the shortest way around.
+        '''
+        d = self.dot(q)
+        if d < 0: #q and -q are the same rotation, pick the closer one
+            q = Quaternion(-q._w, -q._x, -q._y, -q._z)
+            d = -d
+        if d > .9995: #Too close together for sin to behave, just lerp
+            return Quaternion(self._w + (q._w-self._w)*t, self._x + (q._x-self._x)*t,
+                              self._y + (q._y-self._y)*t, self._z + (q._z-self._z)*t).normalize()
+        theta = math.acos(d)
+        sin_theta = math.sin(theta)
+        a = math.sin((1-t)*theta)/sin_theta
+        b = math.sin(t*theta)/sin_theta
+        return Quaternion(a*self._w + b*q._w, a*self._x + b*q._x, a*self._y + b*q._y, a*self._z + b*q._z)
+
+    def matrix(self) -> Matrix:
+        '''
+        Returns the equivalent rotation matrix (vectors are multiplied on the left, v*matrix, like Rotation).
+        '''
+        if self._rot_matrix is None:
+            w, x, y, z = self._w, self._x, self._y, self._z
+            self._rot_matrix = Matrix([ [1-2*(y*y+z*z),  2*(x*y+w*z),    2*(x*z-w*y)],
+                                        [2*(x*y-w*z),    1-2*(x*x+z*z),  2*(y*z+w*x)],
+                                        [2*(x*z+w*y),    2*(y*z-w*x),    1-2*(x*x+y*y)]])
+        return self._rot_matrix
+
+    def inverse_matrix(self) -> Matrix:
+        return self.matrix().transpose()
+
+    def quaternion(self) -> 'Quaternion':
+        return self
+
+    #Static methods
+    @staticmethod
+    def from_axis_angle(axis, angle: float) -> 'Quaternion':
+        '''
+        Returns the rotation of angle radians around axis (0, 1, 2 = x, y, z, or a 3D Vector), matching
+          Matrix.rotation_matrix.
+        '''
+        if type(axis) is int:
+            axis = [1 if i == axis else 0 for i in range(3)]
+        length = math.sqrt(sum(i*i for i in axis))
+        s = math.sin(angle/2)/length
+        #Matrix.rotation_matrix is applied as v*matrix, which rotates the other way from the usual convention
+        return Quaternion(math.cos(angle/2), -axis[0]*s, -axis[1]*s, -axis[2]*s)
+
+    @staticmethod
+    def from_rotation(r: Rotation) -> 'Quaternion':
+        '''
+        Returns the quaternion equivalent to the Euler angle Rotation r (respecting its rotation order).
+        '''
+        q = Quaternion()
+        for axis in r._order[::-1]:
+            q = q*Quaternion.from_axis_angle(axis, r[axis])
+        return q
+
+    #Dunder methods
+    def __getitem__(self, index):
+        '''
+        Returns w, x, y, z for 0, 1, 2, 3
+        '''
+        return (self._w, self._x, self._y, self._z)[index]
+
+    def __mul__(self, right):
+        '''
+        With another Quaternion, returns the Hamilton product (right rotates first, then self).
+        With a vector, returns the result of rotating the vector.
+        '''
+        if isinstance(right, Quaternion):
+            w1, x1, y1, z1 = self._w, self._x, self._y, self._z
+            w2, x2, y2, z2 = right._w, right._x, right._y, right._z
+            return Quaternion(w1*w2 - x1*x2 - y1*y2 - z1*z2,
+                              w1*x2 + x1*w2 + y1*z2 - z1*y2,
+                              w1*y2 - x1*z2 + y1*w2 + z1*x2,
+                              w1*z2 + x1*y2 - y1*x2 + z1*w2)
+        elif isinstance(right, Vector):
+            return self._rotate(right, 1)
+        else:
+            return NotImplemented
+
+    def __truediv__(self, right):
+        '''
+        Only works with vectors, returns the result of rotating the vector in the inverse way
+        '''
+        if isinstance(right, Vector):
+            return self._rotate(right, -1)
+        return NotImplemented
+
+    def __add__(self, right):
+        '''
+        Composes rotations: the result rotates by self, then by right.
+        '''
+        if isinstance(right, (Rotation, Quaternion)):
+            return right.quaternion()*self
+        elif type(right) in {tuple, list}:
+            return Rotation(*right).quaternion()*self
+        else:
+            return NotImplemented
+
+    def __str__(self):
+        return f'({self._w}, {self._x}, {self._y}, {self._z})'
+
+    def __repr__(self):
+        return f'Quaternion({self._w}, {self._x}, {self._y}, {self._z})'
+
+    #Private methods
+    def _rotate(self, v: Vector, sign: int) -> Vec3:
+        '''
+        Rotates v by the quaternion (sign = 1, which matches v*matrix()) or by its conjugate (sign = -1).
+          v + 2w(u x v) + 2u x (u x v)
+        '''
+        w, ux, uy, uz = self._w, sign*self._x, sign*self._y, sign*self._z
+        vx, vy, vz = v[0], v[1], v[2]
+        tx = 2*(uy*vz - uz*vy)
+        ty = 2*(uz*vx - ux*vz)
+        tz = 2*(ux*vy - uy*vx)
+        return Vec3(vx + w*tx + (uy*tz - uz*ty),
+                    vy + w*ty + (uz*tx - ux*tz),
+                    vz + w*tz + (ux*ty - uy*tx))
+
+
 if __name__ == '__main__':
     r = Rotation(1,2,3)
 
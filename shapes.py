@@ -1,144 +1,648 @@
-from linear_algebra import Vector
+from linear_algebra import Vector, Vec3, Matrix
 from rotation import Rotation
-import math
-
-
-class BaseObject:
+from node import Node, sphere_around
+
+import numpy as np
+
+
+_next_face_id = 0
+
+def reserve_face_ids(count: int) -> int:
+    '''
+    Hands out count new face ids (stable, unique numbers for faces, so a face can be followed from frame to frame).
+    Returns the first one, the rest follow it.
+    '''
+    global _next_face_id
+    first = _next_face_id
+    _next_face_id += count
+    return first
+
+def shade_drawings(camera, faces: [('drawing', 'world normal', 'camera to center')]) \
+                -> [('center distance', 'cam location', 'drawing type', 'drawing arguments (ex. list of vectors)', 'face id')]:
+    '''
+    Finishes drawings from draw_unshaded by shading them all in one pass through the camera's Lighting.
+    '''
+    if not faces: return []
+    colors = shade_colors(camera, faces).tolist()
+    return [(*drawing[:4], colors[i], *drawing[5:]) for i, (drawing, normal, cam_to_center) in enumerate(faces)]
+
+def shade_colors(camera, faces: [('drawing', 'world normal', 'camera to center')]) -> '(M,4) np.ndarray':
+    '''
+    Returns the shaded colors of drawings from draw_unshaded (see shade_drawings).
+    '''
+    with camera.profiler.stage('shade'):
+        colors = np.array([(0,0,0,255) if color == None else (*color[:3], color[3] if len(color) > 3 else 255)
+                                for color in (drawing[4] for drawing, normal, cam_to_center in faces)], dtype=float)
+        normals = np.array([tuple(normal) for drawing, normal, cam_to_center in faces], dtype=float)
+        cam_to_centers = np.array([tuple(cam_to_center) for drawing, normal, cam_to_center in faces], dtype=float)
+        return camera.lighting.shade(normals, cam_to_centers, colors)
+
+def edge_strips(faces: 'np.ndarray') -> ('(E,2) edges', '(M,k) face edges'):
+    '''
+    Returns every edge of an (M,k) array of faces once (faces sharing a pair of vertices share the edge), as an
+      (E,2) array of vertex indices, and which edges each face has (indices into them, in the face's own order).
+    The edges are ordered and turned so they run on from one to the next (one edge's second vertex is the next one's
+      first) in as few strips as a greedy walk finds, so a strip of edges can be drawn in one go.
+    '''
+    faces = np.asarray(faces, dtype=np.intp)
+    if faces.size == 0: return np.zeros((0, 2), dtype=np.intp), np.zeros(faces.shape, dtype=np.intp)
+    pairs = np.stack((faces, np.roll(faces, -1, axis=1)), axis=2).reshape(-1, 2)
+    n = int(faces.max()) + 1
+    keys, face_edges = np.unique(pairs.min(axis=1)*n + pairs.max(axis=1), return_inverse=True)
+    edges = np.stack((keys//n, keys%n), axis=1).tolist()
+
+    #Walk the edges, starting from vertices with an odd number of them (where strips have to end) first
+    touching = {}
+    for e, (a, b) in enumerate(edges):
+        touching.setdefault(a, []).append(e)
+        touching.setdefault(b, []).append(e)
+    used = [False]*len(edges)
+    walked, position = [], [0]*len(edges)
+    starts = [v for v, es in touching.items() if len(es) % 2] + list(touching)
+    for start in starts:
+        v = start
+        while touching[v]:
+            e = touching[v].pop()
+            if used[e]: continue
+            used[e] = True
+            a, b = edges[e]
+            position[e] = len(walked)
+            walked.append((v, b if v == a else a))
+            v = walked[-1][1]
+    return np.array(walked, dtype=np.intp), np.array(position, dtype=np.intp)[face_edges].reshape(faces.shape)
+
+
+class BaseObject(Node):
 
     #Drawing types
     FILL = 0
     OUTLINE = 1
     FILL_OUTLINE = 2
     IMAGE = 3
+    OUTLINE_EDGES = 4 #A Mesh's edges, each drawn once, like OUTLINE/FILL_OUTLINE outlines (see Mesh's batch_edges)
+    FILL_OUTLINE_EDGES = 5
 
     def __init__(self, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0)):
-        self._loc = location
-        self._rot = rotation
-
-    def move(self, movement: Vector):
+        Node.__init__(self, location, rotation)
+        self._face_id = reserve_face_ids(1)
+
+    def draw(self, camera, parent_matrix: Matrix = None) \
+                    -> ['center distance', 'cam location', 'drawing type', 'drawing arguments (ex. list of vectors)', 'face id']:
+        #Drawing arguments are the 2D points, fill color, outline color and each point's depth
+        #Returns None if culled
+        face = self.draw_unshaded(camera, parent_matrix)
+        if face is None: return None
+        return shade_drawings(camera, [face])[0]
+
+    def draw_into(self, camera, buffer, parent_matrix: Matrix = None):
         '''
-        Moves the object's location by just adding it to movement.
+        Adds the face to a DrawBuffer (if it's in front of the screen) instead of returning it.
         '''
-        self._loc += movement
+        drawing = self.draw(camera, parent_matrix)
+        if drawing is not None and drawing[1] == camera.IN_FRONT:
+            buffer.add(drawing[0], *drawing[2:])
 
-    def move_rotation(self, movement: Vector):
+    def draw_unshaded(self, camera, parent_matrix: Matrix = None) -> ('drawing', 'world normal', 'camera to center'):
         '''
-        Moves the object relative to the object's rotation.
+        Returns the drawing with the face's own color (not shaded yet), its normal and the vector from the camera to
+          its center, so a batch of them can be shaded together (see shade_drawings). None if culled.
         '''
-        self._loc += movement*self._rot
-
-    def rotate(self, rotation: Rotation):
-        self._rot += rotation
+        return None
 
-    def draw(self, camera, higher_movement: [Vector] = list(), higher_rotation: [Rotation] = list()) \
-                    -> ['center distance', 'cam location', 'drawing type', 'drawing arguments (ex. list of vectors)']:
-        #newpts = mypoints*rotation + location
-        #newpts = newpts*higher_rotation + higher_movement
-        #cam(newpts)
-        pass
-
-    def _translate_pt(self, v: Vector, higher_movement: [Vector] = list(), higher_rotation: [Rotation] = list()) -> Vector:
-        '''
-        Will translate a point based on this object's location, rotation, and a higher power's location+rotation.
-        '''
-        new_v = (self._rot*v) + self._loc
-        for mov,rot in zip(higher_movement[::-1], higher_rotation[::-1]):
-            new_v = (rot*new_v) + mov
-        return new_v
+    #Private methods
+    def _compute_face_count(self) -> int:
+        return 1
 
 
 
 
 class Triangle(BaseObject):
-    def __init__(self, v1, v2, v3: Vector, color = None, outline = None, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0)):
+    def __init__(self, v1, v2, v3: Vector, color = None, outline = None, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0),
+                        cull_back: bool = False):
         BaseObject.__init__(self, location, rotation)
 
-        self._v1 = v1
-        self._v2 = v2
-        self._v3 = v3
+        self._v1 = Vec3(*v1)
+        self._v2 = Vec3(*v2)
+        self._v3 = Vec3(*v3)
+        #Object space normal and center, only turned/moved to world space when drawing
+        self._normal = (self._v2 - self._v1).cross(self._v3 - self._v2)
+        self._center = (self._v1 + self._v2 + self._v3)/3
 
         self._color = color
         self._outline = outline
         self._draw_type = self.FILL_OUTLINE if (color != None and outline != None) else (self.FILL if (color != None and outline == None) else self.OUTLINE)
+        self._cull_back = cull_back #Don't draw when looking at the back (normal pointing towards the camera)
+
+    def draw_unshaded(self, camera, parent_matrix: Matrix = None):
+        world = self.world_matrix(parent_matrix)
+        bounds = self.world_bounds(parent_matrix)
+        if not camera.sphere_visible(*bounds):
+            camera.culled_faces += 1
+            return None
+        if camera.occluded(*bounds):
+            camera.occluded_faces += 1
+            return None
+
+        p1 = world.transform_point(self._v1)
+        p2 = world.transform_point(self._v2)
+        p3 = world.transform_point(self._v3)
+
+        normal = world.transform_direction(self._normal)
+        cam_to_center = camera.focus_to(world.transform_point(self._center))
+
+        if self._cull_back and normal*cam_to_center <= 0:
+            camera.culled_faces += 1
+            return None
+
+        with camera.profiler.stage('project'):
+            cam_p1, p1_loc,z1 = camera(p1)
+            cam_p2, p2_loc,z2 = camera(p2)
+            cam_p3, p3_loc,z3 = camera(p3)
+
+        return (max(z1,z2,z3), max(p1_loc,p2_loc,p3_loc), self._draw_type, [cam_p1, cam_p2, cam_p3], self._color, self._outline, [z1,z2,z3], self._face_id), normal, cam_to_center
+        # draw = dist, cam_loc, draw_type, *draw_args, face_id
+
+    def world_faces(self, parent_matrix: Matrix = None) -> [('world points', 'color', 'outline', 'drawing type', 'face id', 'cull back')]:
+        '''
+        Returns this face in world space (see Node.world_faces).
+        '''
+        world = self.world_matrix(parent_matrix)
+        points = [tuple(world.transform_point(v)) for v in (self._v1, self._v2, self._v3)]
+        return [(points, self._color, self._outline, self._draw_type, self._face_id, self._cull_back)]
+
+    #Private methods
+    def _compute_bounds(self) -> (Vec3, float):
+        return sphere_around((self._v1, self._v2, self._v3))
 
-    def draw(self, camera, higher_movement: [Vector] = list(), higher_rotation: [Rotation] = list()):
-        p1 = self._translate_pt(self._v1, higher_movement, higher_rotation)
-        p2 = self._translate_pt(self._v2, higher_movement, higher_rotation)
-        p3 = self._translate_pt(self._v3, higher_movement, higher_rotation)
 
-        p1p2 = p2 - p1
-        p3p2 = p3 - p2
-        normal = Vector.cross(p1p2, p3p2)
+class Quadrilateral(BaseObject):
+    def __init__(self, v1, v2, v3, v4: Vector, color = None, outline = None, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0),
+                        cull_back: bool = False):
+        BaseObject.__init__(self, location, rotation)
+
+        self._v1 = Vec3(*v1)
+        self._v2 = Vec3(*v2)
+        self._v3 = Vec3(*v3)
+        self._v4 = Vec3(*v4)
+        #Object space normal and center, only turned/moved to world space when drawing
+        self._normal = (self._v2 - self._v1).cross(self._v3 - self._v2)
+        self._center = (self._v1 + self._v2 + self._v3 + self._v4)/4
+
+        self._color = color
+        self._outline = outline
+        self._draw_type = self.FILL_OUTLINE if (color != None and outline != None) else (self.FILL if (color != None and outline == None) else self.OUTLINE)
+        self._cull_back = cull_back #Don't draw when looking at the back (normal pointing towards the camera)
+
+    def draw_unshaded(self, camera, parent_matrix: Matrix = None):
+        world = self.world_matrix(parent_matrix)
+        bounds = self.world_bounds(parent_matrix)
+        if not camera.sphere_visible(*bounds):
+            camera.culled_faces += 1
+            return None
+        if camera.occluded(*bounds):
+            camera.occluded_faces += 1
+            return None
+
+        p1 = world.transform_point(self._v1)
+        p2 = world.transform_point(self._v2)
+        p3 = world.transform_point(self._v3)
+        p4 = world.transform_point(self._v4)
+
+        normal = world.transform_direction(self._normal)
+        cam_to_center = camera.focus_to(world.transform_point(self._center))
+
+        if self._cull_back and normal*cam_to_center <= 0:
+            camera.culled_faces += 1
+            return None
+
+        with camera.profiler.stage('project'):
+            cam_p1, p1_loc,z1 = camera(p1)
+            cam_p2, p2_loc,z2 = camera(p2)
+            cam_p3, p3_loc,z3 = camera(p3)
+            cam_p4, p4_loc,z4 = camera(p4)
+
+        return (max(z1,z2,z3,z4), max(p1_loc,p2_loc,p3_loc,p4_loc), self._draw_type, [cam_p1, cam_p2, cam_p3, cam_p4], self._color, self._outline, [z1,z2,z3,z4], self._face_id), normal, cam_to_center
+        # draw = dist, cam_loc, draw_type, *draw_args, face_id
+
+    def world_faces(self, parent_matrix: Matrix = None) -> [('world points', 'color', 'outline', 'drawing type', 'face id', 'cull back')]:
+        '''
+        Returns this face in world space (see Node.world_faces).
+        '''
+        world = self.world_matrix(parent_matrix)
+        points = [tuple(world.transform_point(v)) for v in (self._v1, self._v2, self._v3, self._v4)]
+        return [(points, self._color, self._outline, self._draw_type, self._face_id, self._cull_back)]
+
+    #Private methods
+    def _compute_bounds(self) -> (Vec3, float):
+        return sphere_around((self._v1, self._v2, self._v3, self._v4))
+
+
+class Mesh(Node):
+    '''
+    A bunch of faces sharing one vertex buffer. vertices is an (N,3) array of points and faces is an (M,k) array
+      of indices into vertices (every face has k vertices, in the same winding as Triangle/Quadrilateral).
+    Every vertex is transformed and projected once per frame, no matter how many faces use it, and draw returns
+      one drawing per face (like a Model does).
+    With cull_back, faces seen from the back are thrown away before projecting (for closed meshes).
+    Arrays that already have the right type are used as they are rather than copied, so memory mapped ones
+      (see loaders) stay on disk until they are needed.
+    With batch_edges (and an outline), the outline isn't drawn face by face, which draws every edge two faces share
+      twice. Instead draw adds one drawing of type OUTLINE_EDGES/FILL_OUTLINE_EDGES after the (fill only) faces,
+      with every edge of the faces drawn exactly once (see edge_strips), as point pairs in strips that pygame draws in
+      a few calls and the Rasterizer all at once. It goes at the depth of the nearest face, so it's drawn over the
+      mesh's own faces: for filled meshes that suits closed ones with cull_back, otherwise (without the depth buffer)
+      edges behind the mesh's own faces show through. Not with a Renderer's static objects or frozen Models, which
+      outline face by face.
+    '''
+    PATTERN_FACES = 16 #Meshes with at most this many faces chain the edges of every set of faces shown on their own
+
+    def __init__(self, vertices, faces, color = None, outline = None, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0),
+                        cull_back: bool = False, batch_edges: bool = False):
+        Node.__init__(self, location, rotation)
+
+        self._vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        self._faces = np.asarray(faces, dtype=np.intp)
+        assert self._faces.ndim == 2 and self._faces.shape[1] >= 3
+        assert self._faces.size == 0 or (0 <= self._faces.min() and self._faces.max() < len(self._vertices))
 
-        center = (p1+p2+p3)/3
-        cam_to_center = camera.focus_to(center)
+        self._color = color
+        self._outline = outline
+        self._draw_type = BaseObject.FILL_OUTLINE if (color != None and outline != None) else (BaseObject.FILL if (color != None and outline == None) else BaseObject.OUTLINE)
+        self._cull_back = cull_back
+        self._first_face_id = reserve_face_ids(self.face_count()) #Face i has id self._first_face_id + i
+        self._normals = None #Object space face normals and centers, see _face_normals
+        self._centers = None
+        self._batch_edges = batch_edges and self._draw_type != BaseObject.FILL
+        self._edges = None #See _edge_strips
+        self._face_edges = None
+        self._pattern_strips = {} #Bit mask of the faces shown -> their edges in strips, for small meshes
+        self._edges_id = reserve_face_ids(1) if self._batch_edges else None #The edges drawing's face id
+
+    def vertex_count(self) -> int:
+        return len(self._vertices)
+
+    def face_count(self) -> int:
+        return len(self._faces)
+
+    def world_vertices(self, parent_matrix: Matrix = None) -> 'np.ndarray':
+        '''
+        Returns the (N,3) array of vertices in world space, all transformed at once.
+        '''
+        return self.world_matrix(parent_matrix).transform_points(self._vertices)
 
-        angle_diff = normal.angle_diff(cam_to_center)
+    def world_faces(self, parent_matrix: Matrix = None) -> [('world points', 'color', 'outline', 'drawing type', 'face id', 'cull back')]:
+        '''
+        Returns every face in world space (see Node.world_faces).
+        '''
+        points = self.world_vertices(parent_matrix).tolist()
+        return [([tuple(points[v]) for v in face], self._color, self._outline, self._draw_type, self._first_face_id + i, self._cull_back)
+                    for i, face in enumerate(self._faces.tolist())]
+
+    def draw(self, camera, parent_matrix: Matrix = None) \
+                    -> [('center distance', 'cam location', 'drawing type', 'drawing arguments (ex. list of vectors)', 'face id')]:
+        projected = self._project_faces(camera, *self._world_faces(camera, parent_matrix))
+        if projected is None: return []
+        faces, face_ids, screen, locations, depths, colors = projected
+
+        vertex_depths = depths[faces]
+        face_depths = vertex_depths.max(axis=1).tolist()
+        vertex_depths = vertex_depths.tolist()
+        face_locations = locations[faces].max(axis=1).tolist()
+        screen = screen.tolist() #[x, y] lists, which pygame takes as points just like Vectors
+        face_ids = face_ids.tolist()
+        colors = colors.tolist()
+
+        returning = []
+        draw_type = self._face_draw_type()
+        if draw_type != None:
+            for i, face in enumerate(faces.tolist()):
+                returning.append((face_depths[i], face_locations[i], draw_type, [screen[v] for v in face], colors[i], self._outline, vertex_depths[i], face_ids[i]))
+        if self._batch_edges:
+            edges = self._project_edges(camera, *projected[:5])
+            if edges is not None:
+                depth, points, point_depths = edges
+                returning.append((depth, camera.IN_FRONT, self._edges_type(), points.tolist(), None, self._outline, point_depths.tolist(), self._edges_id))
+        return returning
+
+    def draw_into(self, camera, buffer, parent_matrix: Matrix = None):
+        '''
+        Adds the faces in front of the screen to a DrawBuffer, as arrays, instead of returning them.
+        '''
+        projected = self._project_faces(camera, *self._world_faces(camera, parent_matrix))
+        if projected is None: return
+        faces, face_ids, screen, locations, depths, colors = projected
+        vertex_depths = depths[faces]
+        draw_type = self._face_draw_type()
+        if draw_type != None:
+            buffer.add_faces(vertex_depths.max(axis=1), draw_type, screen[faces].reshape(-1, 2), vertex_depths.reshape(-1),
+                             faces.shape[1], colors, self._outline, face_ids, keep = locations[faces].max(axis=1) == camera.IN_FRONT)
+        if self._batch_edges:
+            edges = self._project_edges(camera, *projected[:5])
+            if edges is not None:
+                depth, points, point_depths = edges
+                buffer.add_faces((depth,), self._edges_type(), points, point_depths, len(points), None, self._outline, (self._edges_id,))
+
+    #Private methods
+    def _world_faces(self, camera, parent_matrix: Matrix = None) -> ('points', 'faces', 'face ids', 'normals', 'centers', 'colors'):
+        '''
+        Returns what _project_faces needs: the world space points, the faces, their ids, world space normals and
+          centers, and (M,4) colors (None for the mesh's color). All None if the whole mesh is culled.
+        '''
+        if len(self._faces) == 0: return (None,)*6
+        bounds = self.world_bounds(parent_matrix)
+        if not camera.sphere_visible(*bounds):
+            camera.culled_faces += len(self._faces)
+            return (None,)*6
+        if camera.occluded(*bounds):
+            camera.occluded_faces += len(self._faces)
+            return (None,)*6
+
+        world = self.world_matrix(parent_matrix)
+        normals, centers = self._face_normals()
+        face_ids = np.arange(self._first_face_id, self._first_face_id + len(self._faces))
+        return world.transform_points(self._vertices), self._faces, face_ids, normals@world.array()[:3,:3], world.transform_points(centers), None
+
+    def _face_normals(self) -> ('(M,3) normals', '(M,3) centers'):
+        '''
+        Returns every face's normal and center in object space, worked out once (the vertices never change), so
+          drawing only has to turn and move them.
+        '''
+        if self._normals is None:
+            points = self._vertices[self._faces]
+            self._normals = np.cross(points[:,1] - points[:,0], points[:,2] - points[:,1])
+            self._centers = points.mean(axis=1)
+        return self._normals, self._centers
 
-        cam_p1, p1_loc,z1 = camera(p1)
-        cam_p2, p2_loc,z2 = camera(p2)
-        cam_p3, p3_loc,z3 = camera(p3)
+    def _edge_strips(self) -> ('(E,2) edges', '(M,k) face edges'):
+        '''
+        Returns the mesh's edges (see edge_strips), worked out once (the faces never change).
+        '''
+        if self._edges is None:
+            self._edges, self._face_edges = edge_strips(self._faces)
+        return self._edges, self._face_edges
 
-        new_color = [0,0,0,255]
-        new_outline = self._outline
-        if self._color != None:
-            new_color[0] = self._color[0]*(1-angle_diff/math.pi)
-            new_color[1] = self._color[1]*(1-angle_diff/math.pi)
-            new_color[2] = self._color[2]*(1-angle_diff/math.pi)
-            try:
-                new_color[3] = self._color[3]
-            except Exception as e:
-                new_color[3] = 255
+    def _face_draw_type(self) -> int:
+        '''
+        Returns the drawing type of the faces themselves, None if they aren't drawn (only their edges are).
+        '''
+        if not self._batch_edges: return self._draw_type
+        return BaseObject.FILL if self._draw_type == BaseObject.FILL_OUTLINE else None
 
-        #cam_to_center.mag()
-        return max(z1,z2,z3), max(p1_loc,p2_loc,p3_loc), self._draw_type, [cam_p1, cam_p2, cam_p3], new_color, new_outline
-        # draw = dist, cam_loc, draw_type, *draw_args
+    def _edges_type(self) -> int:
+        return BaseObject.FILL_OUTLINE_EDGES if self._draw_type == BaseObject.FILL_OUTLINE else BaseObject.OUTLINE_EDGES
 
+    def _project_edges(self, camera, faces: 'np.ndarray', face_ids: 'np.ndarray', screen: 'np.ndarray', locations: 'np.ndarray',
+                        depths: 'np.ndarray') -> ('depth', '(2E,2) points', '(2E,) depths'):
+        '''
+        Returns every edge of the faces in front of the screen once (from what _project_faces gives, nothing is
+          projected again): the nearest of those faces' depth, and the edges as (start, end) point pairs with their
+          depths, in strips. None if no face is in front.
+        The faces' points can be several copies of the vertices one after the other (InstancedMesh), so face i of
+          copy c has the ids first face id + c*faces + i and the points c*vertices + its vertices.
+        '''
+        vertex_depths = depths[faces]
+        front = locations[faces].max(axis=1) == camera.IN_FRONT
+        if not front.any(): return None
+        vertex_count, face_count = len(self._vertices), len(self._faces)
+        copies = faces[front, 0]//vertex_count
+        shown_faces = (face_ids[front] - self._first_face_id) % face_count
+
+        if face_count <= self.PATTERN_FACES:
+            #Small meshes (like a cube) only ever show a few sets of faces, each one chained into strips once
+            patterns = np.bincount(copies, weights=np.left_shift(1, shown_faces)).astype(np.int64)
+            pieces = []
+            for pattern in np.unique(patterns[patterns > 0]).tolist():
+                strips = self._pattern_strips.get(pattern)
+                if strips is None:
+                    strips = self._pattern_strips[pattern] = edge_strips(self._faces[[i for i in range(face_count) if pattern >> i & 1]])[0]
+                pieces.append((strips + (np.flatnonzero(patterns == pattern)*vertex_count)[:,None,None]).reshape(-1, 2))
+            ends = np.concatenate(pieces)
+        else:
+            edges, face_edges = self._edge_strips()
+            edge_count = len(edges)
+            shown = np.zeros((int(copies.max()) + 1)*edge_count, dtype=bool)
+            shown[copies[:,None]*edge_count + face_edges[shown_faces]] = True
+            shown = np.flatnonzero(shown)
+            ends = edges[shown % edge_count] + (shown//edge_count*vertex_count)[:,None] #Copy by copy, in strip order
+        return float(vertex_depths[front].max(axis=1).min()), screen[ends].reshape(-1, 2), depths[ends].reshape(-1)
+
+    def _project_faces(self, camera, points: 'np.ndarray', faces: 'np.ndarray', face_ids: 'np.ndarray', normals: 'np.ndarray',
+                        centers: 'np.ndarray', colors: 'np.ndarray' = None) \
+                    -> ('faces', 'face ids', '(N,2) screen points', '(N,) locations', '(N,) depths', '(M,4) shaded colors'):
+        '''
+        Culls, projects and shades faces (indices into the world space points, with world space normals and centers),
+          returns the faces left with their ids, every point projected (only the ones still used really are) and the
+          faces' shaded colors. None if there are no faces left. colors is an (M,4) array with every face's own color,
+          otherwise they all get this mesh's color.
+        '''
+        if faces is None: return None
+        cam_to_center = centers - np.array(tuple(camera.location()), dtype=float)
+
+        if self._cull_back:
+            front = np.einsum('ij,ij->i', normals, cam_to_center) > 0
+            camera.culled_faces += len(faces) - int(front.sum())
+            if not front.all():
+                faces, normals, cam_to_center, face_ids = faces[front], normals[front], cam_to_center[front], face_ids[front]
+                if colors is not None: colors = colors[front]
+                if len(faces) == 0: return None
+
+        #Only project the vertices that are still used
+        with camera.profiler.stage('project'):
+            used = np.unique(faces)
+            if len(used) == len(points):
+                screen, locations, depths = camera.project_many(points)
+            else:
+                screen, locations, depths = np.zeros((len(points), 2)), np.full(len(points), camera.BEHIND, dtype=np.int8), np.zeros(len(points))
+                screen[used], locations[used], depths[used] = camera.project_many(points[used])
+
+        with camera.profiler.stage('shade'):
+            if colors is None:
+                colors = (0,0,0,255) if self._color == None else (*self._color[:3], self._color[3] if len(self._color) > 3 else 255)
+            colors = camera.lighting.shade(normals, cam_to_center, colors)
+
+        return faces, face_ids, screen, locations, depths, colors
+
+    def _compute_bounds(self) -> (Vec3, float):
+        if len(self._vertices) == 0: return Vec3(0,0,0), 0
+        center = (self._vertices.min(axis=0) + self._vertices.max(axis=0))/2
+        return Vec3(*center.tolist()), float(np.linalg.norm(self._vertices - center, axis=1).max())
+
+    def _compute_face_count(self) -> int:
+        return len(self._faces)
+
+
+class InstancedMesh(Mesh):
+    '''
+    Many copies (instances) of one Mesh, each with its own location, rotation and color, but sharing the vertex and
+      face arrays. Instead of one object graph per copy it only keeps (K,3) arrays of locations and rotations (x, y, z
+      angles, rotated around in rotation_order like a Rotation) and optionally a (K,3) or (K,4) array of colors
+      (otherwise every instance has color).
+    Drawing culls whole instances off screen, then transforms every vertex of every instance left at once, and
+      projects and shades them all together like one big Mesh. Instance i's face j has id first face id + i*faces + j.
+    Move them with move_instances/rotate_instances/set_instances (not by changing the arrays), so the bounds follow.
+      Those aren't edits (see Node.edits), since a ScenePool keeps the instances in sync on its own.
+    '''
+    def __init__(self, vertices, faces, locations, rotations = None, colors = None, color = None, outline = None,
+                        location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0), cull_back: bool = False,
+                        rotation_order: (int) = (2,0,1), batch_edges: bool = False):
+        self._locations = np.array(locations, dtype=float).reshape(-1, 3)
+        self._rotations = np.zeros((len(self._locations), 3)) if rotations is None else np.array(rotations, dtype=float).reshape(-1, 3)
+        assert len(self._rotations) == len(self._locations)
+        self._colors = None
+        if colors is not None:
+            colors = np.array(colors, dtype=float).reshape(len(self._locations), -1)
+            assert colors.shape[1] in (3, 4)
+            self._colors = colors if colors.shape[1] == 4 else np.concatenate((colors, np.full((len(colors), 1), 255.0)), axis=1)
+        self._order = rotation_order
+        self._matrices = None #(K,3,3) rotation matrices, made when needed
+
+        Mesh.__init__(self, vertices, faces, color, outline, location, rotation, cull_back, batch_edges)
+        self._mesh_bounds = Mesh._compute_bounds(self)
+        if self._colors is not None:
+            self._draw_type = BaseObject.FILL_OUTLINE if outline != None else BaseObject.FILL
+            self._batch_edges = self._batch_edges and outline != None
+
+    def instance_count(self) -> int:
+        return len(self._locations)
+
+    def face_count(self) -> int:
+        return len(self._locations)*len(self._faces)
+
+    def locations(self) -> 'np.ndarray':
+        return self._locations.copy()
+
+    def rotations(self) -> 'np.ndarray':
+        return self._rotations.copy()
+
+    def colors(self) -> 'np.ndarray':
+        '''
+        Returns the (K,4) instance colors, None if they all use the mesh's color.
+        '''
+        return None if self._colors is None else self._colors.copy()
 
-class Quadrilateral(BaseObject):
-    def __init__(self, v1, v2, v3, v4: Vector, color = None, outline = None, location: Vector = Vector(0,0,0), rotation: Rotation = Rotation(0,0,0)):
-        BaseObject.__init__(self, location, rotation)
+    def move_instances(self, movement, indices = slice(None)):
+        '''
+        Adds movement (one (x, y, z) for all, or one per instance) to the locations of the instances at indices
+          (default all of them).
+        '''
+        self._locations[indices] += np.asarray(movement, dtype=float)
+        self._contents_changed(edited=False)
 
-        self._v1 = v1
-        self._v2 = v2
-        self._v3 = v3
-        self._v4 = v4
+    def rotate_instances(self, rotation, indices = slice(None)):
+        '''
+        Adds rotation (x, y, z angles, one for all or one per instance) to the rotations of the instances at indices.
+        '''
+        self._rotations[indices] += np.asarray(rotation, dtype=float)
+        self._matrices = None
+        self._contents_changed(edited=False)
 
-        self._color = color
-        self._outline = outline
-        self._draw_type = self.FILL_OUTLINE if (color != None and outline != None) else (self.FILL if (color != None and outline == None) else self.OUTLINE)
+    def set_instances(self, locations = None, rotations = None, colors = None):
+        '''
+        Replaces the locations, rotations and/or colors of every instance (the instance count stays the same).
+        '''
+        if locations is not None:
+            self._locations[:] = np.asarray(locations, dtype=float).reshape(-1, 3)
+        if rotations is not None:
+            self._rotations[:] = np.asarray(rotations, dtype=float).reshape(-1, 3)
+            self._matrices = None
+        if colors is not None:
+            assert self._colors is not None, 'The instances all use the mesh color'
+            colors = np.asarray(colors, dtype=float).reshape(len(self._colors), -1)
+            self._colors[:, :colors.shape[1]] = colors
+        self._contents_changed(edited=False)
+
+    def world_vertices(self, parent_matrix: Matrix = None, instances = slice(None)) -> 'np.ndarray':
+        '''
+        Returns the (K,N,3) array of every instance's vertices in world space (or just the ones at instances).
+        '''
+        rotations, offsets = self._instance_transforms(parent_matrix, instances)
+        return self._vertices@rotations + offsets[:,None,:]
 
-    def draw(self, camera, higher_movement: [Vector] = list(), higher_rotation: [Rotation] = list()):
-        p1 = self._translate_pt(self._v1, higher_movement, higher_rotation)
-        p2 = self._translate_pt(self._v2, higher_movement, higher_rotation)
-        p3 = self._translate_pt(self._v3, higher_movement, higher_rotation)
-        p4 = self._translate_pt(self._v4, higher_movement, higher_rotation)
-
-        p1p2 = p2 - p1
-        p3p2 = p3 - p2
-        normal = Vector.cross(p1p2, p3p2)
-
-        center = (p1+p2+p3+p4)/4
-        cam_to_center = camera.focus_to(center)
-
-        angle_diff = normal.angle_diff(cam_to_center)
-
-        cam_p1, p1_loc,z1 = camera(p1)
-        cam_p2, p2_loc,z2 = camera(p2)
-        cam_p3, p3_loc,z3 = camera(p3)
-        cam_p4, p4_loc,z4 = camera(p4)
-
-        new_color = [0,0,0,255]
-        new_outline = self._outline
-        if self._color != None:
-            new_color[0] = min(255, max(0, self._color[0]*(1-angle_diff/math.pi)))
-            new_color[1] = min(255, max(0, self._color[1]*(1-angle_diff/math.pi)))
-            new_color[2] = min(255, max(0, self._color[2]*(1-angle_diff/math.pi)))
-            try:
-                new_color[3] = self._color[3]
-            except Exception as e:
-                new_color[3] = 255
-
-        #cam_to_center.mag()
-        return max(z1,z2,z3,z4), max(p1_loc,p2_loc,p3_loc,p4_loc), self._draw_type, [cam_p1, cam_p2, cam_p3, cam_p4], new_color, new_outline
-        # draw = dist, cam_loc, draw_type, *draw_args
\ No newline at end of file
+    def world_faces(self, parent_matrix: Matrix = None) -> [('world points', 'color', 'outline', 'drawing type', 'face id', 'cull back')]:
+        '''
+        Returns every face of every instance in world space (see Node.world_faces).
+        '''
+        points = self.world_vertices(parent_matrix).tolist()
+        faces = self._faces.tolist()
+        colors = [self._color]*len(points) if self._colors is None else [tuple(c) for c in self._colors.tolist()]
+        first = self._first_face_id
+        return [([tuple(instance[v]) for v in face], colors[i], self._outline, self._draw_type, first + i*len(faces) + j, self._cull_back)
+                    for i, instance in enumerate(points) for j, face in enumerate(faces)]
+
+    #Private methods
+    def _world_faces(self, camera, parent_matrix: Matrix = None) -> ('points', 'faces', 'face ids', 'normals', 'centers', 'colors'):
+        '''
+        Every visible instance's faces as one big Mesh's (see Mesh._world_faces).
+        '''
+        count, face_count = len(self._locations), len(self._faces)
+        if count == 0 or face_count == 0: return (None,)*6
+        bounds = self.world_bounds(parent_matrix)
+        if not camera.sphere_visible(*bounds):
+            camera.culled_faces += count*face_count
+            return (None,)*6
+        if camera.occluded(*bounds):
+            camera.occluded_faces += count*face_count
+            return (None,)*6
+
+        #Whole instances off screen are dropped before anything else
+        center, radius = self._mesh_bounds
+        rotations, offsets = self._instance_transforms(parent_matrix)
+        centers = np.array(tuple(center), dtype=float)@rotations + offsets
+        visible = camera.spheres_visible(centers, np.full(count, radius))
+        occluded = visible & camera.spheres_occluded(centers, np.full(count, radius))
+        camera.culled_faces += (count - int(visible.sum()))*face_count
+        camera.occluded_faces += int(occluded.sum())*face_count
+        visible = np.flatnonzero(visible & ~occluded)
+        if len(visible) == 0: return (None,)*6
+        if len(visible) < count: rotations, offsets = rotations[visible], offsets[visible]
+
+        points = (self._vertices@rotations + offsets[:,None,:]).reshape(-1, 3)
+        faces = (self._faces + (np.arange(len(visible))*len(self._vertices))[:,None,None]).reshape(-1, self._faces.shape[1])
+        face_ids = (self._first_face_id + visible[:,None]*face_count + np.arange(face_count)).ravel()
+        normals, centers = self._face_normals()
+        normals = (normals@rotations).reshape(-1, 3)
+        centers = (centers@rotations + offsets[:,None,:]).reshape(-1, 3)
+        colors = None if self._colors is None else np.repeat(self._colors[visible], face_count, axis=0)
+        return points, faces, face_ids, normals, centers, colors
+
+    def _instance_transforms(self, parent_matrix: Matrix = None, instances = slice(None)) -> ('(K,3,3) rotations', '(K,3) offsets'):
+        '''
+        Returns every instance's rotation matrix and location combined with this node's world matrix, so instance
+          vertices go to world space with vertices@rotations + offsets.
+        '''
+        if self._matrices is None: self._matrices = rotation_matrices(self._rotations, self._order)
+        world = self.world_matrix(parent_matrix).array()
+        return self._matrices[instances]@world[:3,:3], self._locations[instances]@world[:3,:3] + world[3,:3]
+
+    def _compute_bounds(self) -> (Vec3, float):
+        if len(self._locations) == 0: return Vec3(0,0,0), 0
+        center, radius = self._mesh_bounds
+        if self._matrices is None: self._matrices = rotation_matrices(self._rotations, self._order)
+        centers = np.array(tuple(center), dtype=float)@self._matrices + self._locations
+        middle = (centers.min(axis=0) + centers.max(axis=0))/2
+        return Vec3(*middle.tolist()), float(np.linalg.norm(centers - middle, axis=1).max()) + radius
+
+    def _compute_face_count(self) -> int:
+        return self.face_count()
+
+
+def rotation_matrices(angles, rotation_order: (int) = (2,0,1)) -> '(K,3,3) np.ndarray':
+    '''
+    Returns the rotation matrix of every row of a (K,3) array of x, y, z angles, built the same way Rotation builds
+      its matrix (vectors are multiplied on the left, v@matrix).
+    '''
+    angles = np.asarray(angles, dtype=float).reshape(-1, 3)
+    returning = None
+    for axis in rotation_order:
+        cos, sin = np.cos(angles[:,axis]), np.sin(angles[:,axis])
+        m = np.zeros((len(angles), 3, 3))
+        m[:, axis, axis] = 1
+        a, b = [i for i in range(3) if i != axis]
+        #Same layout as Matrix.rotation_matrix: [[cos, -sin], [sin, cos]] on the other two axes, flipped for y
+        sign = -1 if axis == 1 else 1
+        m[:, a, a] = cos
+        m[:, a, b] = -sin*sign
+        m[:, b, a] = sin*sign
+        m[:, b, b] = cos
+        returning = m if returning is None else returning@m
+    return returning